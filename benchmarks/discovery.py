@@ -0,0 +1,61 @@
+"""Finding the newest downloaded bib file in a crowded folder: one glob and getatime per extension against a
+single scandir pass.
+
+python benchmarks/discovery.py [-n 50000] [-r 5]"""
+import os
+import time
+from argparse import ArgumentParser
+from glob import glob
+from os import path
+from tempfile import TemporaryDirectory
+
+from bibdb.entry.file_object import scan_folder
+
+EXTENSIONS = ['.bib', '.txt']
+NOISE = ['.pdf', '.zip', '.jpg', '.docx', '.tar.gz', '.html']
+
+
+def glob_find(folder: str):
+    """the discovery bibdb used before scan_folder"""
+    for ext in EXTENSIONS:
+        file_list = glob(path.join(folder, '*' + ext))
+        if len(file_list) == 0:
+            continue
+        return path.splitext(path.split(max(file_list, key=path.getatime))[1])[0], ext
+
+
+def populate(folder: str, size: int, extensions) -> None:
+    for idx in range(size):
+        ext = extensions[idx % len(extensions)] if idx % 10 == 0 else NOISE[idx % len(NOISE)]
+        file_path = path.join(folder, 'download_{0}{1}'.format(idx, ext))
+        open(file_path, 'w').close()
+        os.utime(file_path, (1000000 + idx, 1000000 + idx))
+
+
+def best_of(repeat: int, func, *args) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = ArgumentParser('discovery')
+    parser.add_argument('-n', '--size', type=int, default=50000)
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    args = parser.parse_args()
+    for label, extensions in (('.bib and .txt', EXTENSIONS), ('only .txt', EXTENSIONS[1:])):
+        with TemporaryDirectory() as folder:
+            populate(folder, args.size, extensions)
+            assert glob_find(folder) == scan_folder(folder, EXTENSIONS, 1)[0]
+            print('{0} files, {1} downloads'.format(args.size, label))
+            print('  glob + getatime:    {0:8.1f} ms'.format(best_of(args.repeat, glob_find, folder)))
+            print('  scandir, newest:    {0:8.1f} ms'.format(best_of(args.repeat, scan_folder, folder, EXTENSIONS, 1)))
+            print('  scandir, 20 newest: {0:8.1f} ms'.format(
+                best_of(args.repeat, scan_folder, folder, EXTENSIONS, 20)))
+
+
+if __name__ == '__main__':
+    main()
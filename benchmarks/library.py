@@ -0,0 +1,200 @@
+"""Deterministic synthetic libraries for the benchmarks: the same size and seed give the same library on every run.
+
+PYTHONPATH=. python benchmarks/library.py folder [-n 10000] [--seed 0]
+
+run from the repository root, as the suite; PYTHONPATH is not needed once bibdb is installed.
+
+writes library.bib, library.sqlite, journal.sqlite, pdf stubs in pdf/ and markdown manuscripts, with the pandoc ast
+of each, in manuscripts/. A few authors write many papers and a few keywords tag many, as in a real library."""
+import json
+import os
+import random
+from argparse import ArgumentParser
+from io import BytesIO, StringIO
+from os import path
+from typing import List, NamedTuple, Optional, TextIO, Tuple
+
+from sqlalchemy import insert
+
+from bibdb.entry.file_object import file_table
+from bibdb.entry.main import ItemBase, Journal, Keyword, Person, authorship, item_table, keyword_assoc
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'ze', 'pa', 'dor', 'len', 'mar', 'tin', 'gus', 'bel']
+FIELDS = ['neural', 'cortical', 'synaptic', 'visual', 'motor', 'sparse', 'dynamic', 'stochastic', 'network',
+          'memory', 'learning', 'coding', 'imaging', 'model', 'circuit', 'signal', 'population', 'plasticity']
+PDF_STUB = b'%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n% {0}\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+
+
+class Entry(NamedTuple):
+    id: str
+    title: str
+    year: int
+    journal: int
+    volume: int
+    pages: str
+    doi: str
+    authors: List[int]
+    keywords: List[int]
+
+
+class Library(NamedTuple):
+    entries: List[Entry]
+    persons: List[Tuple[str, str]]
+    journals: List[Tuple[str, str, str]]  # name, abbreviation, abbreviation without dots
+    keywords: List[str]
+
+
+def _word(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(SYLLABLES) for _ in range(length))
+
+
+def _skewed(rng: random.Random, size: int, power: float = 3.0) -> int:
+    """an index below size, small ones far more often"""
+    return min(int(size * rng.random() ** power), size - 1)
+
+
+def make_library(size: int, seed: int = 0) -> Library:
+    rng = random.Random(seed)
+    persons = list(dict.fromkeys((_word(rng, rng.randint(2, 3)), _word(rng, 2)) for _ in range(size // 3 + 50)))
+    journal_words = sorted({_word(rng, 3) for _ in range(max(size // 50, 20))})
+    journals = [('Journal of {0} {1}'.format(x.title(), FIELDS[idx % len(FIELDS)].title()),
+                 'J. {0}. {1}.'.format(x[0: 4].title(), FIELDS[idx % len(FIELDS)][0: 4].title()),
+                 'J {0} {1}'.format(x[0: 4].title(), FIELDS[idx % len(FIELDS)][0: 4].title()))
+                for idx, x in enumerate(journal_words)]
+    keywords = sorted({_word(rng, 2) + ' ' + rng.choice(FIELDS) for _ in range(max(size // 100, 30))})
+    vocabulary = [_word(rng, rng.randint(1, 3)) for _ in range(3000)] + FIELDS * 20
+    entries, titles, keys = list(), set(), dict()
+    for _ in range(size):
+        title = ' '.join(rng.choice(vocabulary) for _ in range(rng.randint(5, 12))).capitalize()
+        while title in titles:
+            title += ' ' + rng.choice(vocabulary)
+        titles.add(title)
+        authors = list(dict.fromkeys(_skewed(rng, len(persons), 1.5) for _ in range(rng.randint(1, 6))))
+        year = rng.randint(1960, 2025)
+        base = persons[authors[0]][0] + str(year)
+        count = keys.get(base, 0)
+        keys[base] = count + 1
+        first_page = rng.randint(1, 2000)
+        entries.append(Entry(base + ('' if count == 0 else _suffix(count)), title, year,
+                             _skewed(rng, len(journals)), rng.randint(1, 200),
+                             '{0}-{1}'.format(first_page, first_page + rng.randint(2, 30)),
+                             '10.{0}/{1}'.format(rng.randint(1000, 9999), len(entries)),
+                             authors, sorted({_skewed(rng, len(keywords)) for _ in range(rng.randint(0, 4))})))
+    return Library(entries, persons, journals, keywords)
+
+
+def _suffix(count: int) -> str:
+    """b, c, ..., z, ba, bb, ... for the second, third ... paper of an author in a year"""
+    letters = ''
+    while count > 0:
+        count, rest = divmod(count, 26)
+        letters = chr(ord('a') + rest) + letters
+    return letters
+
+
+def write_bib(library: Library, fp: TextIO, entries: Optional[List[Entry]] = None) -> None:
+    for entry in library.entries if entries is None else entries:
+        names = ' and '.join('{0}, {1}'.format(*library.persons[x]).title() for x in entry.authors)
+        fp.write('@article{{{0},\n  title = {{{1}}},\n  author = {{{2}}},\n  journal = {{{3}}},\n  year = {{{4}}},\n'
+                 '  volume = {{{5}}},\n  pages = {{{6}}},\n  doi = {{{7}}}\n}}\n\n'.format(
+                     entry.id, entry.title, names, library.journals[entry.journal][0], entry.year, entry.volume,
+                     entry.pages, entry.doi))
+
+
+def bib_text(library: Library, entry: Entry) -> str:
+    buf = StringIO()
+    write_bib(library, buf, [entry])
+    return buf.getvalue()
+
+
+def journal_list(library: Library) -> BytesIO:
+    """the journals in the tab separated format of bibdb.data.journal.add_journals"""
+    return BytesIO(''.join('\t'.join(x) + '\n' for x in library.journals).encode('utf-8'))
+
+
+def populate(engine, library: Library, size: Optional[int] = None, pdf_number: int = 0) -> None:
+    """store the first size entries, and a pdf for the first pdf_number of them, in bulk statements"""
+    entries = library.entries[0: size]
+    ItemBase.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Journal.__table__), [{'id': idx, 'name': x[0], 'abbr': x[1], 'abbr_no_dot': x[2]}
+                                                 for idx, x in enumerate(library.journals)])
+        conn.execute(insert(Person.__table__), [{'id': idx, 'last_name': x[0], 'first_name': x[1]}
+                                                for idx, x in enumerate(library.persons)])
+        conn.execute(insert(Keyword.__table__), [{'id': idx, 'text': x} for idx, x in enumerate(library.keywords)])
+        conn.execute(insert(item_table), [{'id': x.id, 'title': x.title, 'year': x.year, 'journal_id': x.journal,
+                                           'volume': x.volume, 'pages': x.pages, 'doi': x.doi,
+                                           'object_type': 'article'} for x in entries])
+        conn.execute(insert(authorship), [{'item_id': x.id, 'person_id': person, 'order': order}
+                                          for x in entries for order, person in enumerate(x.authors)])
+        rows = [{'item_id': x.id, 'keyword_id': keyword} for x in entries for keyword in x.keywords]
+        if rows:
+            conn.execute(insert(keyword_assoc), rows)
+        if pdf_number > 0:
+            conn.execute(insert(file_table), [{'item_id': x.id, 'name': x.id, 'object_type': 'pdf'}
+                                              for x in entries[0: pdf_number]])
+
+
+def write_pdf_stubs(folder: str, entries: List[Entry]) -> None:
+    os.makedirs(folder, exist_ok=True)
+    for entry in entries:
+        with open(path.join(folder, entry.id + '.pdf'), 'wb') as fp:
+            fp.write(PDF_STUB.replace(b'{0}', entry.id.encode('utf-8')))
+
+
+def _cite_ast(keys: List[str]) -> dict:
+    citations = [{'citationId': x, 'citationPrefix': [], 'citationSuffix': [], 'citationMode': {'t': 'NormalCitation'},
+                  'citationNoteNum': 0, 'citationHash': 0} for x in keys]
+    return {'t': 'Cite', 'c': [citations, [{'t': 'Str', 'c': '[' + '; '.join('@' + x for x in keys) + ']'}]]}
+
+
+def write_manuscripts(folder: str, library: Library, number: int, citations: int, seed: int = 0,
+                      size: Optional[int] = None) -> List[str]:
+    """markdown manuscripts citing papers among the first size entries, each with its pandoc ast in json, so they
+    can be read without pandoc. Returns the paths of the asts."""
+    rng = random.Random(seed)
+    entries = library.entries[0: size]
+    os.makedirs(folder, exist_ok=True)
+    ast_paths = list()
+    for idx in range(number):
+        markdown, blocks = list(), list()
+        for _ in range(max(citations // 3, 1)):
+            keys = [entries[rng.randrange(len(entries))].id for _ in range(rng.randint(1, 5))]
+            words = ' '.join(rng.choice(FIELDS) for _ in range(20))
+            markdown.append('{0} [{1}].\n'.format(words.capitalize(), '; '.join('@' + x for x in keys)))
+            blocks.append({'t': 'Para', 'c': [{'t': 'Str', 'c': words.capitalize()}, {'t': 'Space'},
+                                              _cite_ast(keys), {'t': 'Str', 'c': '.'}]})
+        name = path.join(folder, 'manuscript{0}'.format(idx))
+        with open(name + '.md', 'w', encoding='utf-8') as fp:
+            fp.write('\n'.join(markdown))
+        with open(name + '.json', 'w', encoding='utf-8') as fp:
+            json.dump({'pandoc-api-version': [1, 23], 'meta': {}, 'blocks': blocks}, fp)
+        ast_paths.append(name + '.json')
+    return ast_paths
+
+
+def main():
+    parser = ArgumentParser('library')
+    parser.add_argument('folder')
+    parser.add_argument('-n', '--size', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    from bibdb.data.journal import add_journals
+    from bibdb.database import Database, use_database
+    os.makedirs(args.folder, exist_ok=True)
+    library = make_library(args.size, args.seed)
+    with open(path.join(args.folder, 'library.bib'), 'w', encoding='utf-8') as fp:
+        write_bib(library, fp)
+    database = Database(path.join(args.folder, 'library.sqlite'), path.join(args.folder, 'journal.sqlite'))
+    with use_database(database):
+        add_journals(journal_list(library))
+        populate(database.engine, library, pdf_number=min(args.size, 1000))
+    database.dispose()
+    write_pdf_stubs(path.join(args.folder, 'pdf'), library.entries[0: 1000])
+    write_manuscripts(path.join(args.folder, 'manuscripts'), library, 10, 100, args.seed)
+    print('{0} entries, {1} persons, {2} journals, {3} keywords written to {4}'.format(
+        len(library.entries), len(library.persons), len(library.journals), len(library.keywords), args.folder))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Compare exporting the whole library through orm objects and through bibdb.entry.record.
+
+python benchmarks/record_export.py [-n 100000] [-f str|bib]
+
+reports rows per second and the tracemalloc peak for loading and formatting every item."""
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from io import StringIO
+from os import path
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from bibdb.entry.main import ItemBase, Item, item_table, authorship, Person, Journal
+from bibdb.entry.record import query_items
+from bibdb.formatter.entry import SimpleFormatter, BibtexFormatter
+
+
+def populate(engine, size: int) -> None:
+    ItemBase.metadata.create_all(engine)
+    person_number = max(size // 4, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(Journal.__table__), [{'id': idx, 'name': 'journal {0}'.format(idx)}
+                                                 for idx in range(100)])
+        conn.execute(insert(Person.__table__), [{'id': idx, 'last_name': 'last{0}'.format(idx), 'first_name': 'f'}
+                                                for idx in range(person_number)])
+        conn.execute(insert(item_table), [{'id': 'item{0}'.format(idx), 'title': 'title of paper {0}'.format(idx),
+                                           'year': 1950 + idx % 70, 'journal_id': idx % 100, 'volume': idx % 50,
+                                           'pages': '1-10', 'object_type': 'article'} for idx in range(size)])
+        conn.execute(insert(authorship), [{'item_id': 'item{0}'.format(idx), 'person_id': (idx + order) % person_number,
+                                           'order': order} for idx in range(size) for order in range(3)])
+
+
+def measure(name: str, export) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = export()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print('{0:>6}: {1:>8} rows, {2:10.0f} rows/s, peak {3:8.1f} MiB'.format(
+        name, count, count / elapsed, peak / 2 ** 20))
+
+
+def main():
+    parser = ArgumentParser('record_export')
+    parser.add_argument('-n', '--size', type=int, default=100000)
+    parser.add_argument('-f', '--format', choices=('str', 'bib'), default='str')
+    args = parser.parse_args()
+    formatter_class = BibtexFormatter if args.format == 'bib' else SimpleFormatter
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine('sqlite:///{0}'.format(path.join(folder, 'library.sqlite')))
+        populate(engine, args.size)
+
+        def export_orm() -> int:
+            session = sessionmaker(engine)()
+            formatter = formatter_class(StringIO())
+            items = session.query(Item).all()
+            for item in items:
+                formatter(item)
+            session.close()
+            return len(items)
+
+        def export_record() -> int:
+            formatter = formatter_class(StringIO())
+            with engine.connect() as conn:
+                items = query_items(conn)
+            for item in items:
+                formatter(item)
+            return len(items)
+
+        measure('orm', export_orm)
+        measure('record', export_record)
+
+
+if __name__ == '__main__':
+    main()
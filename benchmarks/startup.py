@@ -0,0 +1,72 @@
+"""Startup cost of the bibdb command line, measured with python -X importtime.
+
+python benchmarks/startup.py [-r 5] [--scale 1.0]
+
+Each scenario runs in a fresh interpreter. The import time it adds on top of a bare interpreter is compared with
+a budget, and some modules must not be imported at all. Exits with 1 when any scenario regresses."""
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from os import path
+from typing import Dict, List, Set, Tuple
+
+REPO = path.dirname(path.dirname(path.abspath(__file__)))
+HEAVY = {'sqlalchemy', 'bibtexparser', 'colorama', 'pkg_resources'}
+
+# name: (code, budget in ms, modules that must not be imported)
+SCENARIOS: Dict[str, Tuple[str, float, Set[str]]] = {
+    'help': ("import sys\nsys.argv = ['bibdb', '--help']\nfrom bibdb.main import parse_args\n"
+             "try:\n    parse_args()\nexcept SystemExit:\n    pass", 100.0, HEAVY),
+    'open': ("import bibdb.actions.main", 600.0, HEAVY - {'sqlalchemy'}),
+}
+
+
+def import_times(code: str) -> Tuple[List[Tuple[int, int, str]], float]:
+    """(cumulative us, indentation level, module) for each import, and the wall time in seconds"""
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+    records = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        records.append((int(cumulative), (len(name) - len(name.lstrip())) // 2, name.strip()))
+    return records, wall
+
+
+def measure(code: str, baseline: Set[str], repeat: int) -> Tuple[float, float, Set[str]]:
+    """best import time (ms) and wall time (ms) over repeats, and the modules imported beyond a bare interpreter"""
+    best_import, best_wall, modules = float('inf'), float('inf'), set()
+    for _ in range(repeat):
+        records, wall = import_times(code)
+        top_level = sum(cumulative for cumulative, level, name in records if level == 0 and name not in baseline)
+        best_import = min(best_import, top_level / 1000)
+        best_wall = min(best_wall, wall * 1000)
+        modules = {name for _, _, name in records} - baseline
+    return best_import, best_wall, modules
+
+
+def main():
+    parser = ArgumentParser('startup')
+    parser.add_argument('-r', '--repeat', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply every budget, for slow machines')
+    args = parser.parse_args()
+    baseline = {name for _, _, name in import_times('pass')[0]}
+    failed = False
+    for name, (code, budget, forbidden) in SCENARIOS.items():
+        import_ms, wall_ms, modules = measure(code, baseline, args.repeat)
+        offending = sorted(x for x in modules if x.split('.')[0] in forbidden)
+        ok = import_ms <= budget * args.scale and not offending
+        failed |= not ok
+        print('{0:>6}: import {1:7.1f} ms (budget {2:.0f} ms), wall {3:7.1f} ms {4}'.format(
+            name, import_ms, budget * args.scale, wall_ms, 'ok' if ok else 'REGRESSED'))
+        if offending:
+            print('        should not import: ' + ', '.join(sorted({x.split('.')[0] for x in offending})))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
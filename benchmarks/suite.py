@@ -0,0 +1,188 @@
+"""How bibdb scales with the size of the library, on synthetic libraries from benchmarks/library.py.
+
+PYTHONPATH=. python benchmarks/suite.py [-n 1000 10000 100000 1000000] [-r 3] [-o results.json] [--compare old.json]
+
+run from the repository root; PYTHONPATH is not needed once bibdb is installed, with pip install -e . for one.
+
+For each size a library is generated in a temporary folder and every operation timed against it: import_bib and
+store_entry, which are timed per entry on a sample because they commit one entry at a time, author and keyword
+search without and with the snapshot, bibdb u in both formats, PandocReader and search_journal. Reads report the
+best of the repeats. Results are written as json with the commit and versions, and --compare exits with 1 when an
+operation got slower than the tolerance allows."""
+import json
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+from contextlib import redirect_stdout
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from typing import Callable, Dict, Optional
+
+import sqlalchemy
+
+from bibdb.actions.main import find_items, output
+from bibdb.actions.store_paper import StorePolicy, import_bib, store_entry
+from bibdb.data.journal import add_journals, search_journal
+from bibdb.database import Database, use_database
+from bibdb.entry.main import ItemBase, Session, engine
+from bibdb.entry.snapshot import build_snapshot
+from bibdb.reader.pandoc import PandocReader
+from library import Library, bib_text, journal_list, make_library, populate, write_bib, write_manuscripts
+
+REPO = path.dirname(path.dirname(path.abspath(__file__)))
+POLICY = StorePolicy(conflict='skip', author='new', journal='create')
+
+
+def best_of(repeat: int, func: Callable[[], int]) -> Dict[str, float]:
+    """best time of func over repeats, and the count it returns, like rows or files handled"""
+    best, count = float('inf'), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with redirect_stdout(StringIO()):
+            count = func()
+        best = min(best, time.perf_counter() - start)
+    return {'seconds': best, 'count': count}
+
+
+def run_size(size: int, repeat: int, sample: int, seed: int) -> Dict[str, Dict[str, float]]:
+    results: Dict[str, Dict[str, float]] = dict()
+    start = time.perf_counter()
+    library = make_library(size + sample, seed)
+    results['generate'] = {'seconds': time.perf_counter() - start, 'count': size + sample}
+    with TemporaryDirectory() as folder:
+        database = Database(path.join(folder, 'library.sqlite'), path.join(folder, 'journal.sqlite'), folder)
+        with use_database(database):
+            add_journals(journal_list(library))
+            start = time.perf_counter()
+            populate(database.engine, library, size, min(size, 1000))
+            results['populate'] = {'seconds': time.perf_counter() - start, 'count': size}
+            results.update(_reads(library, size, repeat, folder))
+            # writes last, so that they do not change what the reads see
+            results['store_entry'] = _store(library, library.entries[size:])
+        database.dispose()
+        results['import_bib'] = _import(library, folder, sample)
+    return results
+
+
+def _reads(library: Library, size: int, repeat: int, folder: str) -> Dict[str, Dict[str, float]]:
+    results = dict()
+    counts: Dict[int, int] = dict()
+    for entry in library.entries[0: size]:
+        counts[entry.authors[0]] = counts.get(entry.authors[0], 0) + 1
+    author = library.persons[max(counts, key=counts.get)][0]
+    keyword = library.keywords[0]
+
+    def search(**kwargs) -> Callable[[], int]:
+        def run() -> int:
+            with engine.connect() as conn:
+                return len(find_items(conn, **kwargs))
+        return run
+
+    for suffix in ('', '_snapshot'):
+        if suffix:
+            build_snapshot()
+        results['search_author' + suffix] = best_of(repeat, search(author=author))
+        results['search_keyword' + suffix] = best_of(repeat, search(keywords={keyword}))
+    for output_format in ('str', 'bib'):
+        target = path.join(folder, 'output.' + output_format)
+        args = Namespace(source=['all'], format=output_format, watch=False, output=target)
+        results['output_' + output_format] = best_of(repeat, lambda: output(args) or size)
+    ast_paths = write_manuscripts(path.join(folder, 'manuscripts'), library, 10, 300, size=size)
+    results['pandoc_reader'] = best_of(repeat, lambda: sum(len(PandocReader(x)()) for x in ast_paths))
+    queries = [x[1] for x in library.journals[0: 100]]
+    results['search_journal'] = best_of(repeat, lambda: sum(search_journal(x) is not None for x in queries))
+    return results
+
+
+def _store(library: Library, entries) -> Dict[str, float]:
+    """store_entry and commit, one entry at a time as bibdb pending does"""
+    texts = [bib_text(library, x) for x in entries]
+    start = time.perf_counter()
+    with redirect_stdout(StringIO()):
+        for text in texts:
+            session = Session()
+            store_entry(session, text, None, set(), list(), policy=POLICY, confirm=False)
+            session.commit()
+            session.close()
+    return {'seconds': time.perf_counter() - start, 'count': len(texts)}
+
+
+def _import(library: Library, folder: str, sample: int) -> Dict[str, float]:
+    """bibdb-import of the first sample entries into an empty library"""
+    bib_path = path.join(folder, 'import.bib')
+    with open(bib_path, 'w', encoding='utf-8') as fp:
+        write_bib(library, fp, library.entries[0: sample])
+    database = Database(path.join(folder, 'import.sqlite'), path.join(folder, 'journal.sqlite'), folder)
+    with use_database(database):
+        ItemBase.metadata.create_all(database.engine)
+        argv, sys.argv = sys.argv, ['bibdb-import', bib_path]
+        start = time.perf_counter()
+        try:
+            import_bib()
+        finally:
+            sys.argv = argv
+        elapsed = time.perf_counter() - start
+    database.dispose()
+    return {'seconds': elapsed, 'count': sample}
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: Dict[str, Dict[str, Dict[str, float]]], old_path: str, tolerance: float) -> bool:
+    """print the change of every operation against an earlier run, returns whether any got slower than tolerance"""
+    with open(old_path, 'r', encoding='utf-8') as fp:
+        old = json.load(fp)
+    print('against {0} ({1})'.format(old_path, old.get('commit')))
+    regressed = False
+    for size, operations in results.items():
+        for name, result in operations.items():
+            before = old['results'].get(size, dict()).get(name)
+            if before is None or before['seconds'] <= 0 or name in ('generate', 'populate'):
+                continue
+            ratio = result['seconds'] / before['seconds']
+            slower = ratio > 1 + tolerance
+            regressed |= slower
+            print('{0:>8} {1:<24} {2:6.2f}x {3}'.format(size, name, ratio, 'REGRESSED' if slower else ''))
+    return regressed
+
+
+def main():
+    parser = ArgumentParser('suite')
+    parser.add_argument('-n', '--size', type=int, nargs='+', default=[1000, 10000],
+                        help='library sizes, 100000 and 1000000 take minutes')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-s', '--sample', type=int, default=200, help='entries stored by import_bib and store_entry')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', help='write the results to this json file')
+    parser.add_argument('--compare', help='json file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='slowdown allowed by --compare')
+    args = parser.parse_args()
+    results: Dict[str, Dict[str, Dict[str, float]]] = dict()
+    for size in args.size:
+        results[str(size)] = run_size(size, args.repeat, args.sample, args.seed)
+        for name, result in results[str(size)].items():
+            print('{0:>8} {1:<24} {2:10.1f} ms {3:>9} {4:12.0f} /s'.format(
+                size, name, result['seconds'] * 1000, result['count'],
+                result['count'] / result['seconds'] if result['seconds'] > 0 else 0), flush=True)
+    report = {'commit': _commit(), 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+              'sqlite': sqlite3.sqlite_version, 'sqlalchemy': sqlalchemy.__version__, 'platform': platform.platform(),
+              'seed': args.seed, 'sample': args.sample, 'repeat': args.repeat, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            json.dump(report, fp, indent=2)
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
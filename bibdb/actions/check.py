@@ -0,0 +1,202 @@
+"""Consistency check between the file table and the pdf and comment folders: registered files that are missing or
+empty, files in the folders that nobody registered, and files not named the way bibdb names them. Registered paths
+are stat'ed in a bounded thread pool while the file table streams in, so network storage is queried in parallel."""
+import os
+import time
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from os import path
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from ..config import config
+from ..entry.file_object import file_table
+from ..entry.main import engine, item_table
+from ..entry.record import query_items
+from ..formatter.entry import FileNameFormatter, format_once
+
+FILE_TYPES = ('pdf', 'comment')
+
+
+class FileRow(NamedTuple):
+    id: int
+    item_id: str
+    name: str
+    object_type: str
+
+
+class Problem(NamedTuple):
+    kind: str  # missing, empty, orphaned or misnamed
+    object_type: str
+    name: str
+    file_id: Optional[int] = None
+    expected: Optional[str] = None
+
+
+class Rename(NamedTuple):
+    file_id: int
+    name: str  # the name in the file table before the fix
+    old_path: str
+    new_path: str
+
+
+def type_folder(object_type: str) -> Tuple[str, str]:
+    """folder and extension of a file type, the first extension when there are several"""
+    extension = config['files'][object_type]['extension']
+    return path.expanduser(config['files'][object_type]['folder']), \
+        extension[0] if isinstance(extension, list) else extension
+
+
+def bounded_map(executor: Executor, func: Callable, iterable: Iterable, window: int) -> Iterator:
+    """executor.map that keeps at most window calls in flight, so a long stream never queues all at once"""
+    pending: deque = deque()
+    for value in iterable:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(func, value))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _size(file_path: str) -> Optional[int]:
+    try:
+        return os.stat(file_path).st_size
+    except FileNotFoundError:
+        return None
+
+
+def list_folder(object_type: str) -> Set[str]:
+    """names without extension of the files in a folder, from one scandir pass that needs no stat on most systems"""
+    folder, extension = type_folder(object_type)
+    if not path.isdir(folder):
+        return set()
+    with os.scandir(folder) as it:
+        return {entry.name[0: -len(extension)] for entry in it
+                if entry.name.endswith(extension) and not entry.name.startswith('.') and entry.is_file()}
+
+
+def expected_names(conn, rows: List[FileRow]) -> Dict[int, str]:
+    """the name bibdb would give each file: FileNameFormatter for an item's only pdf, the item id for comments.
+    Items with several pdfs or without authors are left out."""
+    single = select(file_table.c.item_id).where(file_table.c.object_type == 'pdf') \
+        .group_by(file_table.c.item_id).having(func.count() == 1)
+    items = {item.id: item for item in query_items(conn, item_table.c.id.in_(single))}
+    expected: Dict[int, str] = dict()
+    for row in rows:
+        if row.object_type == 'comment':
+            expected[row.id] = row.item_id
+        elif row.item_id in items and items[row.item_id].authorship:
+            expected[row.id] = format_once(FileNameFormatter, items[row.item_id])
+    return expected
+
+
+def check_library(conn, workers: int = 32, window: int = 1024) -> Tuple[List[Problem], int]:
+    """problems found and the number of registered files"""
+    with ThreadPoolExecutor(workers) as executor:
+        listings = dict(zip(FILE_TYPES, executor.map(list_folder, FILE_TYPES)))
+        folders = {object_type: type_folder(object_type) for object_type in FILE_TYPES}
+        rows: List[FileRow] = list()
+
+        def registered() -> Iterator[FileRow]:
+            result = conn.execute(
+                select(file_table.c.id, file_table.c.item_id, file_table.c.name, file_table.c.object_type)
+                .where(file_table.c.object_type.in_(FILE_TYPES)).execution_options(yield_per=window))
+            for row in result:
+                rows.append(FileRow(*row))
+                yield rows[-1]
+
+        def stat(row: FileRow) -> Optional[int]:
+            folder, extension = folders[row.object_type]
+            return _size(path.join(folder, row.name + extension))
+
+        sizes = list(bounded_map(executor, stat, registered(), window))
+    problems: List[Problem] = list()
+    for row, size in zip(rows, sizes):
+        if size is None:
+            problems.append(Problem('missing', row.object_type, row.name, row.id))
+        elif size == 0:
+            problems.append(Problem('empty', row.object_type, row.name, row.id))
+    for object_type in FILE_TYPES:
+        known = {row.name for row in rows if row.object_type == object_type}
+        problems.extend(Problem('orphaned', object_type, name) for name in sorted(listings[object_type] - known))
+    expected = expected_names(conn, rows)
+    for row in rows:
+        name = expected.get(row.id)
+        if name is not None and name != row.name:
+            problems.append(Problem('misnamed', row.object_type, row.name, row.id, name))
+    return problems, len(rows)
+
+
+def fix_library(conn, problems: List[Problem], kinds: Set[str]) -> List[Rename]:
+    """rename misnamed files, relink missing files to an orphan carrying the expected name, and drop the rows of
+    the remaining missing files. Updates the file table on conn and returns the renames to carry out after commit.
+    A name is given to one file only, a second file expecting it keeps its name."""
+    orphans = {(x.object_type, x.name) for x in problems if x.kind == 'orphaned'}
+    missing = {x.file_id for x in problems if x.kind == 'missing'}
+    relinked: Set[int] = set()
+    claimed: Set[Tuple[str, str]] = set()
+    renames: List[Rename] = list()
+    for problem in problems:
+        if problem.kind != 'misnamed' or 'misnamed' not in kinds:
+            continue
+        folder, extension = type_folder(problem.object_type)
+        if (problem.object_type, problem.expected) in claimed:
+            print('not renaming {0}, {1} is given to another file'.format(problem.name, problem.expected))
+            continue
+        if problem.file_id in missing:
+            if (problem.object_type, problem.expected) not in orphans:
+                continue
+            orphans.discard((problem.object_type, problem.expected))
+            relinked.add(problem.file_id)
+        elif path.exists(path.join(folder, problem.expected + extension)):
+            print('not renaming {0}, {1} exists'.format(problem.name, problem.expected))
+            continue
+        else:
+            renames.append(Rename(problem.file_id, problem.name, path.join(folder, problem.name + extension),
+                                  path.join(folder, problem.expected + extension)))
+        claimed.add((problem.object_type, problem.expected))
+        conn.execute(update(file_table).where(file_table.c.id == problem.file_id).values(name=problem.expected))
+    if 'missing' in kinds and missing - relinked:
+        conn.execute(delete(file_table).where(file_table.c.id.in_(missing - relinked)))
+    return renames
+
+
+def rename_files(renames: List[Rename]) -> List[Rename]:
+    """carry out the renames of fix_library after its commit, never overwriting. Returns those that failed."""
+    failed: List[Rename] = list()
+    for rename in renames:
+        try:
+            if path.exists(rename.new_path):
+                raise FileExistsError(rename.new_path)
+            os.rename(rename.old_path, rename.new_path)
+        except OSError as e:
+            print('can not rename {0}: {1}'.format(rename.old_path, e))
+            failed.append(rename)
+    return failed
+
+
+def restore_names(conn, renames: List[Rename]) -> None:
+    """point the rows of renames that failed back at the files, under their old names"""
+    conn.execute(update(file_table).where(file_table.c.id == bindparam('file_id')).values(name=bindparam('old_name')),
+                 [{'file_id': x.file_id, 'old_name': x.name} for x in renames])
+
+
+def check(args):
+    start = time.perf_counter()
+    kinds = set(args.fix) if args.fix else set()
+    with engine.begin() as conn:
+        problems, total = check_library(conn, args.jobs)
+        renames = fix_library(conn, problems, kinds) if kinds else list()
+    failed = rename_files(renames)
+    if failed:
+        with engine.begin() as conn:
+            restore_names(conn, failed)
+    for problem in problems:
+        print('{0}\t{1}\t{2}{3}'.format(problem.kind, problem.object_type, problem.name,
+                                       ' -> ' + problem.expected if problem.expected else ''))
+    counts = {kind: sum(1 for x in problems if x.kind == kind) for kind in ('missing', 'empty', 'orphaned', 'misnamed')}
+    print('{0} registered files checked in {1:.2f} s: {2}'.format(
+        total, time.perf_counter() - start, ', '.join('{1} {0}'.format(*x) for x in counts.items())))
+    if kinds:
+        print('fixed: ' + ', '.join(sorted(kinds)))
@@ -0,0 +1,72 @@
+"""Reports of duplicated content in the library, and merges of duplicated persons."""
+import time
+
+from ..entry.main import engine
+
+
+def dedupe_files(args) -> None:
+    """hash new and changed pdfs, then list every group of registered pdfs sharing the same content"""
+    from ..entry.digest import refresh, duplicate_groups
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        result = refresh(conn, args.jobs)
+        groups = list(duplicate_groups(conn))
+    print('{0} pdfs hashed, {1} unchanged, {2} missing in {3:.2f} s'.format(
+        result.hashed, result.unchanged, len(result.missing), time.perf_counter() - start))
+    for _, name in result.missing:
+        print('\tmissing: ' + name)
+    for digest, group in groups:
+        print('{0} files with sha256 {1}'.format(len(group), digest[0: 16]))
+        for item_id, name in group:
+            print('\t{0}: {1}'.format(item_id, name))
+    if not groups:
+        print('no duplicated pdf')
+
+
+def _name(person) -> str:
+    return '{0}, {1}'.format(person.last_name, person.first_name) if person.first_name else person.last_name
+
+
+def dedupe_people(args) -> None:
+    """list persons that look like variants of one name, and with --merge move their papers to the most complete
+    name. Variants scoring below --min-score are listed but not merged."""
+    from ..entry.people import find_groups, merge_persons
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        groups, ambiguous = find_groups(conn)
+        for group in groups:
+            print('{0} ({1})'.format(_name(group.target), group.target.id))
+            for variant in group.variants:
+                print('\t{0:.1f} {1} ({2})'.format(variant.score, _name(variant), variant.id))
+        for variant in ambiguous:
+            print('ambiguous: {0} ({1})'.format(_name(variant), variant.id))
+        print('{0} groups, {1} variants found in {2:.2f} s'.format(
+            len(groups), sum(len(x.variants) for x in groups), time.perf_counter() - start))
+        if args.merge:
+            pairs = [(variant.id, group.target.id) for group in groups for variant in group.variants
+                     if variant.score >= args.min_score]
+            moved, dropped = merge_persons(conn, pairs)
+            print('{0} author and editor rows moved, {1} persons merged'.format(moved, dropped))
+    if args.merge:
+        from ..completion import rebuild_index
+        rebuild_index()
+
+
+def dedupe_items(args) -> None:
+    """hash new and changed items, then list the groups of items that are likely the same paper"""
+    from ..entry.minhash import similar_groups
+    start = time.perf_counter()
+    with engine.begin() as conn:
+        result, groups = similar_groups(conn, args.threshold)
+    print('{0} items hashed, {1} unchanged in {2:.2f} s'.format(result.hashed, result.unchanged,
+                                                              time.perf_counter() - start))
+    for group in groups:
+        print('{0} similar items'.format(len(group)))
+        for item in group:
+            print('\t{0:.2f} {1}: {2} ({3})'.format(item.similarity, item.item_id, item.title, item.year))
+    if not groups:
+        print('no similar items')
+
+
+def dedupe(args):
+    {'files': dedupe_files, 'people': dedupe_people, 'items': dedupe_items}[args.target](args)
@@ -1,76 +1,206 @@
+import sys
 from io import StringIO
-from sqlalchemy.orm import with_polymorphic
-from sqlalchemy import not_, and_
-from colorama import init
-from .store_paper import update_keywords
-from ..entry.file_object import PdfFile, CommentFile
-from ..entry.main import Session, Item, Person, Keyword, Authorship
+from os import path
+from typing import List, Optional, Set, Tuple
+from sqlalchemy import not_, select
+from ..entry.file_object import PdfFile, CommentFile, file_table
+from ..entry.main import engine, Session, Item, Person, Keyword, item_table, keyword_assoc
+from ..entry.record import BOUND_IDS, id_set, query_items, query_ids, query_authored, has_keyword
 from ..formatter.entry import SimpleFormatter, BibtexFormatter, ColorFormatter, format_once
-from ..reader.pandoc import PandocReader
+from ..profiling import phase
+
+def parse_years(years: str) -> Tuple[Optional[int], Optional[int]]:
+    """'2005', '2000-2010', '2000-' or '-2010' to an inclusive range"""
+    if '-' not in years:
+        return int(years), int(years)
+    start, end = (x.strip() for x in years.split('-', 1))
+    return int(start) if start else None, int(end) if end else None
+
+
+def find_items(conn, author: Optional[str] = None, keywords: Set[str] = frozenset(),
+               years: Tuple[Optional[int], Optional[int]] = (None, None), words: Set[str] = frozenset()) -> List[tuple]:
+    """(item record, author position) of items matching every criterion, from the snapshot while it is fresh.
+    words are title tokens from snapshot.tokenize. A search by years alone is a range scan in sql, where the snapshot
+    would only add its own lookup to loading the records."""
+    from ..entry.snapshot import Snapshot, tokenize
+    snapshot = Snapshot.load() if author or keywords or words else None
+    if snapshot is not None:
+        with snapshot:
+            hits = snapshot.search(author, keywords, years, words)
+        items = {x.id: x for x in query_ids(conn, (item_id for item_id, _ in hits))[0]}
+        return [(items[item_id], order) for item_id, order in hits]
+    criteria = [has_keyword(keyword) for keyword in keywords]
+    criteria.extend(item_table.c.title.like('%{0}%'.format(word)) for word in words)
+    if years[0] is not None:
+        criteria.append(item_table.c.year >= years[0])
+    if years[1] is not None:
+        criteria.append(item_table.c.year <= years[1])
+    if author:
+        entries = query_authored(conn, author, *criteria)
+    else:
+        entries = [(x, None) for x in query_items(conn, *criteria, order_by=(item_table.c.year, item_table.c.id))]
+    return [x for x in entries if words <= tokenize(x[0].title or '')]
 
-init()
 
 def search_paper(args):
-    session = Session()
-    if args.author:
-        entry = with_polymorphic(Item, '*')
-        entries = session.query(entry, Authorship.order).join(Authorship).join(Person)\
-            .filter(Person.last_name==args.author).order_by(Person.first_name, entry.year).all()
-        if len(entries) > 0:
-            output = StringIO()
-            formatter = ColorFormatter(output)
+    from colorama import init, Fore
+    from ..entry.notes import NOTE_LIMIT, search_notes
+    from ..entry.snapshot import tokenize
+    init()
+    keywords = {x.strip() for x in ' '.join(args.keyword).split(',')} if args.keyword else set()
+    years = parse_years(args.year) if args.year else (None, None)
+    words = {token for word in args.title for token in tokenize(word)} if args.title else set()
+    if not (args.author or keywords or args.year or words or args.comment):
+        print('please give an author, keywords, years, title words or comment words to search for')
+        return
+    with engine.connect() as conn:
+        combined = bool(args.author or keywords or args.year or words)
+        # limited only after the intersection with the other criteria, which could drop every one of the first hits
+        notes = search_notes(conn, args.comment, Fore.YELLOW, Fore.RESET, None if combined else NOTE_LIMIT) \
+            if args.comment else None
+        if notes is not None and not combined:
+            entries = [(x, None) for x in query_ids(conn, (x.item_id for x in notes))[0]]
+        else:
+            with phase('resolve'):
+                entries = find_items(conn, args.author, keywords, years, words)
+    snippets = {x.item_id: x.snippet for x in notes} if notes is not None else dict()
+    if notes is not None:
+        entries = [x for x in entries if x[0].id in snippets][0: NOTE_LIMIT]
+    if len(entries) > 0:
+        output = StringIO()
+        formatter = ColorFormatter(output)
+        with phase('format'):
             for x, order in entries:
                 formatter(x, order)
+                if x.id in snippets:
+                    output.write('\t{0}: {1}\n'.format(x.id, snippets[x.id]))
+        with phase('write'):
             print(output.getvalue())
+    elif args.author and not (keywords or args.year or words):
+        print("can't find author named " + args.author)
+    elif keywords and not (args.year or words):
+        print('No item with keyword "{0}" has been found'.format('", "'.join(keywords)))
+    else:
+        print('No item has been found')
+
+
+def index_notes(args):
+    """bring the full-text index of comment files up to date, reading only the changed ones"""
+    import os
+    import time
+    from ..entry.notes import refresh
+    if args.nice and hasattr(os, 'nice'):
+        os.nice(args.nice)
+    start = time.perf_counter()
+    result = refresh(args.jobs, args.batch_size)
+    print('{0} comment files read, {1} unchanged, {2} dropped from the index in {3:.2f} s'.format(
+        *result, time.perf_counter() - start))
+
+
+def sync_library(_):
+    """send the changes made here to the shared changes folder and replay those of the other machines"""
+    from ..entry.changelog import get_changes_folder, sync
+    folder = get_changes_folder()
+    if folder is None:
+        print('set path.changes in the config file to a folder shared between the machines')
+        return
+    with engine.begin() as conn:
+        result, items_changed = sync(conn, folder)
+    if items_changed:
+        from ..completion import rebuild_index
+        rebuild_index()
+    print('{0} changes sent, {1} received, {2} applied'.format(*result))
+
+
+def snapshot(_):
+    from ..entry.snapshot import build_snapshot, get_snapshot_path
+    build_snapshot()
+    print('search snapshot written to ' + get_snapshot_path())
+
+
+def library_stats(args):
+    """papers per year, type, journal and keyword and the most prolific authors, as a table, json or csv"""
+    import csv
+    import json
+    from ..entry.stats import SECTIONS, cached_stats
+    with engine.connect() as conn:
+        stats, _ = cached_stats(conn, args.limit)
+    fp = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    try:
+        if args.format == 'json':
+            json.dump({key: dict(stats[key]) for key in SECTIONS}, fp, ensure_ascii=False, indent=2)
+            fp.write('\n')
+        elif args.format == 'csv':
+            writer = csv.writer(fp)
+            writer.writerow(['section', 'label', 'count'])
+            writer.writerows((key, label, count) for key in SECTIONS for label, count in stats[key])
         else:
-            print("can't find author named " + args.author)
-    elif args.keyword:
-        entry = with_polymorphic(Item, '*')
-        keywords = {x.strip() for x in ' '.join(args.keyword).split(',')}
-        item_list = session.query(entry).filter(
-            and_(*(Item.keyword.any(Keyword.text == keyword)
-                   for keyword in keywords))).all()
-        if len(item_list) > 0:
-            output = StringIO()
-            formatter = ColorFormatter(output)
-            for item in item_list:
-                formatter(item)
-            print(output.getvalue())
-        else:
-            print('No item with keyword "{0}" has been found'.format('", "'.join(keywords)))
+            for key in SECTIONS:
+                fp.write('{0}\n'.format(key))
+                width = max((len(str(count)) for _, count in stats[key]), default=0)
+                fp.writelines('  {0:>{1}}  {2}\n'.format(count, width, label) for label, count in stats[key])
+    finally:
+        if args.output:
+            fp.close()
+
+
+def read_id_list(source: str) -> List[str]:
+    """paper ids from a comma separated string or a file with ids separated by commas or new lines"""
+    if path.isfile(source):
+        source = open(source, 'r').read().replace('\n', ',')
+    id_list = [x.strip() for x in source.split(',')]
+    return list(dict.fromkeys(x for x in id_list if x))
+
+
+def delete_orphan_person(session, person_ids: Set[int]) -> int:
+    """delete persons among person_ids that no longer author or edit any item"""
+    person_ids = sorted(person_ids)
+    deleted = 0
+    for start in range(0, len(person_ids), BOUND_IDS):  # bound in chunks, a long list exceeds sqlite's variables
+        deleted += session.query(Person).filter(Person.id.in_(person_ids[start: start + BOUND_IDS])
+                                                & not_(Person.editorship.any()) & not_(Person.authorship.any())) \
+            .delete(synchronize_session=False)
+    return deleted
 
 
 def delete_paper(args):
     session = Session()
-    item = session.query(Item).filter(Item.id == args.paper_id).one()
-    session.delete(item)
+    paper_ids = read_id_list(args.paper_id)
+    with id_set(session.connection(), paper_ids) as ids:
+        items = session.query(Item).filter(Item.id.in_(ids)).all()
+    missing = set(paper_ids) - {item.id for item in items}
+    if missing:
+        raise ValueError("can't find item with id " + ', '.join(x for x in paper_ids if x in missing))
+    person_ids = {x.person_id for item in items for x in item.authorship + item.editorship}
+    for item in items:
+        session.delete(item)
+    session.flush()
+    delete_orphan_person(session, person_ids)
     session.commit()
-    session.query(Person).filter(and_(not_(Person.editorship.any()), not_(Person.authorship.any()))).\
-        delete(synchronize_session='fetch')
-    print('entry with id {} has been deleted'.format(args.paper_id))
+    print('entry with id {} has been deleted'.format(', '.join(paper_ids)))
 
 
 def open_file(args):
     file_types = {'pdf'} if not (args.files and len(args.files) > 0) else set(
         args.files)
-    session = Session()
-    item = session.query(Item).filter(Item.id == args.paper_id).all()
-    if not item:
-        raise ValueError("can't find item with id " + args.paper_id)
-    item = item[0]
+    with engine.connect() as conn:
+        if conn.execute(select(item_table.c.id).where(item_table.c.id == args.paper_id)).first() is None:
+            raise ValueError("can't find item with id " + args.paper_id)
+        files = conn.execute(select(file_table.c.object_type, file_table.c.name)
+                             .where(file_table.c.item_id == args.paper_id)).all()
     if 'pdf' in file_types:
-        has_file = False
-        for file in item.file:
-            if isinstance(file, PdfFile):
-                file.open()
-                has_file = True
-        if not has_file:
-            print('There is no pdf file for {}'.format(item.id))
+        pdf_files = [PdfFile(name) for object_type, name in files if object_type == 'pdf']
+        for file in pdf_files:
+            file.open()
+        if not pdf_files:
+            print('There is no pdf file for {}'.format(args.paper_id))
     if 'comment' in file_types:
-        for file in item.file:
-            if isinstance(file, CommentFile):
-                file.open()
+        for object_type, name in files:
+            if object_type == 'comment':
+                CommentFile(name).open()
                 return
+        session = Session()
+        item = session.query(Item).filter(Item.id == args.paper_id).one()
         comment = CommentFile.new(item)
         item.file.append(comment)
         session.commit()
@@ -79,19 +209,30 @@ def open_file(args):
 
 def output(args):
     from os.path import splitext
-    session = Session()
-    print("source: ", args.source)
-    if splitext(args.source)[-1] in {'.ast', '.json', '.txt', '.md'}:
-        item_list = session.query(Item).filter(
-            Item.id.in_(PandocReader(args.source)())).all()
-    elif args.source.lower() == 'all':
-        item_list = session.query(Item).all()
-    else:
-        item_list = session.query(Item).filter(
-            Item.id.in_(args.source.split(','))).all()
+    from ..reader.pandoc import PandocReader
+    if args.watch:
+        from .manuscript import watch_bib
+        return watch_bib(args)
+    print("source: ", ' '.join(args.source))
+    with engine.connect() as conn:
+        if args.source[0].lower() == 'all':
+            with phase('resolve'):
+                item_list = query_items(conn)
+        else:
+            ids: List[str] = list()
+            with phase('parse'):
+                for source in args.source:
+                    if splitext(source)[-1] in {'.ast', '.json', '.txt', '.md'}:
+                        ids.extend(PandocReader(source)())
+                    else:
+                        ids.extend(x.strip() for x in source.split(',') if x.strip())
+            with phase('resolve'):
+                item_list, missing = query_ids(conn, ids)
+            if missing:
+                print('{0} ids not found: {1}'.format(len(missing), ', '.join(missing)), file=sys.stderr)
 
     if len(item_list) == 0:
-        print('entry has not been found for id: {}'.format(args.source))
+        print('entry has not been found for id: {}'.format(' '.join(args.source)))
     buf = StringIO()
     if args.format == 'bib':
         formatter = BibtexFormatter(buf)
@@ -99,55 +240,123 @@ def output(args):
         formatter = SimpleFormatter(buf)
     else:
         return
-    for item in item_list:
-        formatter(item)
-    print(buf.getvalue())
+    with phase('format'):
+        for item in item_list:
+            formatter(item)
+    with phase('write'):
+        if args.output:
+            from .manuscript import write_atomic
+            write_atomic(args.output, buf.getvalue())
+        else:
+            print(buf.getvalue())
+
+
+def split_keywords(values: Optional[List[str]]) -> List[str]:
+    """keywords from command line words, separated by commas"""
+    return [x.strip() for x in ' '.join(values).split(',') if x.strip()] if values else list()
+
+
+def print_facets(conn, item_ids: Optional[List[str]], keyword: Optional[str], limit: int):
+    """keyword counts of the whole library, of the keywords appearing together with keyword, or of the given items"""
+    from ..entry.facets import ensure_facets, keyword_counts, co_occurring, result_facets
+    ensure_facets(conn)
+    if keyword is not None:
+        facets = co_occurring(conn, keyword, limit)
+    elif item_ids is None:
+        facets = keyword_counts(conn, limit)
+    else:
+        facets = result_facets(conn, item_ids, limit)
+    for name, count in facets:
+        print('{0}\t{1}'.format(count, name))
 
 
 def modify_keyword(args):
-    session = Session()
-    item = session.query(Item).filter(Item.id == args.paper_id).one()
-    if args.add:
-        to_add = ' '.join(args.add).split(',')
-        update_keywords(session, set(to_add), item.keyword)
-    if args.delete:
-        for x in ' '.join(args.delete).split(','):
-            keyword = session.query(Keyword).filter(
-                Keyword.text == x.strip()).one()
-            item.keyword.remove(keyword)
-    session.commit()
-    print(format_once(SimpleFormatter, item))
-    print('\tKeywords: {0}'.format(', '.join((x.text for x in item.keyword))))
+    """tag or untag many items at once, rename, merge or drop keywords, each in a few set-based statements"""
+    from ..entry.keywords import add_keywords, remove_keywords, rename_keyword, merge_keywords, drop_unused
+    from ..entry.snapshot import tokenize
+    searched = args.author or args.tagged or args.year or args.title
+    if (args.add or args.delete) and not (args.paper_id or searched):
+        print('give paper ids, or search options to choose the items')
+        return
+    with engine.begin() as conn:
+        item_ids: List[str] = list()
+        if args.paper_id:
+            item_ids = read_id_list(args.paper_id)
+            with id_set(conn, item_ids) as ids:
+                found = set(conn.execute(select(item_table.c.id).where(item_table.c.id.in_(ids))).scalars())
+            for item_id in item_ids:
+                if item_id not in found:
+                    print('no paper with id ' + item_id)
+            item_ids = [x for x in item_ids if x in found]
+        elif searched:
+            words = {token for word in args.title for token in tokenize(word)} if args.title else set()
+            item_ids = [x.id for x, _ in find_items(conn, args.author, set(split_keywords(args.tagged)),
+                                                    parse_years(args.year) if args.year else (None, None), words)]
+            print('{0} papers found'.format(len(item_ids)))
+        if args.add:
+            count = add_keywords(conn, item_ids, split_keywords(args.add))
+            print('{0} keywords added'.format(count))
+        if args.delete:
+            count = remove_keywords(conn, item_ids, split_keywords(args.delete))
+            print('{0} keywords removed'.format(count))
+        if args.rename:
+            names = split_keywords(args.rename)
+            if len(names) != 2:
+                raise ValueError('rename takes the old and the new keyword separated by a comma')
+            print('{0} papers now under "{1}"'.format(rename_keyword(conn, *names), names[1]))
+        if args.merge:
+            names = split_keywords(args.merge)
+            print('{0} papers newly under "{1}"'.format(merge_keywords(conn, names[0], names[1:]), names[0]))
+        if args.prune:
+            names = drop_unused(conn)
+            print('dropped {0} unused keywords{1}'.format(len(names), ': ' + ', '.join(names) if names else ''))
+        if args.stats:
+            # a single --tagged keyword is answered from the precomputed pairs
+            tagged = split_keywords(args.tagged) if args.tagged else list()
+            alone = len(tagged) == 1 and not (args.paper_id or args.author or args.year or args.title)
+            print_facets(conn, item_ids if args.paper_id or searched else None, tagged[0] if alone else None,
+                         args.limit)
+        if args.paper_id and len(item_ids) == 1:
+            item = query_items(conn, item_table.c.id == item_ids[0])[0]
+            keywords = conn.execute(select(Keyword.text).join(keyword_assoc, keyword_assoc.c.keyword_id == Keyword.id)
+                                    .where(keyword_assoc.c.item_id == item.id).order_by(Keyword.text)).scalars()
+            print(format_once(SimpleFormatter, item))
+            print('\tKeywords: {0}'.format(', '.join(keywords)))
 
 
 def initialize(_):
     from os import makedirs, path
     from shutil import copy2
     from zipfile import ZipFile
-    from pkg_resources import Requirement, resource_filename, resource_stream
+    from importlib.resources import files, as_file
     from bibdb.config import config, get_config_path
     from bibdb.data.journal import add_journals
     # copy configuration file is not exist
     target_file = get_config_path()
     if not path.isfile(target_file):
-        source_file = resource_filename(
-            Requirement.parse('bibdb'), 'bibdb/data/bibdb.json')
-        print('moving example config file to ' + target_file)
-        copy2(source_file, target_file)
+        with as_file(files('bibdb.data').joinpath('bibdb.json')) as source_file:
+            print('moving example config file to ' + target_file)
+            copy2(source_file, target_file)
     # create folders if not exist
     for file_path in config['path'].values():
         makedirs(path.split(path.expanduser(file_path))[0], exist_ok=True)
     for file_type in config['files'].values():
         makedirs(path.expanduser(file_type['folder']), exist_ok=True)
     # create journal names database
-    with resource_stream(
-            Requirement.parse('bibdb'),
-            "bibdb/data/journals.zip") as file_stream:
+    with files('bibdb.data').joinpath('journals.zip').open('rb') as file_stream:
         with ZipFile(file_stream) as zf:
             with zf.open(zf.namelist()[0]) as fp:
                 add_journals(fp)
     # create main database
-    from bibdb.entry import main
+    from bibdb.entry import main, digest, notes, facets, changelog, minhash  # these add their tables
     session = main.Session()
     main.ItemBase.metadata.create_all(main.engine)
     session.commit()
+    with main.engine.begin() as conn:
+        notes.ensure_tables(conn)
+        facets.ensure_facets(conn)
+        if changelog.get_changes_folder() is not None:
+            changelog.ensure_changelog(conn)
+    from bibdb.completion import rebuild_index
+    rebuild_index()
+    snapshot(None)
@@ -0,0 +1,112 @@
+"""Keep the reference list of markdown manuscripts up to date while they are being written. On every save the
+citations are scanned from the markdown directly, without pandoc, and the output file is rewritten, atomically, only
+when the set of cited papers or one of the cited entries changed. A change of the library is noticed through the
+database file change counter, so edits made with bibdb k or bibdb a show up in the reference list too."""
+import os
+import time
+from io import StringIO
+from os import path
+from typing import List, Optional, Tuple
+
+from ..database import get_database
+from ..entry.main import engine
+from ..entry.record import query_ids
+from ..entry.snapshot import change_counter
+from ..formatter.entry import BibtexFormatter, SimpleFormatter
+from ..reader.pandoc import scan_citations
+from .watch import InotifyWatcher, PollingWatcher
+
+FORMATTERS = {'bib': BibtexFormatter, 'str': SimpleFormatter}
+
+
+def read_citations(sources: List[str]) -> List[str]:
+    """citation keys of all sources, in order of first use"""
+    keys: dict = dict()
+    for source in sources:
+        with open(source, 'r', encoding='utf-8') as fp:
+            keys.update(dict.fromkeys(scan_citations(fp.read())))
+    return list(keys)
+
+
+def write_atomic(file_path: str, content: str) -> None:
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as fp:
+        fp.write(content)
+    os.replace(temp_path, file_path)
+
+
+class ReferenceList(object):
+    """the reference list of some sources, remembering what it last wrote to skip work that would change nothing"""
+    def __init__(self, sources: List[str], output_path: str, output_format: str = 'bib'):
+        self.sources = sources
+        self.output_path = output_path
+        self.formatter = FORMATTERS[output_format]
+        self.cited: Optional[List[str]] = None
+        self.counter: Optional[int] = None
+        self.content: Optional[str] = None
+        if path.isfile(output_path):
+            with open(output_path, 'r', encoding='utf-8') as fp:
+                self.content = fp.read()
+
+    def render(self, cited: List[str]) -> Tuple[str, List[str]]:
+        """the reference list in citation order, and the keys not in the library"""
+        with engine.connect() as conn:
+            items, missing = query_ids(conn, cited)
+        buf = StringIO()
+        formatter = self.formatter(buf)
+        for item in items:
+            formatter(item)
+        return buf.getvalue(), missing
+
+    def refresh(self) -> Optional[Tuple[List[str], List[str], List[str]]]:
+        """rewrite the output if needed. Returns None when nothing changed, else the keys added and removed since
+        the last refresh and the keys not found."""
+        cited, counter = read_citations(self.sources), change_counter()
+        if cited == self.cited and counter == self.counter:
+            return None
+        previous = set(self.cited) if self.cited is not None else set()
+        content, missing = self.render(cited)
+        self.cited, self.counter = cited, counter
+        if content == self.content:
+            return None
+        write_atomic(self.output_path, content)
+        self.content = content
+        return [x for x in cited if x not in previous], sorted(previous - set(cited)), missing
+
+
+def _report(references: ReferenceList, start: float) -> None:
+    change = references.refresh()
+    if change is None:
+        return
+    added, removed, missing = change
+    print('{0}: {1} entries, +{2} -{3} in {4:.0f} ms{5}'.format(
+        references.output_path, len(references.cited) - len(missing), len(added), len(removed),
+        (time.perf_counter() - start) * 1000, ', not in the library: ' + ', '.join(missing) if missing else ''),
+        flush=True)
+
+
+def watch_bib(args):
+    if not args.output:
+        print('give the reference list to keep up to date with -o')
+        return
+    sources = [path.abspath(x) for x in args.source]
+    database = path.abspath(get_database().path)
+    folders = list(dict.fromkeys(path.dirname(x) for x in sources + [database]))
+    references = ReferenceList(sources, args.output, args.format)
+    _report(references, time.perf_counter())
+    extensions = list({path.splitext(x)[1] for x in sources + [database]})
+    try:
+        # the database itself too, a server writes it through a connection it never closes
+        watcher = InotifyWatcher(folders, [database])
+    except (OSError, AttributeError, TypeError):
+        watcher = PollingWatcher(folders, extensions, 0.5)
+    print('watching ' + ', '.join(path.basename(x) for x in sources), flush=True)
+    try:
+        for file_path in watcher:
+            if file_path in sources or file_path == database:
+                try:
+                    _report(references, time.perf_counter())
+                except FileNotFoundError:  # saved by replacing the file, the new one comes with the next event
+                    pass
+    except KeyboardInterrupt:
+        pass
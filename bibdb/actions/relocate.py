@@ -0,0 +1,238 @@
+"""Move every registered file of a type to a new folder, or rename them all to the names bibdb gives, in one go.
+All moves are planned first and written to a journal next to the database, then carried out in a thread pool. The
+new names are committed in one transaction and the new folder written to the config file only when every move
+succeeded; a move to a new folder is refused while any file can not be moved. A run that was interrupted is
+finished with --resume or undone with --rollback; both look at which end of each planned move exists on disk, so
+they work however far the run got. A rollback is refused once the new names or folder are in the database or the
+config, even when the run stopped before marking the journal."""
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from os import path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import bindparam, select, update
+
+from ..config import config, get_config_path
+from ..database import get_database
+from ..entry.file_object import file_table
+from ..entry.main import engine
+from .check import expected_names, type_folder, FileRow
+
+
+class Move(NamedTuple):
+    file_id: int
+    old_path: str
+    new_path: str
+    new_name: str
+
+
+def get_journal_path() -> str:
+    return get_database().sibling('relocate.journal', 'journal')
+
+
+def plan_moves(conn, object_type: str, folder: Optional[str], rename: bool) -> List[Move]:
+    """moves of the registered files of object_type into folder, renamed to their expected names if rename"""
+    old_folder, extension = type_folder(object_type)
+    new_folder = path.expanduser(folder) if folder else old_folder
+    rows = [FileRow(*row) for row in conn.execute(
+        select(file_table.c.id, file_table.c.item_id, file_table.c.name, file_table.c.object_type)
+        .where(file_table.c.object_type == object_type))]
+    expected = expected_names(conn, rows) if rename else dict()
+    moves = list()
+    for row in rows:
+        new_name = expected.get(row.id, row.name)
+        move = Move(row.id, path.join(old_folder, row.name + extension), path.join(new_folder, new_name + extension),
+                    new_name)
+        if move.old_path != move.new_path:
+            moves.append(move)
+    return moves
+
+
+def split_conflicts(moves: List[Move]) -> Tuple[List[Move], List[Tuple[Move, str]]]:
+    """moves that can run concurrently, and the others with the reason. A move conflicts when its file is missing,
+    its target exists or is another move's target, or its target is another move's source."""
+    sources = {move.old_path for move in moves}
+    targets: Dict[str, int] = dict()
+    for move in moves:
+        targets[move.new_path] = targets.get(move.new_path, 0) + 1
+    good, conflicts = list(), list()
+    for move in moves:
+        if not path.exists(move.old_path):
+            conflicts.append((move, 'missing'))
+        elif targets[move.new_path] > 1:
+            conflicts.append((move, 'shared target'))
+        elif move.new_path in sources or path.exists(move.new_path):
+            conflicts.append((move, 'target exists'))
+        else:
+            good.append(move)
+    return good, conflicts
+
+
+def write_journal(journal_path: str, header: dict, moves: List[Move]) -> None:
+    """one json line for the header, then one per move, synced to disk before the first file is touched"""
+    temp_path = journal_path + '.tmp'
+    with open(temp_path, 'w') as fp:
+        fp.write(json.dumps(header) + '\n')
+        fp.writelines(json.dumps(list(move)) + '\n' for move in moves)
+        fp.flush()
+        os.fsync(fp.fileno())
+    os.replace(temp_path, journal_path)
+
+
+def read_journal(journal_path: str) -> Tuple[dict, List[Move], bool]:
+    """header, moves, and whether the database changes were committed"""
+    with open(journal_path, 'r') as fp:
+        lines = [json.loads(line) for line in fp if line.strip()]
+    committed = lines[-1] == 'committed'
+    return lines[0], [Move(*x) for x in lines[1: -1 if committed else None]], committed
+
+
+def _move(source: str, target: str, stop: threading.Event) -> bool:
+    """move a file unless the run was stopped, returns whether it was moved. Never overwrites."""
+    if stop.is_set():
+        return False
+    if path.exists(target):
+        raise FileExistsError(target)
+    os.makedirs(path.dirname(target), exist_ok=True)
+    shutil.move(source, target)  # a rename, or copy and delete across file systems
+    return True
+
+
+def run_moves(pairs: List[Tuple[str, str]], workers: int) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """carry out (source, target) pairs in a thread pool, showing progress. The first failure stops the rest.
+    Returns the pairs done and the errors."""
+    stop = threading.Event()
+    done, errors = list(), list()
+    step = max(1, len(pairs) // 100)
+    with ThreadPoolExecutor(workers) as executor:
+        futures = {executor.submit(_move, source, target, stop): (source, target) for source, target in pairs}
+        for idx, future in enumerate(as_completed(futures)):
+            try:
+                if future.result():
+                    done.append(futures[future])
+            except OSError as e:
+                stop.set()
+                errors.append('{0}: {1}'.format(futures[future][0], e))
+            if idx % step == 0 or idx + 1 == len(pairs):
+                print('\r{0}/{1} files moved'.format(len(done), len(pairs)), end='', flush=True)
+    if pairs:
+        print()
+    return done, errors
+
+
+def _write_folder(object_type: str, folder: str) -> None:
+    """point the config file, and the config in memory, at the new folder"""
+    config_path = get_config_path()
+    if path.isfile(config_path):
+        with open(config_path, 'r') as fp:
+            raw = json.load(fp)
+    else:
+        raw = json.loads(json.dumps(dict(config)))
+    raw['files'][object_type]['folder'] = folder
+    with open(config_path + '.tmp', 'w') as fp:
+        json.dump(raw, fp, indent=4)
+    os.replace(config_path + '.tmp', config_path)
+    config['files'][object_type]['folder'] = folder
+
+
+def is_committed(header: dict, moves: List[Move]) -> bool:
+    """whether a run got past its commit though its journal may not say so: the file table holds the new names, or
+    the config file the new folder"""
+    object_type, folder = header['object_type'], header['folder']
+    if folder and path.expanduser(folder) != path.expanduser(header.get('old_folder') or '') and \
+            path.expanduser(config['files'][object_type]['folder']) == path.expanduser(folder):
+        return True
+    renamed = {move.file_id: move.new_name for move in moves
+               if path.basename(move.old_path) != path.basename(move.new_path)}
+    if not renamed:
+        return False
+    with engine.connect() as conn:
+        names = dict(conn.execute(select(file_table.c.id, file_table.c.name)
+                                  .where(file_table.c.id.in_(list(renamed)))).all())
+    return any(names.get(file_id) == name for file_id, name in renamed.items())
+
+
+def finish(journal_path: str, header: dict, moves: List[Move], committed: bool = False) -> None:
+    """commit the new names in one transaction, mark the journal, then write the config and drop the journal"""
+    renamed = [{'file_id': move.file_id, 'new_name': move.new_name} for move in moves
+               if path.basename(move.old_path) != path.basename(move.new_path)]
+    if renamed and not committed:
+        with engine.begin() as conn:
+            conn.execute(update(file_table).where(file_table.c.id == bindparam('file_id'))
+                         .values(name=bindparam('new_name')), renamed)
+        with open(journal_path, 'a') as fp:
+            fp.write(json.dumps('committed') + '\n')
+    if header['folder']:
+        _write_folder(header['object_type'], header['folder'])
+    os.remove(journal_path)
+    print('{0} files moved, {1} renamed{2}'.format(len(moves), len(renamed), ', folder set to ' + header['folder']
+                                                   if header['folder'] else ''))
+
+
+def rollback(journal_path: str, header: dict, moves: List[Move], workers: int) -> bool:
+    """move the files back unless the run was committed, returns whether it was rolled back"""
+    if is_committed(header, moves):
+        print('the new names are already committed, finish with --resume instead')
+        return False
+    back = [(move.new_path, move.old_path) for move in moves
+            if path.exists(move.new_path) and not path.exists(move.old_path)]
+    done, errors = run_moves(back, workers)
+    for error in errors:
+        print(error)
+    if not errors:
+        os.remove(journal_path)
+    print('{0} files moved back{1}'.format(len(done), ', journal kept' if errors else ''))
+    return not errors
+
+
+def relocate(args):
+    journal_path = get_journal_path()
+    if args.resume or args.rollback:
+        if not path.isfile(journal_path):
+            print('no interrupted relocation')
+            return
+        header, moves, committed = read_journal(journal_path)
+        if args.rollback:
+            if committed:
+                print('the new names are already committed, finish with --resume instead')
+            else:
+                rollback(journal_path, header, moves, args.jobs)
+            return
+        committed = committed or is_committed(header, moves)
+        remaining = [(move.old_path, move.new_path) for move in moves
+                     if path.exists(move.old_path) and not path.exists(move.new_path)]
+    else:
+        committed = False
+        if path.isfile(journal_path):
+            print('an interrupted relocation is in ' + journal_path + ', --resume or --rollback it first')
+            return
+        if not (args.folder or args.rename):
+            print('give a new folder, or --rename')
+            return
+        with engine.connect() as conn:
+            moves, conflicts = split_conflicts(plan_moves(conn, args.type, args.folder, args.rename))
+        old_folder = type_folder(args.type)[0]
+        moving = bool(args.folder) and path.expanduser(args.folder) != old_folder
+        for move, reason in conflicts:
+            print('{0}, {1}: {2}'.format('can not move' if moving else 'skipped', reason, move.old_path))
+        if args.dry_run:
+            for move in moves:
+                print('{0} -> {1}'.format(move.old_path, move.new_path))
+            return
+        if moving and conflicts:  # files left behind would not be found once the folder is switched
+            print('{0} files can not be moved, nothing done. Resolve them, see bibdb check'.format(len(conflicts)))
+            return
+        header = {'object_type': args.type, 'folder': args.folder, 'old_folder': old_folder}
+        write_journal(journal_path, header, moves)
+        remaining = [(move.old_path, move.new_path) for move in moves]
+    done, errors = run_moves(remaining, args.jobs)
+    if errors:
+        for error in errors:
+            print(error)
+        print('moving back the {0} files already moved'.format(len(done)))
+        rollback(journal_path, header, moves, args.jobs)
+        return
+    finish(journal_path, header, moves, committed)
@@ -1,18 +1,69 @@
+import json
+import os
+from collections import Counter
 from pathlib import Path
+from types import SimpleNamespace
+from typing import List, Optional, Set, Tuple
 from ..data.journal import search_journal
+from ..entry.digest import count_unindexed, hash_file, find_digest
 from ..entry.file_object import Unregistered, PdfFile, CommentFile
+from ..entry.key import KeyAllocator
 from ..entry.main import Session, item_types, Item, Person, Authorship, Editorship, Keyword, Journal
-from ..formatter.entry import SimpleFormatter, FileNameFormatter, format_once
+from ..entry.record import PersonRecord, RelationRecord
+from ..formatter.entry import SimpleFormatter, FileNameFormatter, IdFormatter, format_once
+from ..profiling import phase
 from ..reader.bibtex import BibtexReader
 from ..utils import normalize
 
 class StorePaperException(Exception):
     pass
 
+class SkipEntry(StorePaperException):
+    """the entry is not stored and needs no further review"""
+
+class ReviewNeeded(StorePaperException):
+    """the policy leaves this question to the user"""
+
+class UnreadableEntry(StorePaperException):
+    """the citation holds no entry of a type bibdb stores"""
+
+class StorePolicy(object):
+    """answers the questions of store_entry in batch mode, read from a json file like
+    {"conflict": "skip", "author": "new", "journal": "create", "pdf": "keep"}
+        conflict: title already stored. review, skip, or update the stored entry
+        author: last name known but first name differs. review, new person, or first known person
+        journal: journal not in the journal database. review, or create it with the name only
+        pdf: entry already has a pdf. keep it, or replace it
+        duplicate: the same pdf content is already stored. skip the entry, store it anyway, or review"""
+    choices = {'conflict': ('review', 'skip', 'update'), 'author': ('review', 'new', 'first'),
+               'journal': ('review', 'create'), 'pdf': ('keep', 'replace', 'review'),
+               'duplicate': ('skip', 'store', 'review')}
+
+    def __init__(self, conflict: str = 'review', author: str = 'review', journal: str = 'review', pdf: str = 'keep',
+                 duplicate: str = 'skip'):
+        for question, choice in (('conflict', conflict), ('author', author), ('journal', journal), ('pdf', pdf),
+                                 ('duplicate', duplicate)):
+            if choice not in self.choices[question]:
+                raise ValueError('{0} policy must be one of {1}'.format(question, ', '.join(self.choices[question])))
+            setattr(self, question, choice)
+        self.decisions: Counter = Counter()
+
+    @classmethod
+    def load(cls, file_path: Optional[str] = None) -> 'StorePolicy':
+        return cls(**json.load(open(file_path, 'r'))) if file_path else cls()
+
+    def decide(self, question: str) -> str:
+        choice = getattr(self, question)
+        self.decisions['{0}: {1}'.format(question, choice)] += 1
+        if choice == 'review':
+            raise ReviewNeeded('left for review: ' + question)
+        return choice
+
 def fix_authorship():
     import sys
     session = Session()
-    entries = BibtexReader(Path(sys.argv[1]).read_text())().entries
+    with phase('parse'):
+        entries = BibtexReader(Path(sys.argv[1]).read_text())().entries
     for entry in entries:
         item = session.query(Item).filter(Item.id == entry['ID']).first()
         if item:
@@ -78,113 +129,189 @@ def import_bib():
 
     import sys
     session = Session()
-    entries = BibtexReader(Path(sys.argv[1]).read_text())().entries
+    with phase('parse'):
+        entries = BibtexReader(Path(sys.argv[1]).read_text())().entries
     for entry in entries:
         item = session.query(Item).filter((Item.title == entry['title']) | (Item.id == entry['ID'])).first()
         if item:
             continue
+        split_names(entry)
         try:
             item = item_types[entry['ENTRYTYPE']](entry)
-            for key, value in entry.items():
-                if key in __actions__:
-                    __actions__[key](session, value, item)
+            with phase('resolve'):
+                for key, value in entry.items():
+                    if key in __actions__:
+                        __actions__[key](session, value, item)
             session.add(item)
-            session.commit()
+            with phase('flush'):
+                session.commit()
         except StorePaperException as e:
             session.rollback()
             raise e
 
 def store_paper(args):
     bib_file = Unregistered.find()
-    entry = BibtexReader(bib_file.read())().entries[0]
-    item = item_types[entry['ENTRYTYPE']](entry)
+    try:
+        temp_pdf_file = PdfFile.find('temp-pdf')
+    except IOError as e:
+        print(e)
+        temp_pdf_file = None
     new_keywords = {x.strip() for x in ' '.join(args.keyword).split(',')} if args.keyword else set()
-    if 'keyword' in entry:
-        new_keywords |= set(entry['keyword'])
-    session = Session()
+    store_file(bib_file, temp_pdf_file, new_keywords)
 
+def store_file(bib_file: Unregistered, temp_pdf_file: Optional[PdfFile], new_keywords: Set[str],
+               confirm: bool = True) -> bool:
+    """store the first entry of a bib file with an optional pdf, returns whether it has been stored"""
+    session = Session()
+    moves: List[Tuple[str, str]] = list()
     try:
-        print(item.title)
-        try:
-            temp_pdf_file = PdfFile.find('temp-pdf')
-            print('\tFile: {0}'.format(temp_pdf_file.name))
-        except IOError as e:
-            print(e)
-            temp_pdf_file = None
-            print('\tFile: None')
-        if input('(a)abort, (c)continue?') != 'c':
+        item = store_entry(session, bib_file.read(), temp_pdf_file, new_keywords, moves, confirm=confirm)
+        if item is None:
             print("aborted")
-            return
+            return False
+        with phase('flush'):
+            session.commit()
+        with phase('write'):
+            for old_path, new_path in moves:
+                os.rename(old_path, new_path)
+        print('successfully inserted the following entry:')
+        print(format_once(SimpleFormatter, item))
+        return True
+    except StorePaperException as e:
+        session.rollback()
+        print(e)
+        return False
 
-        entry['author'] = [(normalize(" ".join(x.last)), normalize(" ".join(x.first))) for x in entry['author']]
-        if 'editor' in entry:
-            entry['editor'] = [(normalize(" ".join(x.last)), normalize(" ".join(x.first))) for x in entry['editor']]
-        if not (('author' in entry) or ('editor' in entry)) or ('year' not in entry):
-            item.id = entry['ID']
+def store_entry(session, bib_text: str, temp_pdf_file: Optional[PdfFile], new_keywords: Set[str],
+                moves: List[Tuple[str, str]], policy: Optional['StorePolicy'] = None, confirm: bool = True,
+                allocator: Optional[KeyAllocator] = None):
+    """add the first entry of bib_text to the session without committing. Pdf renames are appended to moves, to be
+    carried out after commit. Questions go to the user unless a policy answers them. A batch shares one allocator
+    across its entries. Returns the item, or None when the user aborts at the first question."""
+    with phase('parse'):
+        entry = read_entry(bib_text)
+    item = item_types[entry['ENTRYTYPE']](entry)
+    if 'keyword' in entry:
+        new_keywords = new_keywords | set(entry['keyword'])
+
+    print(item.title)
+    print('\tFile: {0}'.format(temp_pdf_file.name if temp_pdf_file is not None else None))
+    if policy is None and confirm and input('(a)abort, (c)continue?') != 'c':
+        return None
+    if temp_pdf_file is not None:
+        check_duplicate(session, temp_pdf_file, policy)
+
+    split_names(entry)
+    conflicting_item = session.query(Item).filter(Item.title == item.title).first()
+    if conflicting_item is not None:
+        print('citation conflict!\n' + format_once(SimpleFormatter, conflicting_item))
+        if policy is None:
+            choice = input('(a)abort, (u)update entry?')
         else:
-            temp_str = (entry['author'][0][0] if 'author' in entry else entry['editor'][0][0]) + str(entry['year'])
-            item.id = temp_str.replace(' ', '-')
-
-        while True:
-            conflicting_item = session.query(Item).filter((Item.id == item.id) | (Item.title == item.title)).first()
-            if conflicting_item is None:
-                break
-            print('citation conflict!\n' + format_once(SimpleFormatter, conflicting_item))
-            choice = input('(a)abort, (u)update entry, Input new citation?')
-            if choice == 'a':
-                raise StorePaperException("manually aborted")
-            elif choice == 'u':
-                for field in item.required_fields | item.optional_fields:
-                    if hasattr(item, field):
-                        setattr(conflicting_item, field, getattr(item, field))
-                item = conflicting_item
-                conflicting_item.authorship[:] = []
-                break
-            else:
-                item.id = choice
+            choice = 'u' if policy.decide('conflict') == 'update' else 'a'
+        if choice != 'u':
+            raise SkipEntry('already stored as ' + conflicting_item.id) if policy is not None \
+                else StorePaperException("manually aborted")
+        for field in item.required_fields | item.optional_fields:
+            if hasattr(item, field):
+                setattr(conflicting_item, field, getattr(item, field))
+        item = conflicting_item
+        conflicting_item.authorship[:] = []
+    else:
+        item.id = None  # allocated after the questions below, to hold the write lock only briefly
 
+    with phase('resolve'):
         update_keywords(session, new_keywords, item.keyword)
 
         if 'author' in entry:
             for idx, person in enumerate(entry['author']):
-                add_person(session, person, idx, Authorship, item.authorship, item.id)
+                add_person(session, person, idx, Authorship, item.authorship, item.id, policy)
         if 'editor' in entry:
             for idx, person in enumerate(entry['editor']):
-                add_person(session, person, idx, Editorship, item.editorship, item.id)
+                add_person(session, person, idx, Editorship, item.editorship, item.id, policy)
 
         if 'journal' in entry:
-            set_journal(session, entry['journal'], item)
-
-        if temp_pdf_file is not None:
-            pdf_files = [file for file in item.file if isinstance(file, PdfFile)]
-            if len(pdf_files) == 0:
-                temp_pdf_file.move('pdf', format_once(FileNameFormatter, item))
-            else:  # add or replace file
-                print("pdf_file exists!\n" + '\n'.join('{0}: {1.name}'.format(*x) for x in enumerate(pdf_files)))
+            set_journal(session, entry['journal'], item, policy)
+
+        if item.id is None:
+            allocator = allocator if allocator is not None else KeyAllocator(session)
+            item.id = allocator.allocate(base_key(entry))
+
+    if temp_pdf_file is not None:
+        pdf_files = [file for file in item.file if isinstance(file, PdfFile)]
+        if len(pdf_files) == 0:
+            moves.append(temp_pdf_file.plan_move('pdf', format_once(FileNameFormatter, item)))
+            item.file.append(temp_pdf_file)
+        else:  # add or replace file
+            print("pdf_file exists!\n" + '\n'.join('{0}: {1.name}'.format(*x) for x in enumerate(pdf_files)))
+            if policy is None:
                 choice = input('(c)do nothing; (N) replace the Nth file; or put a short word as new '
                                'file\'s suffix: ')
-                if choice != 'c':
-                    try:
-                        old_file = pdf_files[int(choice)]
-                        new_name = old_file.name
-                        item.file.remove(old_file)
-                        session.delete(old_file)
-                    except ValueError:
-                        suffix = choice
-                        new_name = format_once(FileNameFormatter, item, suffix)
-                    temp_pdf_file.move('pdf', new_name)
-            item.file.append(temp_pdf_file)
+            else:
+                choice = '0' if policy.decide('pdf') == 'replace' else 'c'
+            if choice != 'c':
+                try:
+                    old_file = pdf_files[int(choice)]
+                    new_name = old_file.name
+                    item.file.remove(old_file)
+                    session.delete(old_file)
+                except ValueError:
+                    suffix = choice
+                    new_name = format_once(FileNameFormatter, item, suffix)
+                moves.append(temp_pdf_file.plan_move('pdf', new_name))
+            if policy is None or choice != 'c':
+                item.file.append(temp_pdf_file)
+        if temp_pdf_file in item.file:
             session.add(temp_pdf_file)
-        session.add(item)
-        session.commit()
-        print('successfully inserted the following entry:')
-        print(format_once(SimpleFormatter, item))
-    except StorePaperException as e:
-        session.rollback()
-        print(e)
+    session.add(item)
+    return item
+
+
+def read_entry(bib_text: str):
+    """the first entry of bib_text, raises UnreadableEntry when there is none or bibdb has no type for it"""
+    entries = BibtexReader(bib_text)().entries
+    if len(entries) == 0:
+        raise UnreadableEntry('can not read citation')
+    if entries[0]['ENTRYTYPE'] not in item_types:
+        raise UnreadableEntry('unknown entry type: ' + entries[0]['ENTRYTYPE'])
+    return entries[0]
+
+
+def split_names(entry) -> None:
+    """replace the parsed names of authors and editors by (last name, first name) tuples, normalized"""
+    for field in ('author', 'editor'):
+        if field in entry:
+            entry[field] = [(normalize(" ".join(x.last)), normalize(" ".join(x.first))) for x in entry[field]]
+
+
+def base_key(entry) -> str:
+    """the id formatted from the first author or editor and the year, or the entry's own id lacking either"""
+    if not (('author' in entry) or ('editor' in entry)) or ('year' not in entry):
+        return entry['ID']
+    stand_in = SimpleNamespace(year=entry['year'], title=entry['title'], **{
+        relation: [RelationRecord(idx, PersonRecord(None, *name))
+                   for idx, name in enumerate(entry[key] if key in entry else ())]
+        for relation, key in (('authorship', 'author'), ('editorship', 'editor'))})
+    return format_once(IdFormatter, stand_in)
+
+def check_duplicate(session, temp_pdf_file: PdfFile, policy: Optional['StorePolicy'] = None) -> None:
+    """hash the downloaded pdf and look its content up in the hash index before it is moved into the library"""
+    temp_pdf_file.content = hash_file(repr(temp_pdf_file))
+    conn = session.connection()
+    stored = find_digest(conn, temp_pdf_file.content)
+    if len(stored) == 0:
+        unindexed = count_unindexed(conn)
+        if unindexed:
+            print('{0} stored pdfs are not indexed, bibdb dedupe finds duplicates among them'.format(unindexed))
         return
+    print('the same pdf is already stored:\n' + '\n'.join('\t{0}: {1}'.format(*x) for x in stored))
+    if policy is None:
+        if input('(a)abort, (c)continue?') != 'c':
+            raise StorePaperException('manually aborted')
+    elif policy.decide('duplicate') == 'skip':
+        raise SkipEntry('pdf already stored for ' + stored[0][0])
 
-def add_person(session, name, order, relation_class, proxy, item_id):
+def add_person(session, name, order, relation_class, proxy, item_id, policy: Optional['StorePolicy'] = None):
     last_name, first_name = map(str.lower, name)
     persons = session.query(Person).filter(Person.last_name == last_name).all()
     new_person = False
@@ -200,7 +327,11 @@ def add_person(session, name, order, relation_class, proxy, item_id):
             for idx, old_person in enumerate(persons):
                 print(('{0}. {1}, {2}'.format(idx, old_person.last_name.title(),
                                               old_person.first_name.title())))
-            choice = input("(a)abort, or type 'number,new_name'\n").lower().strip()
+            if policy is None:
+                choice = input("(a)abort, or type 'number,new_name'\n").lower().strip()
+            else:
+                choice = 'n' if policy.decide('author') == 'new' else '0'
+
             new_name = None
             if ',' in choice:
                 choice, new_name = [a.strip() for a in choice.split(',', maxsplit=2)]
@@ -231,7 +362,7 @@ def update_keywords(session, new_keywords, proxy):
     for keyword in new_keywords:
         proxy.append(Keyword(text=keyword))
 
-def set_journal(session, journal_name, item):
+def set_journal(session, journal_name, item, policy: Optional['StorePolicy'] = None):
     while True:
         journal = search_journal(journal_name)
         if journal is None:
@@ -241,6 +372,10 @@ def set_journal(session, journal_name, item):
                 return
             else:
                 print('journal name not found: ' + journal_name)
+                if policy is not None:
+                    policy.decide('journal')
+                    item.journal = Journal({'name': journal_name})
+                    return
                 # noinspection SpellCheckingInspection
                 choice = input('please input journal name, abbreviation, and abbreviation without dot form. '
                                'or (a)bort: ')
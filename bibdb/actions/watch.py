@@ -0,0 +1,291 @@
+"""Watch the download folders and queue incoming citation files, paired with the pdf downloaded around the same
+time, for storing later. Uses inotify on linux and polls the folders elsewhere."""
+import json
+import os
+import struct
+import time
+from os import path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from ..config import config
+from ..database import get_database
+from ..entry.file_object import scan_folder
+from ..profiling import phase
+
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+EVENT_HEADER = struct.Struct('iIII')
+PAIR_WINDOW = 600  # seconds between a citation file and its pdf
+
+
+def get_pending_path() -> str:
+    return get_database().sibling('pending.json', 'pending')
+
+
+def _extensions(file_type: str) -> List[str]:
+    extension = config['files'][file_type]['extension']
+    return extension if isinstance(extension, list) else [extension]
+
+
+class PendingQueue(object):
+    """citation files waiting to be stored, each a dict of bib path, pdf path (or None), title and arrival time"""
+    def __init__(self, pending_path: Optional[str] = None):
+        self.pending_path = pending_path if pending_path else get_pending_path()
+        self.entries: List[dict] = list()
+        if path.isfile(self.pending_path):
+            with open(self.pending_path, 'r') as fp:
+                self.entries = json.load(fp)
+
+    def save(self) -> None:
+        temp_path = self.pending_path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump(self.entries, fp, indent=1)
+        os.replace(temp_path, self.pending_path)
+
+    def add_bib(self, bib_path: str, title: str, arrived: float, loose_pdfs: Dict[str, float]) -> dict:
+        """queue a citation file, pairing it with the closest pdf that arrived within PAIR_WINDOW"""
+        previous = [x for x in self.entries if x['bib'] == bib_path]
+        self.entries = [x for x in self.entries if x['bib'] != bib_path]
+        paired = {x['pdf'] for x in self.entries}
+        candidates = [(abs(arrived - pdf_time), pdf) for pdf, pdf_time in loose_pdfs.items()
+                      if abs(arrived - pdf_time) <= PAIR_WINDOW and pdf not in paired]
+        entry = {'bib': bib_path, 'pdf': min(candidates)[1] if candidates else None, 'title': title,
+                 'time': arrived}
+        if entry['pdf'] is not None:
+            loose_pdfs.pop(entry['pdf'])
+        elif previous and previous[0]['pdf'] not in paired:  # the citation file was rewritten
+            entry['pdf'] = previous[0]['pdf']
+        self.entries.append(entry)
+        return entry
+
+    def add_pdf(self, pdf_path: str, arrived: float) -> Optional[dict]:
+        """attach a pdf to the latest unpaired citation file that arrived within PAIR_WINDOW"""
+        for entry in sorted(self.entries, key=lambda x: -x['time']):
+            if entry['pdf'] is None and abs(arrived - entry['time']) <= PAIR_WINDOW:
+                entry['pdf'] = pdf_path
+                return entry
+        return None
+
+
+class InotifyWatcher(object):
+    """yields paths of files written or moved into the folders, through inotify called with ctypes. files are
+    watched for every write, for those kept open by their writer, as sqlite keeps its database."""
+    def __init__(self, folders: List[str], files: List[str] = ()):
+        import ctypes
+        import ctypes.util
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.folders: Dict[int, str] = dict()
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'can not watch ' + folder)
+            self.folders[wd] = folder
+        self.files: Dict[int, str] = dict()
+        for file_path in files:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(file_path), IN_MODIFY)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), 'can not watch ' + file_path)
+            self.files[wd] = file_path
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            data = os.read(self.fd, 65536)
+            offset = 0
+            while offset < len(data):
+                wd, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset: offset + length].rstrip(b'\0')
+                offset += length
+                if name and wd in self.folders:
+                    yield path.join(self.folders[wd], os.fsdecode(name))
+                elif wd in self.files:
+                    yield self.files[wd]
+
+
+class PollingWatcher(object):
+    """yields paths of new or modified files, comparing the folders every interval seconds"""
+    def __init__(self, folders: List[str], extensions: List[str], interval: float = 2.0):
+        self.folders = folders
+        self.extensions = extensions
+        self.interval = interval
+
+    def _state(self) -> Dict[str, Tuple[float, int]]:
+        state = dict()
+        for folder in self.folders:
+            for name, ext in scan_folder(folder, self.extensions):
+                file_path = path.join(folder, name + ext)
+                try:
+                    stat = os.stat(file_path)
+                except FileNotFoundError:
+                    continue
+                state[file_path] = (stat.st_mtime, stat.st_size)
+        return state
+
+    def __iter__(self) -> Iterator[str]:
+        previous = self._state()
+        while True:
+            time.sleep(self.interval)
+            current = self._state()
+            for file_path, value in current.items():
+                if previous.get(file_path) != value:
+                    yield file_path
+            previous = current
+
+
+def read_title(bib_path: str) -> Optional[str]:
+    """title of the first entry, or None when the file is not a citation"""
+    from ..reader.bibtex import BibtexReader
+    try:
+        entries = BibtexReader(open(bib_path, 'r').read())().entries
+    except (OSError, UnicodeDecodeError):
+        return None
+    if len(entries) == 0:
+        return None
+    return entries[0]['title'] if 'title' in entries[0] else entries[0]['ID']
+
+
+def watch(args):
+    folders = list(dict.fromkeys(path.expanduser(config['files'][x]['folder']) for x in ('bib', 'temp-pdf')))
+    bib_extensions, pdf_extensions = _extensions('bib'), _extensions('temp-pdf')
+    if args.poll:
+        watcher = PollingWatcher(folders, bib_extensions + pdf_extensions, args.poll)
+    else:
+        try:
+            watcher = InotifyWatcher(folders)
+        except (OSError, AttributeError, TypeError):  # not linux, or no inotify in libc
+            watcher = PollingWatcher(folders, bib_extensions + pdf_extensions)
+    print('watching ' + ', '.join(folders), flush=True)
+    loose_pdfs: Dict[str, float] = dict()
+    try:
+        for file_path in watcher:
+            now = time.time()
+            name = path.basename(file_path)
+            if name.endswith(tuple(bib_extensions)):
+                title = read_title(file_path)
+                if title is None:
+                    continue
+                queue = PendingQueue()
+                entry = queue.add_bib(file_path, title, now, loose_pdfs)
+                queue.save()
+                print('queued: {0}\n\tFile: {1}'.format(title, entry['pdf']), flush=True)
+            elif name.endswith(tuple(pdf_extensions)):
+                queue = PendingQueue()
+                entry = queue.add_pdf(file_path, now)
+                if entry is None:
+                    loose_pdfs[file_path] = now
+                else:
+                    queue.save()
+                    print('paired: {0}\n\tFile: {1}'.format(entry['title'], file_path), flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+def _open_files(entry: dict):
+    """the queued citation file and pdf file, the pdf being None when there is none"""
+    from ..entry.file_object import Unregistered, PdfFile
+    bib_folder, bib_name = path.split(entry['bib'])
+    bib_file = Unregistered(*_split_extension(bib_name, _extensions('bib'), bib_folder))
+    pdf_file = None
+    if entry['pdf'] is not None and path.isfile(entry['pdf']):
+        pdf_folder, pdf_name = path.split(entry['pdf'])
+        pdf_file = PdfFile(*_split_extension(pdf_name, _extensions('temp-pdf'), pdf_folder))
+    return bib_file, pdf_file
+
+
+def _discard(session) -> None:
+    """forget the unflushed changes of one entry, keeping what earlier entries flushed"""
+    for obj in list(session.new):
+        session.expunge(obj)
+    for obj in list(session.dirty):
+        session.expire(obj)
+
+
+def store_batch(queue: PendingQueue, policy, keywords: Set[str]) -> None:
+    """store every queued entry in one transaction, answering questions by the policy. Entries the policy leaves
+    for review stay in the queue."""
+    from .store_paper import store_entry, SkipEntry, ReviewNeeded, UnreadableEntry
+    from ..entry.key import KeyAllocator
+    from ..entry.main import Session
+    start = time.perf_counter()
+    session = Session()
+    allocator = KeyAllocator(session)
+    moves: List[Tuple[str, str]] = list()
+    outcome: Dict[str, List[dict]] = {'stored': list(), 'skipped': list(), 'review': list()}
+    for entry in queue.entries:
+        if not path.isfile(entry['bib']):
+            print('citation file is gone: ' + entry['bib'])
+            outcome['skipped'].append(entry)
+            continue
+        bib_file, pdf_file = _open_files(entry)
+        entry_moves: List[Tuple[str, str]] = list()
+        try:
+            with session.no_autoflush:
+                store_entry(session, bib_file.read(), pdf_file, keywords, entry_moves, policy, allocator=allocator)
+            with phase('flush'):
+                session.flush()
+        except SkipEntry as e:
+            _discard(session)
+            print('\tskipped, {0}'.format(e))
+            outcome['skipped'].append(entry)
+        except (ReviewNeeded, UnreadableEntry) as e:
+            _discard(session)
+            print('\t{0}'.format(e if isinstance(e, ReviewNeeded) else '{0}, left for review'.format(e)))
+            outcome['review'].append(entry)
+        else:
+            moves.extend(entry_moves)
+            outcome['stored'].append(entry)
+    with phase('flush'):
+        session.commit()
+    with phase('write'):
+        for old_path, new_path in moves:
+            os.rename(old_path, new_path)
+    queue.entries = outcome['review']
+    queue.save()
+    elapsed = time.perf_counter() - start
+    total = sum(len(x) for x in outcome.values())
+    print('{0} entries in {1:.2f} s ({2:.1f} entries/s): {3} stored, {4} skipped, {5} left for review'.format(
+        total, elapsed, total / elapsed if elapsed > 0 else 0, *(len(x) for x in outcome.values())))
+    for decision, count in sorted(policy.decisions.items()):
+        print('\t{0}: {1}'.format(decision, count))
+
+
+def pending(args):
+    """list the queue, store the chosen entries one after another without asking for each, or store all of them
+    unattended by a policy"""
+    from .store_paper import store_file, StorePolicy
+    queue = PendingQueue()
+    keywords = {x.strip() for x in ' '.join(args.keyword).split(',')} if args.keyword else set()
+    if args.batch:
+        policy_path = args.policy if args.policy else config['path'].get('policy')
+        store_batch(queue, StorePolicy.load(policy_path), keywords)
+        return
+    if not args.confirm:
+        for idx, entry in enumerate(queue.entries):
+            print('{0}. {1}\n\tBib: {2}\n\tFile: {3}'.format(idx, entry['title'], entry['bib'], entry['pdf']))
+        return
+    chosen = range(len(queue.entries)) if 'all' in args.confirm else [int(x) for x in args.confirm]
+    stored = list()
+    for idx in chosen:
+        entry = queue.entries[idx]
+        if not path.isfile(entry['bib']):
+            print('citation file is gone: ' + entry['bib'])
+            stored.append(entry)
+            continue
+        if store_file(*_open_files(entry), keywords, confirm=False):
+            stored.append(entry)
+    queue.entries = [x for x in queue.entries if x not in stored]
+    queue.save()
+    print('{0} stored, {1} still pending'.format(len(stored), len(queue.entries)))
+
+
+def _split_extension(file_name: str, extensions: List[str], folder: str) -> Tuple[str, str, str]:
+    """name, folder and extension, the argument order of the file classes"""
+    for ext in extensions:
+        if file_name.endswith(ext):
+            return file_name[0: -len(ext)], folder, ext
+    name, ext = path.splitext(file_name)
+    return name, folder, ext
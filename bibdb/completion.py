@@ -0,0 +1,186 @@
+"""Sorted index of item ids for shell and editor completion. Each line holds an id, the first author, the year and
+the start of the title, separated by tabs. Lookups bisect a memory-mapped file and never import sqlalchemy. A
+commit appends its changes to a small delta file next to the index, which lookups apply on top, and which is merged
+into the index once it grows past DELTA_SIZE."""
+import mmap
+import os
+from os import path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from .database import get_database
+
+TITLE_LENGTH = 60
+DELTA_SIZE = 1 << 16  # bytes of appended changes before they are merged into the index
+Record = Tuple[str, str, str, str]
+
+
+def get_index_path() -> str:
+    return get_database().sibling('completion.idx', 'completion')
+
+
+def _clean(value) -> str:
+    return '' if value is None else ' '.join(str(value).split())
+
+
+def make_record(item_id: str, author: Optional[str], year, title: Optional[str]) -> Record:
+    return _clean(item_id), _clean(author), _clean(year), _clean(title)[0: TITLE_LENGTH]
+
+
+def get_delta_path(index_path: str) -> str:
+    return index_path + '.delta'
+
+
+def write_index(records: Iterable[Record], index_path: Optional[str] = None) -> None:
+    """sort records by id and replace the index in one rename, so readers never see a partial file"""
+    index_path = index_path if index_path else get_index_path()
+    lines = sorted(('\t'.join(record) + '\n').encode('utf-8') for record in records)
+    temp_path = '{0}.{1}.tmp'.format(index_path, os.getpid())  # processes writing at once do not collide
+    with open(temp_path, 'wb') as fp:
+        fp.writelines(lines)
+    os.replace(temp_path, index_path)
+
+
+def _read_sorted(index_path: str) -> Dict[str, Record]:
+    with open(index_path, 'r', encoding='utf-8') as fp:
+        records = (tuple(line.rstrip('\n').split('\t')) for line in fp)
+        return {record[0]: record for record in records}
+
+
+def read_delta(delta_path: str) -> Dict[str, Optional[Record]]:
+    """changes appended since the index was last written, the latest of each id: a record, or None when removed"""
+    changes: Dict[str, Optional[Record]] = dict()
+    try:
+        with open(delta_path, 'r', encoding='utf-8') as fp:
+            for line in fp:
+                if not line.endswith('\n'):  # still being appended
+                    break
+                fields = line.rstrip('\n').split('\t')
+                changes[fields[1]] = tuple(fields[1:]) if fields[0] == '+' else None
+    except FileNotFoundError:
+        pass
+    return changes
+
+
+def read_index(index_path: Optional[str] = None) -> Dict[str, Record]:
+    index_path = index_path if index_path else get_index_path()
+    records = _read_sorted(index_path)
+    for item_id, record in read_delta(get_delta_path(index_path)).items():
+        if record is None:
+            records.pop(item_id, None)
+        else:
+            records[item_id] = record
+    return records
+
+
+def _take_delta(index_path: str) -> Optional[str]:
+    """move the delta aside for merging, so changes appended meanwhile start a new one. None without a delta."""
+    taken = '{0}.{1}.merging'.format(get_delta_path(index_path), os.getpid())
+    try:
+        os.replace(get_delta_path(index_path), taken)
+    except FileNotFoundError:
+        return None
+    return taken
+
+
+def merge_delta(index_path: Optional[str] = None) -> None:
+    """fold the delta into the sorted index"""
+    index_path = index_path if index_path else get_index_path()
+    taken = _take_delta(index_path)
+    if taken is None:
+        return
+    records = _read_sorted(index_path)
+    for item_id, record in read_delta(taken).items():
+        if record is None:
+            records.pop(item_id, None)
+        else:
+            records[item_id] = record
+    write_index(records.values(), index_path)
+    os.remove(taken)
+
+
+def update_index(added: Dict[str, Record], removed: Set[str], index_path: Optional[str] = None) -> None:
+    """append added and removed ids to the delta of an existing index, merging the delta into the index once it
+    exceeds DELTA_SIZE. Does nothing before the index is first built."""
+    index_path = index_path if index_path else get_index_path()
+    if not path.isfile(index_path) or not (added or removed):
+        return
+    lines = ['-\t{0}\n'.format(item_id) for item_id in removed if item_id not in added]
+    lines.extend('+\t{0}\n'.format('\t'.join(record)) for record in added.values())
+    # one write to a file opened for appending, so lines of concurrent writers do not interleave
+    fd = os.open(get_delta_path(index_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, ''.join(lines).encode('utf-8'))
+        size = os.fstat(fd).st_size
+    finally:
+        os.close(fd)
+    if size > DELTA_SIZE:
+        merge_delta(index_path)
+
+
+def _bisect(buf, key: bytes) -> int:
+    """offset of the first line whose id is not less than key"""
+    low, high = 0, len(buf)
+    while low < high:
+        start = buf.rfind(b'\n', low, (low + high) // 2) + 1
+        start = max(start, low)
+        end = buf.find(b'\t', start)
+        if buf[start: end] < key:
+            low = buf.find(b'\n', start) + 1
+        else:
+            high = start
+    return low
+
+
+def _search_sorted(index_path: str, key: bytes, limit: Optional[int]) -> List[Record]:
+    result: List[Record] = list()
+    if path.getsize(index_path) == 0:
+        return result
+    with open(index_path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        position = _bisect(buf, key)
+        while position < len(buf) and (limit is None or len(result) < limit):
+            end = buf.find(b'\n', position)
+            line = buf[position: end]
+            if not line.startswith(key):
+                break
+            result.append(tuple(line.decode('utf-8').split('\t')))
+            position = end + 1
+    return result
+
+
+def search(prefix: str, limit: Optional[int] = None, index_path: Optional[str] = None) -> List[Record]:
+    """records whose id starts with prefix, in id order, from the sorted index with the delta applied"""
+    index_path = index_path if index_path else get_index_path()
+    changes = read_delta(get_delta_path(index_path))
+    # a change can hide a record of the index, so as many more are read as there are changes
+    found = _search_sorted(index_path, prefix.encode('utf-8'), None if limit is None else limit + len(changes))
+    result = [record for record in found if record[0] not in changes]
+    result.extend(record for item_id, record in changes.items() if record is not None and item_id.startswith(prefix))
+    result.sort(key=lambda record: record[0].encode('utf-8'))
+    return result[0: limit]
+
+
+def rebuild_index() -> None:
+    from .entry.main import engine
+    from .entry.record import query_items
+    index_path = get_index_path()
+    taken = _take_delta(index_path)  # changes committed after the items are read stay in the new delta
+    with engine.connect() as conn:
+        items = query_items(conn)
+    write_index((make_record(item.id, first_person(item), item.year, item.title) for item in items), index_path)
+    if taken is not None:
+        os.remove(taken)
+
+
+def first_person(item) -> Optional[str]:
+    """last name of the first author, or the first editor, of an orm item or an item record"""
+    for relations in (item.authorship, item.editorship):
+        if relations:
+            return min(relations, key=lambda x: x.order).person.last_name
+    return None
+
+
+def complete(args):
+    if not path.isfile(get_index_path()):
+        rebuild_index()
+    for record in search(args.prefix, args.limit):
+        print('\t'.join(record) if args.long else record[0])
@@ -1,10 +1,9 @@
 import json
 import os
-from io import TextIOWrapper
+from collections.abc import MutableMapping
+from importlib.resources import files
 from os.path import isfile, expanduser, expandvars
 
-from pkg_resources import Requirement, resource_stream
-
 
 def get_config_path() -> str:
     if os.name == 'nt':
@@ -20,11 +19,38 @@ def get_config():
     if isfile(config_path):
         config_dict = json.load(open(config_path, 'r'))
     else:
-        config_dict = json.load(TextIOWrapper(resource_stream(Requirement.parse('bibdb'), "bibdb/data/bibdb.json"),
-                                              'utf-8'))
+        config_dict = json.loads(files('bibdb.data').joinpath('bibdb.json').read_text('utf-8'))
     if 'path' in config_dict:
         config_dict['path'].update({key: expanduser(value) for key, value in config_dict['path'].items()})
     return config_dict
 
 
-config = get_config()
+class LazyConfig(MutableMapping):
+    """the configuration dict, read from file on first access"""
+    def __init__(self, loader=get_config):
+        self._loader = loader
+        self._data = None
+
+    @property
+    def data(self) -> dict:
+        if self._data is None:
+            self._data = self._loader()
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+    def __delitem__(self, key):
+        del self.data[key]
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+config = LazyConfig()
@@ -0,0 +1,152 @@
+"""Optional background server that keeps the database and mapped classes warm. The command line forwards
+non-interactive commands to it over a unix socket, and runs them in-process when no server is listening. Opening a
+file is never forwarded, the viewer would start with the environment and display of the server."""
+import json
+import os
+import socket
+import sys
+import time
+from io import StringIO
+from os import path
+from typing import List, Optional
+
+# commands that never ask for input. o is not among them: it starts a viewer, which belongs to the client's session
+FORWARDED = {'s', 'u', 'd', 'k'}
+
+
+def get_socket_path() -> str:
+    from .config import config
+    if 'socket' in config.get('path', {}):
+        return config['path']['socket']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and path.isdir(runtime_dir):
+        return path.join(runtime_dir, 'bibdb.sock')
+    return path.join('/tmp', 'bibdb-{0}.sock'.format(os.getuid()))
+
+
+def _receive(conn: socket.socket) -> dict:
+    chunks = list()
+    while True:
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    return json.loads(b''.join(chunks).decode('utf-8'))
+
+
+def forward(argv: List[str]) -> Optional[int]:
+    """run argv on the server, return its exit status or None when no server is running"""
+    if not hasattr(socket, 'AF_UNIX') or not argv or argv[0] not in FORWARDED or {'-w', '--watch'} & set(argv):
+        return None  # a watch runs until stopped, it would hold the server
+    start = time.perf_counter()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(get_socket_path())
+            conn.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd(), 'tty': sys.stdout.isatty()})
+                         .encode('utf-8'))
+            conn.shutdown(socket.SHUT_WR)
+            response = _receive(conn)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    sys.stderr.write('bibdb: served in {0:.1f} ms, round trip {1:.1f} ms\n'.format(
+        response['latency'], (time.perf_counter() - start) * 1000))
+    return response['status']
+
+
+class _Output(StringIO):
+    """captures the output of one request, passing on whether the client writes to a terminal"""
+    def __init__(self, tty: bool):
+        super(_Output, self).__init__()
+        self.tty = tty
+
+    def isatty(self) -> bool:
+        return self.tty
+
+
+def run_request(request: dict) -> dict:
+    from contextlib import redirect_stdout, redirect_stderr
+    from traceback import print_exc
+    from .main import make_parser
+    start = time.perf_counter()
+    stdout, stderr = _Output(request.get('tty', False)), _Output(False)
+    status = 0
+    cwd = os.getcwd()
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try:
+            os.chdir(request['cwd'])
+            args = make_parser().parse_args(request['argv'])
+            args.func(args)
+        except SystemExit as e:  # with the status sys.exit would give
+            if e.code is None or isinstance(e.code, int):
+                status = e.code or 0
+            else:
+                print(e.code, file=sys.stderr)
+                status = 1
+        except Exception:
+            print_exc()
+            status = 1
+        finally:
+            os.chdir(cwd)
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'status': status,
+            'latency': (time.perf_counter() - start) * 1000}
+
+
+def warm_up() -> None:
+    """import every action, configure the mappers, read the item table into the page cache and refresh the
+    search snapshot"""
+    from importlib import import_module
+    from sqlalchemy import text
+    from sqlalchemy.orm import configure_mappers
+    for module in ('.actions.main', '.actions.store_paper'):
+        import_module(module, __package__)
+    from .entry.main import engine
+    configure_mappers()
+    with engine.connect() as conn:
+        conn.execute(text('SELECT count(*) FROM item')).scalar()
+    from .entry.snapshot import build_snapshot, get_snapshot_path, refresh_snapshot
+    if path.isfile(get_snapshot_path()):
+        refresh_snapshot()
+    else:
+        build_snapshot()
+
+
+def make_server(socket_path: str):
+    """a server answering requests on socket_path, one at a time"""
+    from socketserver import UnixStreamServer, StreamRequestHandler
+
+    class Handler(StreamRequestHandler):
+        def handle(self):
+            request = _receive(self.connection)
+            response = run_request(request)
+            self.wfile.write(json.dumps(response).encode('utf-8'))
+            print('{0}: {1} ({2:.1f} ms)'.format(' '.join(request['argv']), response['status'],
+                                                 response['latency']), flush=True)
+
+    return UnixStreamServer(socket_path, Handler)
+
+
+def serve(_):
+    from signal import signal, SIGTERM
+    if not hasattr(socket, 'AF_UNIX'):
+        raise NotImplementedError("bibdb serve needs unix sockets")
+    socket_path = get_socket_path()
+    if path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            try:
+                conn.connect(socket_path)
+                raise OSError('a server is already listening on ' + socket_path)
+            except ConnectionRefusedError:
+                os.remove(socket_path)  # left over from a server that died
+    warm_up()
+    server = make_server(socket_path)
+    print('serving on ' + socket_path, flush=True)
+    signal(SIGTERM, lambda *_: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
@@ -0,0 +1,30 @@
+# bash completion for bibdb, zsh users can load it after `autoload bashcompinit && bashcompinit`
+# source this file, e.g. from ~/.bashrc: source /path/to/bibdb/data/completion.bash
+_bibdb() {
+    local cur command
+    cur="${COMP_WORDS[COMP_CWORD]}"
+    command="${COMP_WORDS[1]}"
+    if [ "$COMP_CWORD" -eq 1 ]; then
+        COMPREPLY=($(compgen -W "s o a d u k watch pending notes sync stats dedupe check relocate init snapshot complete serve" -- "$cur"))
+        return
+    fi
+    case "$command" in
+        o|k|d|u)
+            if [[ "$cur" == -* ]]; then
+                return
+            fi
+            local head="" prefix="$cur"
+            if [[ "$command" == u || "$command" == d ]] && [[ "$cur" == *,* ]]; then
+                head="${cur%,*},"
+                prefix="${cur##*,}"
+            fi
+            local ids
+            ids=$(bibdb complete -n 200 -- "$prefix" 2>/dev/null)
+            COMPREPLY=($(compgen -P "$head" -W "$ids" -- "$prefix"))
+            if [ "$command" = u ] || [ "$command" = d ]; then
+                COMPREPLY+=($(compgen -f -- "$cur"))
+            fi
+            ;;
+    esac
+}
+complete -F _bibdb bibdb
@@ -4,7 +4,7 @@ from io import BufferedIOBase, TextIOWrapper
 from os.path import isfile
 from typing import Dict, Union
 
-from ..config import config
+from ..database import get_database
 
 CREATE = 'CREATE VIRTUAL TABLE "journal" USING fts4("name", "abbr", "abbr_no_dot");'
 SEARCH = 'SELECT * FROM journal WHERE journal MATCH ? ORDER BY LENGTH(name)'
@@ -13,7 +13,7 @@ SEARCH = 'SELECT * FROM journal WHERE journal MATCH ? ORDER BY LENGTH(name)'
 def add_journals(file_name: Union[str, BufferedIOBase]) -> None:
     fp = open(file_name, 'r') if isinstance(file_name, str) else TextIOWrapper(file_name, 'utf-8')
     new_journals = (line.split('\t') for line in fp)
-    database_path = config['path']['journal_db']
+    database_path = get_database().journal_path
     if not isfile(database_path):
         conn = sql.connect(database_path)
         conn.cursor().execute(CREATE)
@@ -28,7 +28,7 @@ def add_journals(file_name: Union[str, BufferedIOBase]) -> None:
 
 
 def search_journal(query: str) -> Union[Dict[str, str], None]:
-    database_path = config['path']['journal_db']
+    database_path = get_database().journal_path
     conn = sql.connect(database_path)
     journal = conn.cursor().execute(SEARCH, (query, )).fetchone()
     if journal is None:
@@ -0,0 +1,88 @@
+"""The databases bibdb works on: the library with its engine and sessions, and the journal names database. By
+default both come from the config file, on first use. use_database points the code running in the current context,
+like a test or one request of the server, at another library, a file in a temporary folder or a database in memory,
+without changing the config or any module global. Modules import entry.main.engine and entry.main.Session once;
+both look up the current database every time they are used. Threads start from an empty context, so worker threads
+see the default database unless they are given the context."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import path
+from typing import Dict, Iterator, Optional
+
+from .config import config
+
+MEMORY = ':memory:'
+
+
+class Database(object):
+    """a library database and the journal database used with it. The engine is created on first use."""
+    def __init__(self, database_path: str = MEMORY, journal_path: Optional[str] = None, folder: Optional[str] = None,
+                 paths: Optional[Dict[str, str]] = None, **engine_args):
+        self.path = database_path
+        self.journal_path = journal_path
+        self._folder = folder
+        self._paths = paths if paths else dict()  # files placed elsewhere than next to the database
+        self._engine_args = engine_args
+        self._engine = None
+
+    @classmethod
+    def from_config(cls) -> 'Database':
+        return cls(config['path']['database'], config['path'].get('journal_db'), paths=config['path'])
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from sqlalchemy import create_engine
+            self._engine = create_engine('sqlite://' if self.path == MEMORY else 'sqlite:///' + self.path,
+                                         **self._engine_args)
+        return self._engine
+
+    def sibling(self, name: str, key: Optional[str] = None) -> str:
+        """path of a file kept next to the database, like the search snapshot or the completion index, unless
+        paths has one under key"""
+        if key in self._paths:
+            return self._paths[key]
+        if self._folder is not None:
+            return path.join(self._folder, name)
+        if self.path == MEMORY:
+            raise ValueError('a database in memory has no folder for ' + name + ', give one')
+        return path.join(path.dirname(self.path), name)
+
+    def dispose(self) -> None:
+        if self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+
+_current: ContextVar[Optional[Database]] = ContextVar('database', default=None)
+_default: Optional[Database] = None
+
+
+def get_database() -> Database:
+    """the database of the current context, else the one in the config file"""
+    global _default
+    database = _current.get()
+    if database is not None:
+        return database
+    if _default is None:
+        _default = Database.from_config()
+    return _default
+
+
+@contextmanager
+def use_database(database: Database) -> Iterator[Database]:
+    """work on database until the block ends. The caller disposes of it."""
+    token = _current.set(database)
+    try:
+        yield database
+    finally:
+        _current.reset(token)
+
+
+class CurrentEngine(object):
+    """stands for the engine of the current database"""
+    def __getattr__(self, name: str):
+        return getattr(get_database().engine, name)
+
+    def __repr__(self) -> str:
+        return 'CurrentEngine({0!r})'.format(get_database().path)
@@ -0,0 +1,367 @@
+"""Changeset log for syncing a library between machines without syncing the database file. sqlite triggers record
+every change to items, tags, authors, editors and files in the change_log table, in the same transaction as the
+change itself, keyed by natural keys (item id, keyword text, person name, file name) rather than row ids, which
+differ between machines. A sync appends the new local records to this machine's own append-only file in the
+shared folder, and replays the records other machines appended since the last sync. Replay is last writer wins per
+field: a record is applied only when it is newer than every record already seen for the same field, so records can
+arrive in any order and more than once. Of the records exported or replayed only the newest of each field is kept,
+which is all the replay compares against. Syncing is off until path.changes is set in the config."""
+import json
+import os
+import socket
+from os import path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Column, Float, Index, Integer, String, Table, delete, insert, select, text, update
+
+from .file_object import file_table
+from .main import ItemBase, Journal, Keyword, Person, authorship, editorship, item_table, keyword_assoc, config
+
+change_log_table = Table('change_log', ItemBase.metadata,
+                         Column('seq', Integer, primary_key=True, autoincrement=True),
+                         Column('stamp', Float, nullable=False),
+                         Column('machine', String),  # None for changes made here
+                         Column('kind', String, nullable=False),
+                         Column('key', String, nullable=False),
+                         Column('field', String),  # None for the existence of the row
+                         Column('value', String),
+                         Index('ix_change_log_target', 'kind', 'key', 'field', 'stamp'),
+                         sqlite_autoincrement=True)
+sync_state_table = Table('sync_state', ItemBase.metadata,
+                         Column('name', String, primary_key=True),
+                         Column('position', Integer, nullable=False))
+# triggers stay silent while a row is in this table, so replayed changes are not logged as local ones
+sync_replay_table = Table('sync_replay', ItemBase.metadata, Column('active', Integer, primary_key=True))
+
+NOW = "(julianday('now') - 2440587.5) * 86400.0"
+GUARD = "WHEN NOT EXISTS (SELECT 1 FROM sync_replay)"
+ITEM_COLUMNS = [column.name for column in item_table.columns if column.name != 'id']
+person_table, keyword_table, journal_table = Person.__table__, Keyword.__table__, Journal.__table__
+PERSON_LINKS = {'author': authorship, 'editor': editorship}
+
+
+class Record(NamedTuple):
+    stamp: float
+    machine: str
+    kind: str  # item, tag, author, editor or file
+    key: list
+    field: Optional[str]
+    value: object
+
+
+class SyncResult(NamedTuple):
+    sent: int
+    received: int
+    applied: int
+
+
+def _field(column: str) -> str:
+    return 'journal' if column == 'journal_id' else column
+
+
+def _item_value(row: str, column: str) -> str:
+    if column == 'journal_id':
+        return '(SELECT name FROM journal WHERE id = {0}.journal_id)'.format(row)
+    return '{0}."{1}"'.format(row, column)
+
+
+def _item_row(row: str) -> str:
+    return 'json_object({0})'.format(', '.join("'{0}', {1}".format(_field(x), _item_value(row, x))
+                                                 for x in ITEM_COLUMNS))
+
+
+def _person_key(row: str) -> str:
+    return 'json_array({0}.item_id, (SELECT last_name FROM person WHERE id = {0}.person_id), ' \
+           '(SELECT first_name FROM person WHERE id = {0}.person_id))'.format(row)
+
+
+def _person_value(row: str) -> str:
+    return "json_object('order', {0}.\"order\", 'note', {0}.note)".format(row)
+
+
+# kind: (table, key expression, value expression) for tables whose rows are only added or removed
+LINKS = {'tag': ('association', lambda row: 'json_array({0}.item_id, (SELECT text FROM keyword WHERE id = '
+                                            '{0}.keyword_id))'.format(row), lambda row: "'true'"),
+         'author': ('authorship', _person_key, _person_value),
+         'editor': ('editorship', _person_key, _person_value),
+         'file': ('file', lambda row: 'json_array({0}.object_type, {0}.name)'.format(row),
+                  lambda row: "json_object('item_id', {0}.item_id, 'note', {0}.note)".format(row))}
+
+
+def _log(kind: str, key: str, field: str, value: str, source: str = '') -> str:
+    return 'INSERT INTO change_log (stamp, kind, key, field, value) SELECT {0}, \'{1}\', {2}, {3}, {4}{5};'.format(
+        NOW, kind, key, field, value, ' FROM ' + source if source else '')
+
+
+def _trigger(name: str, event: str, table: str, body: List[str]) -> str:
+    return 'CREATE TRIGGER IF NOT EXISTS changelog_{0} AFTER {1} ON {2} {3} BEGIN\n{4}\nEND'.format(
+        name, event, table, GUARD, '\n'.join(body))
+
+
+def make_triggers() -> List[str]:
+    field_changes = ' UNION ALL '.join(
+        "SELECT '{0}' AS field, json_quote({1}) AS value WHERE NEW.\"{2}\" IS NOT OLD.\"{2}\"".format(
+            _field(x), _item_value('NEW', x), x) for x in ITEM_COLUMNS)
+    triggers = [
+        _trigger('item_insert', 'INSERT', 'item', [_log('item', 'json_array(NEW.id)', 'NULL', _item_row('NEW'))]),
+        _trigger('item_update', 'UPDATE', 'item', [_log('item', 'json_array(NEW.id)', 'field', 'value',
+                                                        '(' + field_changes + ')')]),
+        _trigger('item_delete', 'DELETE', 'item', [_log('item', 'json_array(OLD.id)', 'NULL', "'null'")])]
+    for kind, (table, key, value) in LINKS.items():
+        triggers.append(_trigger(kind + '_insert', 'INSERT', table, [_log(kind, key('NEW'), 'NULL', value('NEW'))]))
+        triggers.append(_trigger(kind + '_delete', 'DELETE', table, [_log(kind, key('OLD'), 'NULL', "'null'")]))
+        triggers.append(_trigger(kind + '_update', 'UPDATE', table, [_log(kind, key('OLD'), 'NULL', "'null'"),
+                                                                     _log(kind, key('NEW'), 'NULL', value('NEW'))]))
+    # a renamed keyword or person changes the natural key of every row linked to it
+    triggers.append(_trigger('keyword_update', 'UPDATE OF text', 'keyword', [
+        _log('tag', 'json_array(item_id, OLD.text)', 'NULL', "'null'", 'association WHERE keyword_id = NEW.id'),
+        _log('tag', 'json_array(item_id, NEW.text)', 'NULL', "'true'", 'association WHERE keyword_id = NEW.id')]))
+    person_body = list()
+    for kind, table in PERSON_LINKS.items():
+        source = '{0} WHERE person_id = NEW.id'.format(table.name)
+        person_body.append(_log(kind, 'json_array(item_id, OLD.last_name, OLD.first_name)', 'NULL', "'null'", source))
+        person_body.append(_log(kind, 'json_array(item_id, NEW.last_name, NEW.first_name)', 'NULL',
+                                _person_value(table.name), source))
+    triggers.append(_trigger('person_update', 'UPDATE OF last_name, first_name', 'person', person_body))
+    return triggers
+
+
+def ensure_changelog(conn) -> None:
+    """create the log tables and triggers. When the triggers are new, the library as it is becomes the first
+    records of the log, so a machine starting from an empty database can rebuild it from the log alone."""
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'changelog_item_delete'")) \
+            .first():
+        return
+    for table in (change_log_table, sync_state_table, sync_replay_table):
+        table.create(conn, checkfirst=True)
+    conn.execute(text(_log('item', 'json_array(item.id)', 'NULL', _item_row('item'), 'item')))
+    for kind, (table, key, value) in LINKS.items():
+        conn.execute(text(_log(kind, key(table), 'NULL', value(table), table)))
+    for trigger in make_triggers():
+        conn.execute(text(trigger))
+
+
+def get_changes_folder() -> Optional[str]:
+    return path.expanduser(config['path']['changes']) if 'changes' in config['path'] else None
+
+
+def machine_name() -> str:
+    return config.get('machine', socket.gethostname())
+
+
+def _position(conn, name: str) -> int:
+    return conn.execute(select(sync_state_table.c.position).where(sync_state_table.c.name == name)).scalar() or 0
+
+
+def _set_position(conn, name: str, position: int) -> None:
+    conn.execute(delete(sync_state_table).where(sync_state_table.c.name == name))
+    conn.execute(insert(sync_state_table).values(name=name, position=position))
+
+
+def _compact(row) -> object:
+    """the value of a log row, without the empty fields of a new item"""
+    value = json.loads(row.value)
+    if row.kind == 'item' and row.field is None and value is not None:
+        return {field: x for field, x in value.items() if x is not None}
+    return value
+
+
+def export_changes(conn, folder: str, machine: str) -> int:
+    """append the local records not yet exported to the machine's log file, returns their number"""
+    exported = _position(conn, 'exported')
+    rows = conn.execute(select(change_log_table).where(change_log_table.c.machine.is_(None),
+                                                       change_log_table.c.seq > exported)
+                        .order_by(change_log_table.c.seq)).all()
+    if not rows:
+        return 0
+    os.makedirs(folder, exist_ok=True)
+    with open(path.join(folder, machine + '.jsonl'), 'a', encoding='utf-8') as fp:
+        fp.writelines(json.dumps([row.stamp, machine, row.kind, json.loads(row.key), row.field,
+                                  _compact(row)], separators=(',', ':'), ensure_ascii=False) + '\n' for row in rows)
+        fp.flush()
+        os.fsync(fp.fileno())
+    _set_position(conn, 'exported', rows[-1].seq)
+    return len(rows)
+
+
+def prune_log(conn) -> int:
+    """drop the records of a field that a newer record of the same field supersedes, except local records not
+    exported yet. Returns the number dropped."""
+    return conn.execute(text(
+        'DELETE FROM change_log WHERE (machine IS NOT NULL OR seq <= :exported) AND EXISTS ('
+        'SELECT 1 FROM change_log AS newer WHERE newer.kind = change_log.kind AND newer.key = change_log.key '
+        'AND newer.field IS change_log.field AND newer.stamp > change_log.stamp)'),
+        {'exported': _position(conn, 'exported')}).rowcount
+
+
+def read_new(log_path: str, offset: int) -> Tuple[List[Record], int]:
+    """complete records appended after offset, and the offset after them. A last line the sync client has not
+    finished writing is left for next time; a file shorter than offset was replaced, and is read again."""
+    with open(log_path, 'rb') as fp:
+        fp.seek(0, os.SEEK_END)
+        if fp.tell() < offset:
+            offset = 0
+        fp.seek(offset)
+        data = fp.read()
+    end = data.rfind(b'\n') + 1
+    records = [Record(*json.loads(line)) for line in data[0: end].splitlines() if line.strip()]
+    return records, offset + end
+
+
+class Replayer(object):
+    """applies remote records through one connection, inside the caller's transaction"""
+    def __init__(self, conn, machine: str):
+        self.conn = conn
+        self.machine = machine
+        self.items_changed = False
+
+    def _latest(self, kind: str, key: str, fields: Tuple[Optional[str], ...]) -> Tuple[float, str]:
+        log = change_log_table.c
+        latest = (0.0, '')
+        for field in fields:
+            row = self.conn.execute(select(log.stamp, log.machine).where(
+                log.kind == kind, log.key == key, log.field.is_(None) if field is None else log.field == field)
+                .order_by(log.stamp.desc()).limit(1)).first()
+            if row is not None:
+                latest = max(latest, (row.stamp, row.machine or self.machine))
+        return latest
+
+    def _store(self, record: Record, key: str, field: Optional[str], value) -> None:
+        self.conn.execute(insert(change_log_table).values(
+            stamp=record.stamp, machine=record.machine, kind=record.kind, key=key, field=field,
+            value=json.dumps(value, ensure_ascii=False)))
+
+    def apply(self, record: Record) -> bool:
+        """apply a record unless something newer was seen for its field, returns whether it was applied. Records of
+        one statement share a stamp and are applied in their order, so an equal stamp does not stop a record."""
+        if None in record.key[0: 2]:
+            return False
+        key = json.dumps(record.key, separators=(',', ':'), ensure_ascii=False)
+        if record.kind == 'item':
+            return self._apply_item(record, key)
+        if (record.stamp, record.machine) < self._latest(record.kind, key, (None,)):
+            return False
+        if record.kind == 'tag':
+            self._apply_tag(*record.key, record.value)
+        elif record.kind in PERSON_LINKS:
+            self._apply_person(PERSON_LINKS[record.kind], *record.key, record.value)
+        elif record.kind == 'file':
+            if not self._apply_file(*record.key, record.value):
+                return False
+        else:
+            return False
+        self._store(record, key, None, record.value)
+        return True
+
+    def _has_item(self, item_id: str) -> bool:
+        return self.conn.execute(select(item_table.c.id).where(item_table.c.id == item_id)).first() is not None
+
+    def _columns(self, values: Dict) -> Dict:
+        """item fields of a record to item columns, the journal looked up or added by name"""
+        columns = {x: values[_field(x)] for x in ITEM_COLUMNS if _field(x) in values}
+        if columns.get('journal_id') is not None:
+            name = columns['journal_id']
+            columns['journal_id'] = self.conn.execute(select(journal_table.c.id)
+                                                      .where(journal_table.c.name == name)).scalar()
+            if columns['journal_id'] is None:
+                columns['journal_id'] = self.conn.execute(insert(journal_table).values(name=name)) \
+                    .inserted_primary_key[0]
+        return columns
+
+    def _apply_item(self, record: Record, key: str) -> bool:
+        item_id = record.key[0]
+        stamp = (record.stamp, record.machine)
+        exists = self._has_item(item_id)
+        if record.field is not None:
+            if not exists or stamp < self._latest('item', key, (None, record.field)):
+                return False
+            self.conn.execute(update(item_table).where(item_table.c.id == item_id)
+                              .values(**self._columns({record.field: record.value})))
+        elif stamp < self._latest('item', key, (None,)):
+            return False
+        elif record.value is None:
+            for table in (keyword_assoc, authorship, editorship, file_table):
+                self.conn.execute(delete(table).where(table.c.item_id == item_id))
+            self.conn.execute(delete(item_table).where(item_table.c.id == item_id))
+        elif exists:  # created here too: take the fields nobody changed since
+            newer = {field: value for field, value in record.value.items()
+                     if stamp >= self._latest('item', key, (field,))}
+            if newer:
+                self.conn.execute(update(item_table).where(item_table.c.id == item_id).values(**self._columns(newer)))
+        elif self.conn.execute(select(item_table.c.id).where(item_table.c.title == record.value.get('title'))).first():
+            return False  # the same paper under another id
+        else:
+            self.conn.execute(insert(item_table).values(id=item_id, **self._columns(record.value)))
+        self._store(record, key, record.field, record.value)
+        self.items_changed = True
+        return True
+
+    def _apply_tag(self, item_id: str, name: str, value) -> None:
+        keyword_id = self.conn.execute(select(keyword_table.c.id).where(keyword_table.c.text == name)).scalar()
+        if value is None:
+            if keyword_id is not None:
+                self.conn.execute(delete(keyword_assoc).where(keyword_assoc.c.item_id == item_id,
+                                                              keyword_assoc.c.keyword_id == keyword_id))
+            return
+        if not self._has_item(item_id):
+            return
+        if keyword_id is None:
+            keyword_id = self.conn.execute(insert(keyword_table).values(text=name)).inserted_primary_key[0]
+        if self.conn.execute(select(keyword_assoc.c.item_id).where(keyword_assoc.c.item_id == item_id,
+                                                                   keyword_assoc.c.keyword_id == keyword_id)) \
+                .first() is None:
+            self.conn.execute(insert(keyword_assoc).values(item_id=item_id, keyword_id=keyword_id))
+
+    def _apply_person(self, table: Table, item_id: str, last_name: str, first_name: Optional[str], value) -> None:
+        name = (person_table.c.last_name == last_name, person_table.c.first_name.is_(None) if first_name is None
+                else person_table.c.first_name == first_name)
+        person_id = self.conn.execute(select(person_table.c.id).where(*name)).scalar()
+        if person_id is not None:
+            self.conn.execute(delete(table).where(table.c.item_id == item_id, table.c.person_id == person_id))
+        if value is None or not self._has_item(item_id):
+            return
+        if person_id is None:
+            person_id = self.conn.execute(insert(person_table).values(last_name=last_name, first_name=first_name)) \
+                .inserted_primary_key[0]
+        self.conn.execute(delete(table).where(table.c.item_id == item_id, table.c.order == value['order']))
+        self.conn.execute(insert(table).values(item_id=item_id, person_id=person_id, **value))
+
+    def _apply_file(self, object_type: str, name: str, value) -> bool:
+        self.conn.execute(delete(file_table).where(file_table.c.object_type == object_type,
+                                                   file_table.c.name == name))
+        if value is None:
+            return True
+        if not self._has_item(value['item_id']):
+            return False
+        self.conn.execute(insert(file_table).values(object_type=object_type, name=name, **value))
+        return True
+
+
+def import_changes(conn, folder: str, machine: str) -> Tuple[int, int, bool]:
+    """replay what other machines appended since the last sync, oldest first. Returns the number of records read
+    and applied, and whether any item changed."""
+    offsets, records = dict(), list()
+    for entry in sorted(os.listdir(folder)) if path.isdir(folder) else list():
+        source = entry[0: -len('.jsonl')]
+        if not entry.endswith('.jsonl') or source == machine:
+            continue
+        new, offsets[source] = read_new(path.join(folder, entry), _position(conn, 'read:' + source))
+        records.extend(new)
+    records.sort(key=lambda x: (x.stamp, x.machine))
+    replayer = Replayer(conn, machine)
+    conn.execute(insert(sync_replay_table).values(active=1))
+    applied = sum(1 for record in records if replayer.apply(record))
+    conn.execute(delete(sync_replay_table))
+    for source, offset in offsets.items():
+        _set_position(conn, 'read:' + source, offset)
+    return len(records), applied, replayer.items_changed
+
+
+def sync(conn, folder: str, machine: Optional[str] = None) -> Tuple[SyncResult, bool]:
+    """export, import, then prune the log, in the caller's transaction"""
+    machine = machine if machine else machine_name()
+    ensure_changelog(conn)
+    sent = export_changes(conn, folder, machine)
+    received, applied, items_changed = import_changes(conn, folder, machine)
+    prune_log(conn)
+    return SyncResult(sent, received, applied), items_changed
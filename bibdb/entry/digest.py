@@ -0,0 +1,140 @@
+"""Content hashes of the pdf files, kept in their own table next to the file table. A hash is recomputed only when
+the size or modification time of its file changes. Files are stat'ed and hashed in a thread pool; hashlib releases
+the GIL on large buffers, so threads overlap both the disk reads and the hashing. A pdf stored by bibdb is indexed
+when it is committed; the pdfs of a library older than the index are hashed once by bibdb dedupe. A lookup of a
+content only reads the index."""
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from os import path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Column, Float, ForeignKey, Integer, String, Table, delete, func, insert, select
+from sqlalchemy.event import listens_for
+
+from .file_object import PdfFile, file_table
+from .main import ItemBase, Session, config
+
+CHUNK_SIZE = 1 << 20
+
+file_hash_table = Table('file_hash', ItemBase.metadata,
+                        Column('file_id', Integer, ForeignKey('file.id'), primary_key=True),
+                        Column('size', Integer, nullable=False),
+                        Column('mtime', Float, nullable=False),
+                        Column('digest', String(64), nullable=False, index=True))
+
+
+class Content(NamedTuple):
+    size: int
+    mtime: float
+    digest: str
+
+
+class RefreshResult(NamedTuple):
+    hashed: int
+    unchanged: int
+    missing: List[Tuple[int, str]]
+
+
+def hash_file(file_path: str) -> Content:
+    """sha256 of the file, streamed in CHUNK_SIZE reads into one buffer, with the size and mtime it was read at"""
+    digest = hashlib.sha256()
+    buf = bytearray(CHUNK_SIZE)
+    view = memoryview(buf)
+    with open(file_path, 'rb', buffering=0) as fp:
+        stat = os.fstat(fp.fileno())
+        while True:
+            length = fp.readinto(buf)
+            if not length:
+                break
+            digest.update(view[0: length])
+    return Content(stat.st_size, stat.st_mtime, digest.hexdigest())
+
+
+def pdf_path(name: str) -> str:
+    return path.join(path.expanduser(config['files']['pdf']['folder']), name + config['files']['pdf']['extension'])
+
+
+def ensure_table(conn) -> None:
+    """libraries created before the hash index lack its table"""
+    file_hash_table.create(conn, checkfirst=True)
+
+
+def _check(file_path: str, known: Optional[Content]) -> Optional[Content]:
+    """known when size and mtime are unchanged, a fresh hash otherwise, None when the file is gone"""
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    if known is not None and known.size == stat.st_size and known.mtime == stat.st_mtime:
+        return known
+    return hash_file(file_path)
+
+
+def refresh(conn, workers: Optional[int] = None) -> RefreshResult:
+    """bring the hash of every registered pdf up to date, in one transaction on conn"""
+    ensure_table(conn)
+    files = conn.execute(select(file_table.c.id, file_table.c.name).where(file_table.c.object_type == 'pdf')).all()
+    known = {row.file_id: Content(row.size, row.mtime, row.digest) for row in conn.execute(select(file_hash_table))}
+    with ThreadPoolExecutor(workers) as executor:
+        contents = list(executor.map(lambda row: _check(pdf_path(row.name), known.get(row.id)), files))
+    changed: Dict[int, Content] = dict()
+    missing: List[Tuple[int, str]] = list()
+    for (file_id, name), content in zip(files, contents):
+        if content is None:
+            missing.append((file_id, name))
+        elif content is not known.get(file_id):
+            changed[file_id] = content
+    stale = set(known) - {file_id for file_id, _ in files} | {file_id for file_id, _ in missing} | set(changed)
+    if stale:
+        conn.execute(delete(file_hash_table).where(file_hash_table.c.file_id.in_(stale)))
+    if changed:
+        conn.execute(insert(file_hash_table), [{'file_id': file_id, **content._asdict()}
+                                               for file_id, content in changed.items()])
+    return RefreshResult(len(changed), len(files) - len(changed) - len(missing), missing)
+
+
+def find_digest(conn, content: Content) -> List[Tuple[str, str]]:
+    """(item id, file name) of the registered pdfs with this content, from the hash index alone. Only reads, so a
+    store asking questions after the lookup does not hold the write lock; the index of its pdf is written when it
+    commits."""
+    if not conn.dialect.has_table(conn, file_hash_table.name):
+        return list()
+    return [tuple(row) for row in conn.execute(
+        select(file_table.c.item_id, file_table.c.name)
+        .join(file_hash_table, file_hash_table.c.file_id == file_table.c.id)
+        .where(file_hash_table.c.digest == content.digest))]
+
+
+def count_unindexed(conn) -> int:
+    """registered pdfs missing from the hash index, which a lookup can not find until bibdb dedupe hashes them"""
+    criteria = [file_table.c.object_type == 'pdf']
+    if conn.dialect.has_table(conn, file_hash_table.name):
+        criteria.append(file_table.c.id.not_in(select(file_hash_table.c.file_id)))
+    return conn.execute(select(func.count()).select_from(file_table).where(*criteria)).scalar()
+
+
+def duplicate_groups(conn) -> Iterable[Tuple[str, List[Tuple[str, str]]]]:
+    """(digest, [(item id, file name)]) for every content registered more than once"""
+    shared = select(file_hash_table.c.digest).group_by(file_hash_table.c.digest) \
+        .having(func.count() > 1).scalar_subquery()
+    rows = conn.execute(select(file_hash_table.c.digest, file_table.c.item_id, file_table.c.name)
+                        .join(file_table, file_hash_table.c.file_id == file_table.c.id)
+                        .where(file_hash_table.c.digest.in_(shared))
+                        .order_by(file_hash_table.c.digest, file_table.c.item_id))
+    for digest, group in groupby(rows, key=lambda row: row[0]):
+        yield digest, [(item_id, name) for _, item_id, name in group]
+
+
+@listens_for(Session, 'after_flush')
+def record_digest(session, _):
+    """index the content of new pdfs hashed by store_paper before they were moved into the library"""
+    rows = [{'file_id': obj.id, **obj.content._asdict()} for obj in session.new
+            if isinstance(obj, PdfFile) and getattr(obj, 'content', None) is not None]
+    if rows:
+        conn = session.connection()
+        ensure_table(conn)
+        conn.execute(delete(file_hash_table).where(file_hash_table.c.file_id.in_([x['file_id'] for x in rows])))
+        conn.execute(insert(file_hash_table), rows)
+
@@ -0,0 +1,95 @@
+"""Keyword facets: how many papers carry each keyword, and how many carry each pair of keywords together. The counts
+live in two tables kept current by sqlite triggers on the association table, so orm flushes and the set-based
+statements of entry.keywords both update them, one row at a time, without a recount. Facets of a search result are
+counted on the fly from the association table."""
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, ForeignKey, Index, Integer, Table, desc, func, select, text
+
+from .keywords import ensure_unique_tags
+from .main import ItemBase, Keyword, keyword_assoc
+from .record import id_set
+
+keyword_table = Keyword.__table__
+keyword_count_table = Table('keyword_count', ItemBase.metadata,
+                            Column('keyword_id', Integer, ForeignKey('keyword.id'), primary_key=True),
+                            Column('count', Integer, nullable=False))
+keyword_pair_table = Table('keyword_pair', ItemBase.metadata,
+                           Column('first_id', Integer, ForeignKey('keyword.id'), primary_key=True),
+                           Column('second_id', Integer, ForeignKey('keyword.id'), primary_key=True),
+                           Column('count', Integer, nullable=False))
+assoc_item_index = Index('ix_association_item_id', keyword_assoc.c.item_id)
+
+TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS keyword_tagged AFTER INSERT ON association BEGIN
+    INSERT INTO keyword_count (keyword_id, count) VALUES (NEW.keyword_id, 1)
+        ON CONFLICT (keyword_id) DO UPDATE SET count = count + 1;
+    INSERT INTO keyword_pair (first_id, second_id, count)
+        SELECT min(NEW.keyword_id, keyword_id), max(NEW.keyword_id, keyword_id), 1 FROM association
+        WHERE item_id = NEW.item_id AND keyword_id != NEW.keyword_id
+        ON CONFLICT (first_id, second_id) DO UPDATE SET count = count + 1;
+END""",
+    """CREATE TRIGGER IF NOT EXISTS keyword_untagged AFTER DELETE ON association BEGIN
+    UPDATE keyword_count SET count = count - 1 WHERE keyword_id = OLD.keyword_id;
+    UPDATE keyword_pair SET count = count - 1
+        WHERE (first_id, second_id) IN (SELECT min(OLD.keyword_id, keyword_id), max(OLD.keyword_id, keyword_id)
+                                        FROM association WHERE item_id = OLD.item_id AND keyword_id != OLD.keyword_id);
+    DELETE FROM keyword_count WHERE keyword_id = OLD.keyword_id AND count <= 0;
+    DELETE FROM keyword_pair WHERE count <= 0 AND OLD.keyword_id IN (first_id, second_id);
+END""")
+
+Facet = Tuple[str, int]
+
+
+def ensure_facets(conn) -> None:
+    """create the count tables and their triggers, filling the tables from the association table when the triggers
+    are new. Run inside a transaction, so no tag slips in between the count and the triggers. Tags are made unique
+    first, a repeated tag would be counted twice."""
+    ensure_unique_tags(conn)
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'keyword_untagged'")).first():
+        return
+    for table in (keyword_count_table, keyword_pair_table):
+        table.create(conn, checkfirst=True)
+        conn.execute(table.delete())
+    assoc_item_index.create(conn, checkfirst=True)
+    conn.execute(keyword_count_table.insert().from_select(
+        ['keyword_id', 'count'], select(keyword_assoc.c.keyword_id, func.count())
+        .where(keyword_assoc.c.keyword_id.is_not(None)).group_by(keyword_assoc.c.keyword_id)))
+    first, second = keyword_assoc.alias(), keyword_assoc.alias()
+    conn.execute(keyword_pair_table.insert().from_select(
+        ['first_id', 'second_id', 'count'], select(first.c.keyword_id, second.c.keyword_id, func.count())
+        .join(second, first.c.item_id == second.c.item_id).where(first.c.keyword_id < second.c.keyword_id)
+        .group_by(first.c.keyword_id, second.c.keyword_id)))
+    for trigger in TRIGGERS:
+        conn.execute(text(trigger))
+
+
+def keyword_counts(conn, limit: Optional[int] = None) -> List[Facet]:
+    """every keyword with the number of papers carrying it, most common first"""
+    return [tuple(row) for row in conn.execute(
+        select(keyword_table.c.text, keyword_count_table.c.count)
+        .join(keyword_count_table, keyword_count_table.c.keyword_id == keyword_table.c.id)
+        .order_by(desc(keyword_count_table.c.count), keyword_table.c.text).limit(limit))]
+
+
+def co_occurring(conn, keyword: str, limit: Optional[int] = None) -> List[Facet]:
+    """keywords carried together with keyword, with the number of papers carrying both"""
+    keyword_id = conn.execute(select(keyword_table.c.id).where(keyword_table.c.text == keyword)).scalar()
+    if keyword_id is None:
+        return list()
+    pair = keyword_pair_table.c
+    other = func.iif(pair.first_id == keyword_id, pair.second_id, pair.first_id)
+    return [tuple(row) for row in conn.execute(
+        select(keyword_table.c.text, pair.count).join(keyword_table, keyword_table.c.id == other)
+        .where((pair.first_id == keyword_id) | (pair.second_id == keyword_id))
+        .order_by(desc(pair.count), keyword_table.c.text).limit(limit))]
+
+
+def result_facets(conn, item_ids: Sequence[str], limit: Optional[int] = None) -> List[Facet]:
+    """keyword counts among the given papers only"""
+    count = func.count().label('count')
+    with id_set(conn, item_ids) as ids:
+        return [tuple(row) for row in conn.execute(
+            select(keyword_table.c.text, count).join(keyword_assoc, keyword_assoc.c.keyword_id == keyword_table.c.id)
+            .where(keyword_assoc.c.item_id.in_(ids)).group_by(keyword_table.c.text)
+            .order_by(desc(count), keyword_table.c.text).limit(limit))]
@@ -1,6 +1,6 @@
-from typing import Optional
+from typing import List, Optional, Tuple
 import os
-from glob import glob
+from heapq import nsmallest
 from os import path, makedirs
 
 from sqlalchemy import Column, Integer, String, ForeignKey
@@ -24,27 +24,53 @@ class PdfError(ValueError):
     __str__ = __repr__
 
 
+def scan_folder(folder: str, extensions: List[str], number: Optional[int] = None) -> List[Tuple[str, str]]:
+    """(name, extension) of files in folder with one of the extensions, in a single pass over the folder.
+    Earlier extensions come first, then the most recently accessed files. Returns all when number is None."""
+    suffixes = tuple(extensions)
+    candidates = list()
+    with os.scandir(folder) as it:
+        for entry in it:
+            name = entry.name
+            if not name.endswith(suffixes) or name.startswith('.') or not entry.is_file():
+                continue
+            for rank, ext in enumerate(extensions):
+                if name.endswith(ext) and len(name) > len(ext):
+                    candidates.append((rank, -entry.stat().st_atime, name[0: -len(ext)], ext))
+                    break
+    best = sorted(candidates) if number is None else nsmallest(number, candidates)
+    return [(name, ext) for _, _, name, ext in best]
+
+
 class NewSearchable(object):
     _object_type = ''
     def __init__(self, file_name, folder, ext):
         raise NotImplementedError
 
     @classmethod
-    def find(cls, folder: Optional[str] = None):
+    def _folder(cls, folder: Optional[str] = None) -> str:
         if folder is None:
-            folder = path.expanduser(config['files'][cls._object_type]['folder'])
+            return path.expanduser(config['files'][cls._object_type]['folder'])
         elif not path.isdir(folder):
-            folder = path.expanduser(config['files'][folder]['folder'])
+            return path.expanduser(config['files'][folder]['folder'])
+        return folder
+
+    @classmethod
+    def find_all(cls, folder: Optional[str] = None, number: Optional[int] = None) -> list:
+        """the number most recent candidate files, or all of them"""
+        folder = cls._folder(folder)
         extension = config['files'][cls._object_type]['extension']
         if not isinstance(extension, list):
             extension = [extension]
-        for ext in extension:
-            file_list = glob(path.join(folder, '*' + ext))
-            if len(file_list) == 0:
-                continue
-            file_name = path.splitext(path.split(max(file_list, key=path.getatime))[1])[0]
-            return cls(file_name, folder, ext)
-        raise FileNotFoundError("No {0} file in {1}".format(cls._object_type, folder))
+        return [cls(file_name, folder, ext) for file_name, ext in scan_folder(folder, extension, number)]
+
+    @classmethod
+    def find(cls, folder: Optional[str] = None):
+        folder = cls._folder(folder)
+        found = cls.find_all(folder, 1)
+        if len(found) == 0:
+            raise FileNotFoundError("No {0} file in {1}".format(cls._object_type, folder))
+        return found[0]
 
 class ItemFile(ItemBase, NewSearchable):
     id = Column(Integer, primary_key=True)
@@ -89,8 +115,8 @@ class ItemFile(ItemBase, NewSearchable):
                                    stdout=devnull, stderr=devnull).pid
         print(('a {0} file is opened (pid: {1})'.format(self._object_type, pid)))
 
-    def move(self, new_folder: Optional[str] = None, new_name: Optional[str] = None) -> None:
-        """update name to new_name or move to new folder"""
+    def plan_move(self, new_folder: Optional[str] = None, new_name: Optional[str] = None) -> Tuple[str, str]:
+        """update name and folder without touching the file, returns the old and new path"""
         old_path = repr(self)
         if new_folder is not None:
             if new_folder in config['files']:
@@ -100,7 +126,11 @@ class ItemFile(ItemBase, NewSearchable):
             self.folder = new_folder
         if new_name:
             self.name = new_name
-        os.rename(old_path, repr(self))
+        return old_path, repr(self)
+
+    def move(self, new_folder: Optional[str] = None, new_name: Optional[str] = None) -> None:
+        """update name to new_name or move to new folder"""
+        os.rename(*self.plan_move(new_folder, new_name))
 
     def delete(self):
         os.remove(repr(self))
@@ -114,6 +144,9 @@ def delete_orphan_file(session, _):
         session.delete(file)
 
 
+file_table = ItemFile.__table__
+
+
 class PdfFile(ItemFile):
     __mapper_args__ = {'polymorphic_on': 'object_type', 'polymorphic_identity': 'pdf'}
     _object_type = 'pdf'
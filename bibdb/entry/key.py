@@ -0,0 +1,59 @@
+"""Citation keys: a base key of the first author's last name and the year, made unique by a suffix a, b, ... z, aa,
+ab ... The keys taken under a base are loaded in one query and tracked in memory, so a batch of entries allocates
+its keys without a query per collision."""
+from typing import Dict, Set
+
+from sqlalchemy import false, select, update
+
+from .main import item_table
+
+
+def suffix(number: int) -> str:
+    """'' for 0, then a to z, then aa, ab ..."""
+    letters = list()
+    while number > 0:
+        number, remainder = divmod(number - 1, 26)
+        letters.append(chr(ord('a') + remainder))
+    return ''.join(reversed(letters))
+
+
+def _escape_like(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class KeyAllocator(object):
+    """hands out item ids unique in the database and among the ids already handed out. Lives for one transaction:
+    the first allocation takes sqlite's write lock, so no other writer stores an item until the session commits or
+    rolls back, and the ids loaded after it stay valid."""
+    def __init__(self, session):
+        self.session = session
+        self.taken: Dict[str, Set[str]] = dict()
+        self._next: Dict[str, int] = dict()
+        self._locked = False
+
+    def lock(self) -> None:
+        """an update matching no row, which makes pysqlite begin the transaction and sqlite take the reserved lock"""
+        if not self._locked:
+            self.session.execute(update(item_table).where(false()).values(id=item_table.c.id))
+            self._locked = True
+
+    def _load(self, base: str) -> Set[str]:
+        taken = self.taken.get(base)
+        if taken is None:
+            self.lock()
+            rows = self.session.execute(select(item_table.c.id)
+                                        .where(item_table.c.id.like(_escape_like(base) + '%', escape='\\')))
+            taken = self.taken[base] = {item_id for item_id, in rows if item_id.startswith(base)}
+            self._next[base] = 0
+        return taken
+
+    def allocate(self, base: str) -> str:
+        """base itself when free, otherwise base with the first free suffix"""
+        taken = self._load(base)
+        number = self._next[base]
+        while base + suffix(number) in taken:
+            number += 1
+        key = base + suffix(number)
+        taken.add(key)
+        self._next[base] = number + 1
+        return key
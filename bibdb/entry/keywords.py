@@ -0,0 +1,92 @@
+"""Set-based keyword changes across many items. Each function runs a few statements on the keyword and association
+tables through a connection, inside the caller's transaction, instead of editing the keyword collection of each
+item through the orm."""
+from typing import Iterable, List, Sequence
+
+from sqlalchemy import delete, exists, func, insert, literal, select, text, true, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from .main import item_table, keyword_assoc, Keyword
+from .record import id_set
+
+keyword_table = Keyword.__table__
+pair_index = next(x for x in keyword_assoc.indexes if x.name == 'ux_association_pair')
+
+
+def ensure_unique_tags(conn) -> None:
+    """libraries created before the unique index on the association table get it, their repeated tags dropped"""
+    if conn.execute(text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+                    {'name': pair_index.name}).first():
+        return
+    conn.execute(text('DELETE FROM association WHERE rowid NOT IN '
+                      '(SELECT min(rowid) FROM association GROUP BY item_id, keyword_id)'))
+    pair_index.create(conn)
+
+
+def create_keywords(conn, names: Iterable[str]) -> None:
+    """keywords missing from the keyword table are added"""
+    names = sorted(set(names))
+    if names:
+        conn.execute(sqlite_insert(keyword_table).on_conflict_do_nothing(index_elements=['text']),
+                     [{'text': name} for name in names])
+
+
+def _keyword_ids(names: Iterable[str]):
+    return select(keyword_table.c.id).where(keyword_table.c.text.in_(list(names)))
+
+
+def add_keywords(conn, item_ids: Sequence[str], names: Iterable[str]) -> int:
+    """tag items with keywords, skipping pairs that already exist. Returns the number of new tags."""
+    names = set(names)
+    ensure_unique_tags(conn)
+    create_keywords(conn, names)
+    with id_set(conn, item_ids) as ids:
+        pairs = select(item_table.c.id, keyword_table.c.id).join_from(item_table, keyword_table, true()).where(
+            item_table.c.id.in_(ids), keyword_table.c.text.in_(list(names)),
+            ~exists().where(keyword_assoc.c.item_id == item_table.c.id,
+                            keyword_assoc.c.keyword_id == keyword_table.c.id))
+        return conn.execute(insert(keyword_assoc).from_select(['item_id', 'keyword_id'], pairs)).rowcount
+
+
+def remove_keywords(conn, item_ids: Sequence[str], names: Iterable[str]) -> int:
+    """returns the number of tags removed"""
+    with id_set(conn, item_ids) as ids:
+        return conn.execute(delete(keyword_assoc).where(keyword_assoc.c.item_id.in_(ids),
+                                                        keyword_assoc.c.keyword_id.in_(_keyword_ids(names)))).rowcount
+
+
+def merge_keywords(conn, target: str, sources: Iterable[str]) -> int:
+    """move every item of the source keywords to target, which is created if needed, and drop the sources.
+    Returns the number of items newly tagged with target."""
+    sources = set(sources) - {target}
+    create_keywords(conn, [target])
+    target_id = conn.execute(_keyword_ids([target])).scalar_one()
+    source_ids = conn.execute(_keyword_ids(sources)).scalars().all()
+    if not source_ids:
+        return 0
+    tagged = select(keyword_assoc.c.item_id).where(keyword_assoc.c.keyword_id == target_id)
+    moved = conn.execute(insert(keyword_assoc).from_select(
+        ['item_id', 'keyword_id'], select(keyword_assoc.c.item_id, literal(target_id)).distinct()
+        .where(keyword_assoc.c.keyword_id.in_(source_ids), keyword_assoc.c.item_id.not_in(tagged)))).rowcount
+    conn.execute(delete(keyword_assoc).where(keyword_assoc.c.keyword_id.in_(source_ids)))
+    conn.execute(delete(keyword_table).where(keyword_table.c.id.in_(source_ids)))
+    return moved
+
+
+def rename_keyword(conn, old: str, new: str) -> int:
+    """rename a keyword, merging it into new when new already exists. Returns the number of items renamed."""
+    if conn.execute(_keyword_ids([new])).first() is not None:
+        return merge_keywords(conn, new, [old])
+    count = conn.execute(select(func.count()).select_from(keyword_assoc)
+                         .where(keyword_assoc.c.keyword_id.in_(_keyword_ids([old])))).scalar_one()
+    conn.execute(update(keyword_table).where(keyword_table.c.text == old).values(text=new))
+    return count
+
+
+def drop_unused(conn) -> List[str]:
+    """delete keywords no item carries, returns their names"""
+    unused = ~exists().where(keyword_assoc.c.keyword_id == keyword_table.c.id)
+    names = conn.execute(select(keyword_table.c.text).where(unused)).scalars().all()
+    if names:
+        conn.execute(delete(keyword_table).where(unused))
+    return names
@@ -1,17 +1,27 @@
-from sqlalchemy import Column, Integer, String, UniqueConstraint, ForeignKey, Table
-from sqlalchemy import create_engine
+from sqlalchemy import Column, Index, Integer, String, UniqueConstraint, ForeignKey, Table
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, backref
+from sqlalchemy.event import listens_for
 
+from ..completion import make_record, first_person, update_index
 from ..config import config
+from ..database import CurrentEngine, get_database
 
 SMALL_TEXT = String(50)
 LARGE_TEXT = String(150)
 
-engine = create_engine('sqlite:///{}'.format(config['path']['database']), echo=False)
+
+class ContextSessionmaker(sessionmaker):
+    """sessions bound to the engine of the current database"""
+    def __call__(self, **local_kw):
+        local_kw.setdefault('bind', get_database().engine)
+        return super().__call__(**local_kw)
+
+
+engine = CurrentEngine()
 ItemBase = declarative_base()
-Session = sessionmaker(engine)
+Session = ContextSessionmaker()
 
 all_fields = {'booktitle': SMALL_TEXT, 'address': LARGE_TEXT, 'month': Integer, 'school': SMALL_TEXT,
               'institution': SMALL_TEXT, 'publisher': SMALL_TEXT, 'chapter': Integer, 'organization': SMALL_TEXT,
@@ -29,7 +39,8 @@ item_table = Table('item', ItemBase.metadata,
 
 keyword_assoc = Table('association', ItemBase.metadata,
                       Column('item_id', Integer, ForeignKey('item.id')),
-                      Column('keyword_id', Integer, ForeignKey('keyword.id')))
+                      Column('keyword_id', Integer, ForeignKey('keyword.id')),
+                      Index('ux_association_pair', 'item_id', 'keyword_id', unique=True))
 
 authorship = Table('authorship', ItemBase.metadata,
                    Column('item_id', SMALL_TEXT, ForeignKey("item.id"), primary_key=True),
@@ -196,3 +207,28 @@ item_types = {'article': Article, 'book': Book,
               'incollection': InCollection, 'inbook': InBook, 'phdthesis': PhdThesis,
               'misc': Misc}
 
+
+
+@listens_for(Session, 'after_flush')
+def track_completion(session, _):
+    """remember which items were added, changed or deleted, for the completion index"""
+    added, removed = session.info.setdefault('completion', (dict(), set()))
+    for obj in session.new | session.dirty:
+        if isinstance(obj, Item):
+            added[obj.id] = make_record(obj.id, first_person(obj), obj.year, obj.title)
+            removed.discard(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Item):
+            added.pop(obj.id, None)
+            removed.add(obj.id)
+
+
+@listens_for(Session, 'after_commit')
+def write_completion(session):
+    if 'completion' in session.info:
+        update_index(*session.info.pop('completion'))
+
+
+@listens_for(Session, 'after_soft_rollback')
+def drop_completion(session, _):
+    session.info.pop('completion', None)
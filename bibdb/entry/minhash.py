@@ -0,0 +1,166 @@
+"""Near-duplicate items, like the preprint and the published version of a paper, or titles differing in a subtitle
+or punctuation. Each item gets a MinHash signature of its features: character 4-grams of the normalized main title,
+the first author and the year. Signatures are made with one permutation hashing: every feature is hashed once into
+one of SIGNATURE_SIZE bins, and empty bins borrow from their right neighbour, so an item costs one hash per feature
+instead of one per feature and bin. Candidate pairs come from locality-sensitive hashing on bands of the signature,
+so the whole library is compared in near-linear time. Signatures are kept in the item_signature table along with
+the features they were made from, and only items whose features changed are hashed again."""
+import re
+import zlib
+from array import array
+from collections import defaultdict
+from itertools import combinations
+from operator import eq
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import Column, ForeignKey, LargeBinary, String, Table, delete, insert, select
+
+from .main import ItemBase, Person, authorship, item_table
+from ..utils import normalize
+
+SIGNATURE_SIZE = 64
+BAND_SIZE = 4  # 16 bands of 4 bins: pairs above about 0.5 similarity share a band
+MAX_BUCKET = 20  # items sharing a band with more than this many others are too generic to compare
+EMPTY = 0xffffffff
+person_table = Person.__table__
+word_regex = re.compile(r'[a-z0-9]+')
+subtitle_regex = re.compile(r'\s*(?::|\s-+\s|–|—|\?|\.\s)\s*')
+
+item_signature_table = Table('item_signature', ItemBase.metadata,
+                             Column('item_id', String, ForeignKey('item.id'), primary_key=True),
+                             Column('source', String, nullable=False),
+                             Column('signature', LargeBinary, nullable=False))
+
+
+class Similar(NamedTuple):
+    item_id: str
+    title: str
+    year: Optional[int]
+    similarity: float  # estimated jaccard similarity with the first item of the group
+
+
+class RefreshResult(NamedTuple):
+    hashed: int
+    unchanged: int
+
+
+def main_title(title: str) -> str:
+    """title without its subtitle, when the part before the subtitle has at least two words"""
+    head = subtitle_regex.split(title, 1)[0]
+    return head if len(word_regex.findall(normalize(head))) >= 2 else title
+
+
+def feature_source(title: Optional[str], author: Optional[str], year: Optional[int]) -> str:
+    """the normalized inputs of a signature, stored to tell when an item must be hashed again"""
+    return '|'.join((' '.join(word_regex.findall(normalize(main_title(title or '')))),
+                     ''.join(word_regex.findall(normalize(author or ''))), str(year or '')))
+
+
+def features(source: str) -> Set[str]:
+    title, author, year = source.split('|')
+    shingles = {title[i: i + 4] for i in range(max(1, len(title) - 3))}
+    # one feature for author and year together: alone, a year is shared by so many items that it fills the sparse
+    # signatures of short titles with the same values
+    return shingles | {'author:' + author, 'by:{0}:{1}'.format(author, year)}
+
+
+def make_signature(source: str) -> array:
+    signature = array('I', [EMPTY] * SIGNATURE_SIZE)
+    for feature in features(source):
+        value = zlib.crc32(feature.encode('utf-8'))
+        idx, value = value % SIGNATURE_SIZE, value // SIGNATURE_SIZE
+        if value < signature[idx]:
+            signature[idx] = value
+    # densify by rotation: an empty bin takes the next filled bin on its right, offset by the distance
+    filled = [x != EMPTY for x in signature]
+    if any(filled):
+        original = array('I', signature)
+        for idx in range(SIGNATURE_SIZE):
+            distance = 0
+            while not filled[(idx + distance) % SIGNATURE_SIZE]:
+                distance += 1
+            signature[idx] = original[(idx + distance) % SIGNATURE_SIZE] + distance * (EMPTY // SIGNATURE_SIZE + 1)
+    return signature
+
+
+def similarity(first: array, second: array) -> float:
+    return sum(map(eq, first, second)) / SIGNATURE_SIZE
+
+
+def _item_features(conn) -> Dict[str, Tuple[str, Optional[int], str]]:
+    """title, year and feature source of every item"""
+    first_authors: Dict[str, Tuple[int, str]] = dict()
+    for item_id, order, last_name in conn.execute(
+            select(authorship.c.item_id, authorship.c.order, person_table.c.last_name)
+            .join(person_table, authorship.c.person_id == person_table.c.id)):
+        if item_id not in first_authors or (order or 0) < first_authors[item_id][0]:
+            first_authors[item_id] = (order or 0, last_name)
+    return {item_id: (title, year, feature_source(title, first_authors.get(item_id, (0, None))[1], year))
+            for item_id, title, year in conn.execute(select(item_table.c.id, item_table.c.title, item_table.c.year))}
+
+
+def refresh(conn) -> Tuple[RefreshResult, Dict[str, array], Dict[str, Tuple[str, Optional[int], str]]]:
+    """bring the signatures up to date in the caller's transaction. Returns the counts, the signatures and the
+    title, year and source of each item."""
+    item_signature_table.create(conn, checkfirst=True)
+    items = _item_features(conn)
+    known = {item_id: (source, signature) for item_id, source, signature in conn.execute(select(item_signature_table))}
+    signatures: Dict[str, array] = dict()
+    changed = list()
+    for item_id, (_, _, source) in items.items():
+        if item_id in known and known[item_id][0] == source:
+            signatures[item_id] = array('I', known[item_id][1])
+        else:
+            signatures[item_id] = make_signature(source)
+            changed.append(item_id)
+    stale = [x for x in known if x not in items] + [x for x in changed if x in known]
+    if stale:
+        conn.execute(delete(item_signature_table).where(item_signature_table.c.item_id.in_(stale)))
+    if changed:
+        conn.execute(insert(item_signature_table), [
+            {'item_id': x, 'source': items[x][2], 'signature': signatures[x].tobytes()} for x in changed])
+    return RefreshResult(len(changed), len(items) - len(changed)), signatures, items
+
+
+def candidate_pairs(signatures: Dict[str, array]) -> Set[Tuple[str, str]]:
+    """pairs of items sharing all bins of at least one band"""
+    pairs: Set[Tuple[str, str]] = set()
+    raw = {item_id: signature.tobytes() for item_id, signature in signatures.items()}
+    width = BAND_SIZE * array('I').itemsize
+    for start in range(0, SIGNATURE_SIZE // BAND_SIZE * width, width):
+        buckets: Dict[bytes, List[str]] = defaultdict(list)
+        for item_id, signature in raw.items():
+            buckets[signature[start: start + width]].append(item_id)
+        for bucket in buckets.values():
+            if 1 < len(bucket) <= MAX_BUCKET:
+                pairs.update(combinations(sorted(bucket), 2))
+    return pairs
+
+
+def _groups(pairs: Iterable[Tuple[str, str]]) -> List[List[str]]:
+    """connected components of the pairs, by union-find"""
+    parent: Dict[str, str] = dict()
+
+    def find(x: str) -> str:
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for first, second in pairs:
+        parent[find(first)] = find(second)
+    groups: Dict[str, List[str]] = defaultdict(list)
+    for x in list(parent):
+        groups[find(x)].append(x)
+    return sorted(sorted(x) for x in groups.values())
+
+
+def similar_groups(conn, threshold: float = 0.7) -> Tuple[RefreshResult, List[List[Similar]]]:
+    """groups of items whose signatures agree on at least threshold of their bins"""
+    result, signatures, items = refresh(conn)
+    pairs = [x for x in candidate_pairs(signatures) if similarity(signatures[x[0]], signatures[x[1]]) >= threshold]
+    groups = list()
+    for group in _groups(pairs):
+        first = signatures[group[0]]
+        groups.append([Similar(x, items[x][0], items[x][1], similarity(first, signatures[x])) for x in group])
+    return result, groups
@@ -0,0 +1,122 @@
+"""Full-text index of the comment files, in an sqlite fts5 table of the library. The size and mtime each file had
+when it was read are kept beside it, and a refresh only reads the files whose size or mtime changed since. A
+refresh commits every batch_size files, so it can run in the background without holding the write lock for long,
+and an interrupted refresh keeps what it has done."""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import Column, Float, ForeignKey, Integer, Table, delete, insert, select, text
+
+from .file_object import file_table
+from .main import ItemBase, config, engine
+
+note_state_table = Table('note_state', ItemBase.metadata,
+                         Column('file_id', Integer, ForeignKey('file.id'), primary_key=True),
+                         Column('size', Integer, nullable=False),
+                         Column('mtime', Float, nullable=False))
+NOTE_LIMIT = 100
+CREATE_NOTE_TEXT = "CREATE VIRTUAL TABLE IF NOT EXISTS note_text USING " \
+                   "fts5(item_id UNINDEXED, body, tokenize='unicode61 remove_diacritics 2')"
+
+
+class RefreshResult(NamedTuple):
+    read: int
+    unchanged: int
+    removed: int
+
+
+class NoteHit(NamedTuple):
+    item_id: str
+    snippet: str
+
+
+def ensure_tables(conn) -> None:
+    note_state_table.create(conn, checkfirst=True)
+    conn.execute(text(CREATE_NOTE_TEXT))
+
+
+def comment_path(name: str) -> str:
+    extension = config['files']['comment']['extension']
+    return path.join(path.expanduser(config['files']['comment']['folder']),
+                     name + (extension[0] if isinstance(extension, list) else extension))
+
+
+def _stat(name: str) -> Optional[Tuple[int, float]]:
+    try:
+        stat = os.stat(comment_path(name))
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime
+
+
+def _read(name: str) -> str:
+    with open(comment_path(name), 'r', encoding='utf-8', errors='replace') as fp:
+        return fp.read()
+
+
+def _batches(values: List, size: int) -> Iterable[List]:
+    for start in range(0, len(values), size):
+        yield values[start: start + size]
+
+
+def refresh(workers: Optional[int] = None, batch_size: int = 500) -> RefreshResult:
+    """read the comment files that are new or changed, and drop the index of those gone"""
+    with engine.begin() as conn:
+        ensure_tables(conn)
+        files = conn.execute(select(file_table.c.id, file_table.c.item_id, file_table.c.name)
+                             .where(file_table.c.object_type == 'comment')).all()
+        known = {file_id: (size, mtime) for file_id, size, mtime in conn.execute(select(note_state_table))}
+    with ThreadPoolExecutor(workers) as executor:
+        stats = list(executor.map(_stat, (name for _, _, name in files)))
+        changed = [(row, stat) for row, stat in zip(files, stats) if stat is not None and known.get(row.id) != stat]
+        gone = set(known) - {row.id for row, stat in zip(files, stats) if stat is not None}
+        for batch in _batches(changed, batch_size):
+            bodies = list(executor.map(_read, (row.name for row, _ in batch)))
+            with engine.begin() as conn:
+                _write(conn, [(row, stat, body) for (row, stat), body in zip(batch, bodies)])
+    if gone:
+        with engine.begin() as conn:
+            for batch in _batches(sorted(gone), batch_size):
+                conn.execute(text('DELETE FROM note_text WHERE rowid IN ({0})'.format(','.join(map(str, batch)))))
+                conn.execute(delete(note_state_table).where(note_state_table.c.file_id.in_(batch)))
+    return RefreshResult(len(changed), len(files) - len(changed) - sum(1 for x in stats if x is None), len(gone))
+
+
+def _write(conn, rows: List[Tuple]) -> None:
+    file_ids = [row.id for row, _, _ in rows]
+    conn.execute(text('DELETE FROM note_text WHERE rowid IN ({0})'.format(','.join(map(str, file_ids)))))
+    conn.execute(delete(note_state_table).where(note_state_table.c.file_id.in_(file_ids)))
+    conn.execute(text('INSERT INTO note_text (rowid, item_id, body) VALUES (:file_id, :item_id, :body)'),
+                 [{'file_id': row.id, 'item_id': row.item_id, 'body': body} for row, _, body in rows])
+    conn.execute(insert(note_state_table), [{'file_id': row.id, 'size': stat[0], 'mtime': stat[1]}
+                                            for row, stat, _ in rows])
+
+
+def match_query(words: Iterable[str]) -> str:
+    """an fts5 query requiring every word, quoted so that punctuation is not read as query syntax. A trailing *
+    keeps its meaning of a prefix search."""
+    terms = list()
+    for word in words:
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append('"{0}"{1}'.format(word, '*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def search_notes(conn, words: Iterable[str], start: str = '[', end: str = ']',
+                 limit: Optional[int] = NOTE_LIMIT) -> List[NoteHit]:
+    """items whose comments contain every word, best match first, with a snippet around the words. With limit None
+    every match is returned, for a caller that intersects them with other criteria before limiting."""
+    query = match_query(words)
+    if not query or not conn.dialect.has_table(conn, 'note_text'):
+        return list()
+    rows = conn.execute(text("SELECT item_id, snippet(note_text, 1, :start, :end, '...', 12) FROM note_text "
+                             "WHERE note_text MATCH :query ORDER BY rank LIMIT :limit"),
+                        {'start': start, 'end': end, 'query': query, 'limit': -1 if limit is None else limit})
+    hits: Dict[str, NoteHit] = dict()
+    for item_id, snippet in rows:
+        hits.setdefault(item_id, NoteHit(item_id, ' '.join(snippet.split())))
+    return list(hits.values())
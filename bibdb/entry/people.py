@@ -0,0 +1,130 @@
+"""Duplicated persons: the same author stored under variants of a name, like "j", "j." and "john", or with and
+without accents. Persons are only compared within a block sharing the normalized last name and first initial, so
+the work grows with the size of the blocks instead of the square of the person table. A merge points the
+authorship and editorship rows of the variants at one person in a few set-based statements; orders are left as
+they are, so the (item_id, order) constraints hold."""
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from sqlalchemy import select, text, union_all
+
+from .main import Person, authorship, editorship
+from ..utils import normalize
+
+person_table = Person.__table__
+word_regex = re.compile(r'[a-z0-9]+')
+RELATIONS = (authorship, editorship)
+
+
+class Variant(NamedTuple):
+    id: int
+    last_name: str
+    first_name: Optional[str]
+    score: float
+
+
+class PersonGroup(NamedTuple):
+    target: Variant  # the most complete name, kept by a merge
+    variants: List[Variant]
+
+
+def name_words(name: Optional[str]) -> List[str]:
+    return word_regex.findall(normalize(name)) if name else list()
+
+
+def blocking_key(last_name: str, first_words: List[str]) -> str:
+    """normalized last name and first initial"""
+    return ''.join(name_words(last_name)) + ' ' + (first_words[0][0] if first_words else '')
+
+
+def name_score(full: List[str], other: List[str]) -> float:
+    """how likely two first names, as name_words, belong to one person. 1 for the same words; 0.9 when other
+    abbreviates full, like "j p" for "john paul"; 0.8 when one leaves out later names; 0 when they disagree."""
+    if full == other:
+        return 1.0
+    if not full or not other:
+        return 0.0
+    for word, short in zip(full, other):
+        if not (word.startswith(short) or short.startswith(word)):
+            return 0.0
+    if len(full) == len(other):
+        return 0.9
+    return 0.8
+
+
+def _items(conn, person_ids: Set[int]) -> Dict[int, Set[str]]:
+    """items each person authored or edited, read in one pass over both tables"""
+    items: Dict[int, Set[str]] = defaultdict(set)
+    rows = conn.execute(union_all(*(select(x.c.person_id, x.c.item_id) for x in RELATIONS)))
+    for person_id, item_id in rows:
+        if person_id in person_ids:
+            items[person_id].add(item_id)
+    return items
+
+
+def find_groups(conn) -> Tuple[List[PersonGroup], List[Variant]]:
+    """groups of persons that are likely one, and the persons matching several groups, left alone"""
+    blocks: Dict[str, List[Tuple[int, str, Optional[str], List[str]]]] = defaultdict(list)
+    known: Dict[Optional[str], List[str]] = dict()  # names repeat, normalize each once
+    for person_id, last_name, first_name in conn.execute(
+            select(person_table.c.id, person_table.c.last_name, person_table.c.first_name)):
+        words = known.get(first_name)
+        if words is None:
+            words = known[first_name] = name_words(first_name)
+        blocks[blocking_key(last_name, words)].append((person_id, last_name, first_name, words))
+    blocks = {key: members for key, members in blocks.items() if len(members) > 1}
+    items = _items(conn, {x[0] for members in blocks.values() for x in members})
+    groups, ambiguous = list(), list()
+    for key, members in sorted(blocks.items()):
+        # the most complete names first, so that each group is anchored on a full name
+        members.sort(key=lambda x: (-sum(len(w) for w in x[3]), -len(items[x[0]]), x[0]))
+        clusters: List[Tuple[List[str], Set[str], PersonGroup]] = list()  # anchor words, items, group
+        for person_id, last_name, first_name, words in members:
+            matches = list()
+            for cluster in clusters:
+                anchor, cluster_items, _ = cluster
+                if cluster_items & items[person_id]:  # two persons on one paper are two people
+                    continue
+                score = name_score(anchor, words)
+                if score > 0:
+                    matches.append((score, cluster))
+            if not matches:
+                group = PersonGroup(Variant(person_id, last_name, first_name, 1.0), list())
+                clusters.append((words, set(items[person_id]), group))
+            elif len(matches) == 1:
+                score, (_, cluster_items, group) = matches[0]
+                group.variants.append(Variant(person_id, last_name, first_name, score))
+                cluster_items.update(items[person_id])
+            else:
+                ambiguous.append(Variant(person_id, last_name, first_name, 0.0))
+        groups.extend(group for _, _, group in clusters if group.variants)
+    return groups, ambiguous
+
+
+def merge_persons(conn, pairs: Iterable[Tuple[int, int]]) -> Tuple[int, int]:
+    """point the rows of each (variant id, target id) pair at the target and drop the variants left without
+    rows. A row stays with its variant when the item already lists the target, or another variant of it.
+    Returns the number of rows moved and of persons dropped."""
+    pairs = list(pairs)
+    if not pairs:
+        return 0, 0
+    conn.execute(text('CREATE TEMPORARY TABLE IF NOT EXISTS person_merge '
+                      '(source_id INTEGER PRIMARY KEY, target_id INTEGER NOT NULL)'))
+    conn.execute(text('DELETE FROM person_merge'))
+    conn.exec_driver_sql('INSERT INTO person_merge (source_id, target_id) VALUES (?, ?)', pairs)
+    moved = 0
+    for relation in RELATIONS:
+        name = relation.name
+        moved += conn.execute(text(
+            'UPDATE {0} SET person_id = (SELECT target_id FROM person_merge WHERE source_id = {0}.person_id) '
+            'WHERE person_id IN (SELECT source_id FROM person_merge) AND NOT EXISTS ('
+            'SELECT 1 FROM {0} AS other LEFT JOIN person_merge AS m ON m.source_id = other.person_id '
+            'WHERE other.item_id = {0}.item_id AND other.person_id != {0}.person_id '
+            'AND coalesce(m.target_id, other.person_id) = '
+            '(SELECT target_id FROM person_merge WHERE source_id = {0}.person_id))'.format(name))).rowcount
+    dropped = conn.execute(text('DELETE FROM person WHERE id IN (SELECT source_id FROM person_merge) '
+                                'AND id NOT IN (SELECT person_id FROM authorship) '
+                                'AND id NOT IN (SELECT person_id FROM editorship)')).rowcount
+    conn.execute(text('DELETE FROM person_merge'))
+    return moved, dropped
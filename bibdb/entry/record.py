@@ -0,0 +1,170 @@
+"""Read only access to the library through sqlalchemy core, returning light weight records instead of orm
+objects. Records carry the same attribute names as the mapped classes, so the formatters take either."""
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Type
+
+from sqlalchemy import Column, MetaData, String, Table, delete, select, text
+from sqlalchemy.engine import Connection
+
+from .main import Item, Person, Journal, item_table, authorship, editorship, keyword_assoc, Keyword, all_fields,\
+    extra_fields
+
+person_table = Person.__table__
+journal_table = Journal.__table__
+keyword_table = Keyword.__table__
+# ids of a large lookup, in a temporary table of the connection so that they are joined instead of bound one by one
+requested_table = Table('requested_id', MetaData(), Column('id', String, primary_key=True), prefixes=['TEMPORARY'])
+BOUND_IDS = 500  # larger id lists go through requested_table
+
+
+class PersonRecord(NamedTuple):
+    id: int
+    last_name: str
+    first_name: str
+
+
+class JournalRecord(NamedTuple):
+    id: int
+    name: str
+    abbr: str
+    abbr_no_dot: str
+
+    def __str__(self):
+        return self.name
+
+
+class RelationRecord(NamedTuple):
+    """stands in for Authorship and Editorship"""
+    order: int
+    person: PersonRecord
+
+
+def _item_classes() -> Dict[str, Type[Item]]:
+    return {identity: mapper.class_ for identity, mapper in Item.__mapper__.polymorphic_map.items()}
+
+
+class ItemRecord(object):
+    item_columns = ('id', 'title', 'year', 'journal_id', *all_fields, *extra_fields)
+    __slots__ = item_columns + ('journal', 'authorship', 'editorship')
+    _classes: Dict[str, Type[Item]] = dict()
+
+    def __init__(self, row, journal: Optional[JournalRecord] = None):
+        """row holds the item_columns in order, extra values after them are ignored"""
+        for key, value in zip(self.item_columns, row):
+            setattr(self, key, value)
+        self.journal = journal
+        self.authorship: List[RelationRecord] = list()
+        self.editorship: List[RelationRecord] = list()
+
+    @property
+    def item_class(self) -> Type[Item]:
+        if not ItemRecord._classes:
+            ItemRecord._classes.update(_item_classes())
+        return ItemRecord._classes.get(self.object_type, Item)
+
+    @property
+    def required_fields(self):
+        return self.item_class.required_fields
+
+    @property
+    def optional_fields(self):
+        return self.item_class.optional_fields
+
+    def __repr__(self):
+        return 'ItemRecord({0})'.format(self.id)
+
+
+def query_persons(conn: Connection, *criteria) -> List[PersonRecord]:
+    return [PersonRecord(*row) for row in conn.execute(
+        select(person_table.c.id, person_table.c.last_name, person_table.c.first_name).where(*criteria))]
+
+
+def query_journals(conn: Connection, *criteria) -> List[JournalRecord]:
+    return [JournalRecord(*row) for row in conn.execute(
+        select(journal_table.c.id, journal_table.c.name, journal_table.c.abbr, journal_table.c.abbr_no_dot)
+        .where(*criteria))]
+
+
+def _add_relations(conn: Connection, table, items: Dict[str, ItemRecord], attr: str, criteria) -> None:
+    persons: Dict[int, PersonRecord] = dict()
+    item_ids = select(item_table.c.id).where(*criteria)
+    rows = conn.execute(select(table.c.item_id, table.c.order, person_table.c.id, person_table.c.last_name,
+                               person_table.c.first_name)
+                        .join(person_table, table.c.person_id == person_table.c.id)
+                        .where(table.c.item_id.in_(item_ids)).order_by(table.c.item_id, table.c.order)).all()
+    for item_id, order, person_id, last_name, first_name in rows:
+        item = items.get(item_id)
+        if item is None:
+            continue
+        person = persons.get(person_id)
+        if person is None:
+            person = persons[person_id] = PersonRecord(person_id, last_name, first_name)
+        getattr(item, attr).append(RelationRecord(order, person))
+
+
+def query_items(conn: Connection, *criteria, order_by=()) -> List[ItemRecord]:
+    """items matching criteria on item_table columns, with journal, authors and editors filled in.
+    Runs three queries regardless of the number of items."""
+    journals: Dict[int, JournalRecord] = dict()
+    items: Dict[str, ItemRecord] = dict()
+    # rows are read by position, which costs far less than by name for large results
+    rows = conn.execute(select(*(item_table.c[x] for x in ItemRecord.item_columns), journal_table.c.name,
+                               journal_table.c.abbr, journal_table.c.abbr_no_dot)
+                        .outerjoin(journal_table, item_table.c.journal_id == journal_table.c.id)
+                        .where(*criteria).order_by(*order_by)).all()
+    for row in rows:
+        journal = None
+        journal_id = row[3]
+        if journal_id is not None:
+            journal = journals.get(journal_id)
+            if journal is None:
+                journal = journals[journal_id] = JournalRecord(journal_id, *row[-3:])
+        items[row[0]] = ItemRecord(row, journal)
+    if items:
+        _add_relations(conn, authorship, items, 'authorship', criteria)
+        _add_relations(conn, editorship, items, 'editorship', criteria)
+    return list(items.values())
+
+
+@contextmanager
+def id_set(conn: Connection, item_ids: Sequence[str]) -> Iterator:
+    """the right side of an IN over item_ids: the ids bound as parameters when they are few, otherwise a select of
+    requested_table, which holds them until the block ends. Blocks on one connection do not nest."""
+    if len(item_ids) <= BOUND_IDS:
+        yield list(item_ids)
+        return
+    conn.execute(text('CREATE TEMPORARY TABLE IF NOT EXISTS requested_id (id TEXT PRIMARY KEY) WITHOUT ROWID'))
+    conn.execute(delete(requested_table))
+    # bound straight through the driver, sqlalchemy's per parameter processing costs more than the insert
+    conn.exec_driver_sql('INSERT OR IGNORE INTO requested_id (id) VALUES (?)', [(x,) for x in item_ids])
+    try:
+        yield select(requested_table.c.id)
+    finally:
+        conn.execute(delete(requested_table))
+
+
+def query_ids(conn: Connection, item_ids: Iterable[str]) -> Tuple[List[ItemRecord], List[str]]:
+    """items of the ids in the order given, each once, and the ids not in the library. Long lists are inserted
+    into a temporary table instead of being bound as parameters of an IN list."""
+    item_ids = list(dict.fromkeys(item_ids))
+    with id_set(conn, item_ids) as ids:
+        found = {x.id: x for x in query_items(conn, item_table.c.id.in_(ids))}
+    return [found[x] for x in item_ids if x in found], [x for x in item_ids if x not in found]
+
+
+def query_authored(conn: Connection, last_name: str, *criteria) -> List[Tuple[ItemRecord, int]]:
+    """items by authors with last_name, paired with the author's position, ordered by first name and year"""
+    hits = conn.execute(select(authorship.c.item_id, authorship.c.order)
+                        .join(person_table, authorship.c.person_id == person_table.c.id)
+                        .join(item_table, authorship.c.item_id == item_table.c.id)
+                        .where(person_table.c.last_name == last_name, *criteria)
+                        .order_by(person_table.c.first_name, item_table.c.year, item_table.c.id)).all()
+    items = {x.id: x for x in query_items(conn, item_table.c.id.in_({item_id for item_id, _ in hits}))}
+    return [(items[item_id], order) for item_id, order in hits]
+
+
+def has_keyword(keyword: str):
+    """criterion for query_items: item carries the keyword"""
+    return item_table.c.id.in_(select(keyword_assoc.c.item_id)
+                               .join(keyword_table, keyword_assoc.c.keyword_id == keyword_table.c.id)
+                               .where(keyword_table.c.text == keyword))
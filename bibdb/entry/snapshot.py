@@ -0,0 +1,234 @@
+"""Columnar snapshot of the library for interactive search, stored next to the database and read through mmap.
+
+Items are numbered in (year, id) order. Columns are int32 arrays except the keyword bitsets:
+    year:                          year of each item, 0 when missing
+    keyword:                       one bitset over all items per keyword
+    author_offsets / author_items / author_orders:  items by each person (sorted by name), with author position
+    token_offsets / token_items:   items whose title contains each normalized word
+A snapshot is only used while the database file change counter equals the one it was built from. The counter is
+stored in the fixed size prefix, before the json header, so a stale snapshot is told apart without decoding the
+header. A stale snapshot is not used, searches fall back to sql until bibdb snapshot rebuilds it; the server
+refreshes it when it starts."""
+import json
+import mmap
+import os
+import re
+import struct
+from array import array
+from bisect import bisect_left
+from os import path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from .main import engine, item_table, authorship, keyword_assoc, Keyword, Person
+from ..database import get_database
+from ..utils import normalize
+
+MAGIC = b'BIBSNAP2'
+PREFIX = struct.Struct('<8sII')  # magic, change counter, header length
+token_regex = re.compile(r'\w+')
+Hit = Tuple[str, Optional[int]]
+
+
+def get_snapshot_path() -> str:
+    return get_database().sibling('snapshot.bin', 'snapshot')
+
+
+def change_counter(database_path: Optional[str] = None) -> int:
+    """sqlite's file change counter, bytes 24-27 of the database header. Not kept up to date in WAL mode."""
+    with open(database_path if database_path else get_database().path, 'rb') as fp:
+        fp.seek(24)
+        return struct.unpack('>I', fp.read(4))[0]
+
+
+def tokenize(text: str) -> Set[str]:
+    return set(token_regex.findall(normalize(text)))
+
+
+def _postings(pairs: Iterable[Tuple[int, int]], size: int) -> Tuple[array, array]:
+    """csr offsets and values from (row, value) pairs"""
+    rows: List[List[int]] = [list() for _ in range(size)]
+    for row, value in pairs:
+        rows[row].append(value)
+    offsets, values = array('i', [0]), array('i')
+    for row in rows:
+        row.sort()
+        values.extend(row)
+        offsets.append(len(values))
+    return offsets, values
+
+
+def build_snapshot(snapshot_path: Optional[str] = None) -> None:
+    snapshot_path = snapshot_path if snapshot_path else get_snapshot_path()
+    counter = change_counter()
+    person_table, keyword_table = Person.__table__, Keyword.__table__
+    with engine.connect() as conn:
+        items = conn.execute(select(item_table.c.id, item_table.c.year, item_table.c.title)
+                             .order_by(item_table.c.year, item_table.c.id)).all()
+        keywords = conn.execute(select(keyword_table.c.id, keyword_table.c.text)).all()
+        keyword_rows = conn.execute(select(keyword_assoc.c.item_id, keyword_assoc.c.keyword_id)).all()
+        persons = conn.execute(select(person_table.c.id, person_table.c.last_name, person_table.c.first_name)
+                               .order_by(person_table.c.last_name, person_table.c.first_name)).all()
+        author_rows = conn.execute(select(authorship.c.item_id, authorship.c.person_id, authorship.c.order)).all()
+    item_index = {item_id: idx for idx, (item_id, _, _) in enumerate(items)}
+    columns: Dict[str, array] = {'year': array('i', (year if year else 0 for _, year, _ in items))}
+
+    byte_number = (len(items) + 7) // 8
+    keyword_index = {keyword_id: idx for idx, (keyword_id, _) in enumerate(keywords)}
+    bitsets = array('B', bytes(byte_number * len(keywords)))
+    for item_id, keyword_id in keyword_rows:
+        if item_id in item_index and keyword_id in keyword_index:
+            idx = item_index[item_id]
+            bitsets[keyword_index[keyword_id] * byte_number + (idx >> 3)] |= 1 << (idx & 7)
+    columns['keyword'] = bitsets
+
+    person_index = {person_id: idx for idx, (person_id, _, _) in enumerate(persons)}
+    author_pairs = sorted((person_index[person_id], item_index[item_id], order if order is not None else -1)
+                          for item_id, person_id, order in author_rows
+                          if item_id in item_index and person_id in person_index)
+    columns['author_offsets'], columns['author_items'] = _postings(((x[0], x[1]) for x in author_pairs),
+                                                                   len(persons))
+    columns['author_orders'] = array('i', (x[2] for x in author_pairs))
+
+    tokens: Dict[str, int] = dict()
+    token_pairs = [(tokens.setdefault(token, len(tokens)), idx)
+                   for idx, (_, _, title) in enumerate(items) for token in tokenize(title or '')]
+    columns['token_offsets'], columns['token_items'] = _postings(token_pairs, len(tokens))
+
+    header = {'ids': [x[0] for x in items], 'keywords': [x[1] for x in keywords],
+              'persons': [[x[1], x[2]] for x in persons], 'tokens': list(tokens), 'columns': dict()}
+    body, offset = list(), 0
+    for name, column in columns.items():
+        data = column.tobytes()
+        header['columns'][name] = [offset, len(data), column.typecode]
+        padding = -len(data) % 8
+        body.append(data + b'\0' * padding)
+        offset += len(data) + padding
+    header_bytes = json.dumps(header).encode('utf-8')
+    header_bytes += b' ' * (-(len(header_bytes) + PREFIX.size) % 8)
+    temp_path = '{0}.{1}.tmp'.format(snapshot_path, os.getpid())  # processes rebuilding at once do not collide
+    with open(temp_path, 'wb') as fp:
+        fp.write(PREFIX.pack(MAGIC, counter, len(header_bytes)))
+        fp.write(header_bytes)
+        fp.writelines(body)
+    os.replace(temp_path, snapshot_path)
+
+
+def read_counter(snapshot_path: str) -> Optional[int]:
+    """the change counter a snapshot was built from, None when it is not a snapshot of this version"""
+    with open(snapshot_path, 'rb') as fp:
+        prefix = fp.read(PREFIX.size)
+    if len(prefix) < PREFIX.size:
+        return None
+    magic, counter, _ = PREFIX.unpack(prefix)
+    return counter if magic == MAGIC else None
+
+
+def refresh_snapshot(snapshot_path: Optional[str] = None) -> bool:
+    """rebuild the snapshot if there is one and the database changed since, returns whether it was rebuilt"""
+    snapshot_path = snapshot_path if snapshot_path else get_snapshot_path()
+    if not path.isfile(snapshot_path) or read_counter(snapshot_path) == change_counter():
+        return False
+    build_snapshot(snapshot_path)
+    return True
+
+
+class Snapshot(object):
+    """a snapshot mapped into memory until closed. Also a context manager closing it."""
+    def __init__(self, snapshot_path: Optional[str] = None):
+        with open(snapshot_path if snapshot_path else get_snapshot_path(), 'rb') as fp:
+            self._buf = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.change_counter, header_length = PREFIX.unpack(self._buf[0: PREFIX.size])
+        if magic != MAGIC:
+            self._buf.close()
+            raise ValueError('not a bibdb snapshot')
+        self._start = PREFIX.size + header_length
+        header = json.loads(self._buf[PREFIX.size: self._start].decode('utf-8'))
+        self.ids: List[str] = header['ids']
+        self.persons: List[List[str]] = header['persons']
+        self.keywords = {text: idx for idx, text in enumerate(header['keywords'])}
+        self.tokens = {token: idx for idx, token in enumerate(header['tokens'])}
+        self._columns = header['columns']
+        self.year = self.column('year')
+
+    @classmethod
+    def load(cls, snapshot_path: Optional[str] = None) -> Optional['Snapshot']:
+        """the snapshot if it exists and the database has not changed since it was built"""
+        snapshot_path = snapshot_path if snapshot_path else get_snapshot_path()
+        if not path.isfile(snapshot_path) or read_counter(snapshot_path) != change_counter():
+            return None
+        return cls(snapshot_path)
+
+    def close(self) -> None:
+        """unmap the file. Columns taken from the snapshot must be released before."""
+        self.year.release()
+        self._buf.close()
+
+    def __enter__(self) -> 'Snapshot':
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def column(self, name: str) -> memoryview:
+        offset, length, typecode = self._columns[name]
+        return memoryview(self._buf)[self._start + offset: self._start + offset + length].cast(typecode)
+
+    def _postings(self, name: str, idx: int) -> memoryview:
+        offsets = self.column(name + '_offsets')
+        return self.column(name + '_items')[offsets[idx]: offsets[idx + 1]]
+
+    def _keyword_mask(self, keywords: Iterable[str]) -> Optional[bytes]:
+        byte_number = (len(self.ids) + 7) // 8
+        bitsets = self.column('keyword')
+        mask = -1
+        for keyword in keywords:
+            if keyword not in self.keywords:
+                return bytes(byte_number)
+            start = self.keywords[keyword] * byte_number
+            mask &= int.from_bytes(bitsets[start: start + byte_number], 'little')
+        return mask.to_bytes(byte_number, 'little') if mask != -1 else None
+
+    def search(self, author: Optional[str] = None, keywords: Iterable[str] = (),
+               years: Tuple[Optional[int], Optional[int]] = (None, None), title: Iterable[str] = ()) -> List[Hit]:
+        """ids of matching items, with the author position when searching by author. Author hits are sorted by
+        first name then year, others by year."""
+        mask = self._keyword_mask(keywords)
+        words = {token for word in title for token in tokenize(word)}
+        candidates: Optional[Set[int]] = None
+        for word in words:
+            if word not in self.tokens:
+                return list()
+            posting = set(self._postings('token', self.tokens[word]))
+            candidates = posting if candidates is None else candidates & posting
+        start_year, end_year = years
+        year = self.year
+
+        def accept(idx: int) -> bool:
+            return (mask is None or mask[idx >> 3] >> (idx & 7) & 1) and \
+                   (candidates is None or idx in candidates) and \
+                   (start_year is None or year[idx] >= start_year) and (end_year is None or year[idx] <= end_year)
+
+        if author is not None:
+            offsets, items, orders = self.column('author_offsets'), self.column('author_items'), \
+                self.column('author_orders')
+            hits = list()
+            person_idx = bisect_left(self.persons, [author])
+            for person_idx in range(person_idx, len(self.persons)):
+                last_name, first_name = self.persons[person_idx]
+                if last_name != author:
+                    break
+                for position in range(offsets[person_idx], offsets[person_idx + 1]):
+                    if accept(items[position]):
+                        hits.append((first_name or '', items[position], orders[position]))
+            hits.sort()
+            return [(self.ids[idx], order if order >= 0 else None) for _, idx, order in hits]
+        if candidates is not None:
+            found: Iterable[int] = sorted(candidates)
+        elif mask is not None:
+            found = (byte_idx * 8 + bit for byte_idx, byte in enumerate(mask) if byte
+                     for bit in range(8) if byte >> bit & 1)
+        else:
+            found = range(len(self.ids))
+        return [(self.ids[idx], None) for idx in found if accept(idx)]
@@ -0,0 +1,64 @@
+"""Library statistics: papers per year, per entry type, per journal and per keyword, and the most prolific authors.
+Each table is one GROUP BY query, so no item is loaded. The result is cached in a json file next to the database and
+used while the database file change counter equals the one it was computed at."""
+import json
+import os
+from os import path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import desc, func, select
+
+from .main import Journal, Keyword, Person, authorship, item_table, keyword_assoc
+from .snapshot import change_counter
+from ..database import get_database
+
+SECTIONS = ('total', 'year', 'type', 'journal', 'keyword', 'author')
+Stats = Dict[str, List[Tuple[str, int]]]
+
+
+def get_stats_path() -> str:
+    return get_database().sibling('stats.json', 'stats')
+
+
+def library_stats(conn, limit: Optional[int] = None) -> Stats:
+    """(label, count) rows of each section. Years are in order, the other sections most common first and cut at
+    limit."""
+    journal_table, keyword_table, person_table = Journal.__table__, Keyword.__table__, Person.__table__
+    count = func.count().label('count')
+    totals = conn.execute(select(*(select(func.count()).select_from(x).scalar_subquery()
+                                   for x in (item_table, person_table, keyword_table, journal_table)))).one()
+    stats: Stats = {'total': list(zip(('papers', 'people', 'keywords', 'journals'), totals))}
+    stats['year'] = conn.execute(select(item_table.c.year, count).group_by(item_table.c.year)
+                                 .order_by(item_table.c.year)).all()
+    stats['type'] = conn.execute(select(func.coalesce(item_table.c.object_type, ''), count)
+                                 .group_by(item_table.c.object_type).order_by(desc(count))).all()
+    stats['journal'] = conn.execute(
+        select(journal_table.c.name, count).join(item_table, item_table.c.journal_id == journal_table.c.id)
+        .group_by(journal_table.c.id).order_by(desc(count), journal_table.c.name).limit(limit)).all()
+    stats['keyword'] = conn.execute(
+        select(keyword_table.c.text, count).join(keyword_assoc, keyword_assoc.c.keyword_id == keyword_table.c.id)
+        .group_by(keyword_table.c.id).order_by(desc(count), keyword_table.c.text).limit(limit)).all()
+    name = (person_table.c.last_name + func.coalesce(', ' + person_table.c.first_name, '')).label('name')
+    stats['author'] = conn.execute(
+        select(name, count).join(authorship, authorship.c.person_id == person_table.c.id)
+        .group_by(person_table.c.id).order_by(desc(count), name).limit(limit)).all()
+    return {key: [(str(label) if label is not None else '', row_count) for label, row_count in rows]
+            for key, rows in stats.items()}
+
+
+def cached_stats(conn, limit: Optional[int] = None, stats_path: Optional[str] = None,
+                 database_path: Optional[str] = None) -> Tuple[Stats, bool]:
+    """the statistics, from the cache when the database has not changed since, and whether they came from it"""
+    stats_path = stats_path if stats_path else get_stats_path()
+    counter = change_counter(database_path)
+    if path.isfile(stats_path):
+        with open(stats_path, 'r', encoding='utf-8') as fp:
+            cache = json.load(fp)
+        if cache['change_counter'] == counter and cache['limit'] == limit:
+            return {key: [tuple(x) for x in rows] for key, rows in cache['stats'].items()}, True
+    stats = library_stats(conn, limit)
+    temp_path = stats_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as fp:
+        json.dump({'change_counter': counter, 'limit': limit, 'stats': stats}, fp, ensure_ascii=False)
+    os.replace(temp_path, stats_path)
+    return stats, False
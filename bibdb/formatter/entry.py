@@ -3,11 +3,6 @@ from typing import List, Callable, Any, Dict, Type
 from io import StringIO
 from unicodedata import normalize
 
-from bibtexparser.library import Library
-from bibtexparser import write_string
-from bibtexparser.model import Entry, Field
-from colorama import Fore
-
 from ..entry.main import Item, Person
 
 class Formatter(object):
@@ -127,12 +122,14 @@ class SimpleFormatter(Formatter):
 
 class ColorFormatter(SimpleFormatter):
     def __init__(self, buf):
+        from colorama import Fore
         super(ColorFormatter, self).__init__(buf)
         self._filters['title'] = lambda x: f'{Fore.MAGENTA}{x}{Fore.RESET}'
         self._filters['year'] = lambda x: f'{Fore.RED}{x}{Fore.RESET}'
 
     @staticmethod
     def name_filter(persons: List[Person], buf, order: int = None) -> None:
+        from colorama import Fore
         length = len(persons)
         if length == 0:
             return
@@ -215,6 +212,9 @@ class BibtexFormatter(Formatter):
         super(BibtexFormatter, self).__init__(buf)
 
     def __call__(self, entry: Item) -> None:
+        from bibtexparser import write_string
+        from bibtexparser.library import Library
+        from bibtexparser.model import Entry, Field
         db = Library()
         entry_dict = dict()
         if len(entry.authorship) > 0:
@@ -225,14 +225,14 @@ class BibtexFormatter(Formatter):
             buf = StringIO()
             self.name_filter([x.person for x in entry.editorship], buf)
             entry_dict['editor'] = buf.getvalue()
-        for field_id in entry.optional_fields | entry.required_fields - {'id', 'journal_id'} | {'journal'}:
+        for field_id in sorted(entry.optional_fields | entry.required_fields - {'id', 'journal_id'} | {'journal'}):
             value = getattr(entry, field_id, None)
             if value is None:
                 continue
             _filter = self._filters.get(field_id, None)
             entry_dict[field_id] = (_filter(value) if _filter is not None else str(value))
         db.add(Entry(
-            type(entry).__name__.lower(),
+            entry.object_type,
             entry.id,
             [Field(key, value) for key, value in entry_dict.items()]
         ))
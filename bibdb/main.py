@@ -1,53 +1,171 @@
+import sys
 from argparse import ArgumentParser
+from importlib import import_module
 
-from .actions import main as actions
-from .actions.store_paper import store_paper
 
+def lazy(module: str, name: str):
+    """defer importing an action until its subcommand runs"""
+    def run(args):
+        return getattr(import_module(module, __package__), name)(args)
+    return run
 
-def parse_args():
+
+def make_parser() -> ArgumentParser:
+    # no abbreviations of the options, profiling.requested looks for them in full before parsing
     parser = ArgumentParser("bibdb", description="a tool to manage literature library",
-                            epilog="citation is usually $first_author_last_name$year")
+                            epilog="citation is usually $first_author_last_name$year", allow_abbrev=False)
+    parser.add_argument('--profile', action='store_true', help='time sql statements and phases and trace memory, '
+                                                                'reporting json on stderr. Also set by BIBDB_PROFILE')
+    parser.add_argument('--profile-output', metavar='FILE', help='profile into a json file, or into a cProfile dump '
+                                                                 'for a FILE ending in .prof')
     subparsers = parser.add_subparsers(help='commands')
 
     search_parser = subparsers.add_parser('s', help='search paper')
-    search_parser.set_defaults(func=actions.search_paper)
+    search_parser.set_defaults(func=lazy('.actions.main', 'search_paper'))
     search_parser.add_argument('-a', '--author')
     search_parser.add_argument('-k', '--keyword', nargs="+")
+    search_parser.add_argument('-y', '--year', help='a year or a range like 2000-2010, 2000- or -2010')
+    search_parser.add_argument('-t', '--title', nargs="+", help='words in the title')
+    search_parser.add_argument('-c', '--comment', nargs="+", help='words in the comment files, end a word with * to '
+                                                                  'match its prefix. see bibdb notes')
 
     open_parser = subparsers.add_parser('o', help='open file')
-    open_parser.set_defaults(func=actions.open_file)
+    open_parser.set_defaults(func=lazy('.actions.main', 'open_file'))
     open_parser.add_argument('paper_id')
     open_parser.add_argument('-c', '--comment', dest='files', action='append_const',
                              const='comment')
     open_parser.add_argument('-p', '--pdf', dest='files', action='append_const', const='pdf')
 
     add_parser = subparsers.add_parser('a', help='add entry')
-    add_parser.set_defaults(func=store_paper)
+    add_parser.set_defaults(func=lazy('.actions.store_paper', 'store_paper'))
     add_parser.add_argument('keyword', nargs="*", help='give a list of keyword separated by colons')
 
+    watch_parser = subparsers.add_parser('watch', help='queue citation files and pdfs as they are downloaded')
+    watch_parser.set_defaults(func=lazy('.actions.watch', 'watch'))
+    watch_parser.add_argument('-p', '--poll', type=float, help='poll the folders every POLL seconds instead of '
+                                                               'using inotify')
+
+    pending_parser = subparsers.add_parser('pending', help='list or store queued citation files')
+    pending_parser.set_defaults(func=lazy('.actions.watch', 'pending'))
+    pending_parser.add_argument('-c', '--confirm', nargs='+', help='store the entries with these numbers, or all')
+    pending_parser.add_argument('-b', '--batch', action='store_true', help='store every entry in one go, '
+                                                                        'answering questions by a policy')
+    pending_parser.add_argument('-p', '--policy', help='json file of the batch policy, see StorePolicy')
+    pending_parser.add_argument('-k', '--keyword', nargs='+', help='keywords for every stored entry, separate by '
+                                                                   'colon')
+
     add_parser = subparsers.add_parser('d', help='delete entry')
-    add_parser.set_defaults(func=actions.delete_paper)
-    add_parser.add_argument('paper_id')
+    add_parser.set_defaults(func=lazy('.actions.main', 'delete_paper'))
+    add_parser.add_argument('paper_id', help='paper ids separated by commas, or a file listing paper ids')
 
     output_parser = subparsers.add_parser('u', help='output information')
-    output_parser.set_defaults(func=actions.output)
-    output_parser.add_argument('source', help='supply a list of paper ids or find Pandoc token '
-                                              'file to extract a minimal reference list')
+    output_parser.set_defaults(func=lazy('.actions.main', 'output'))
+    output_parser.add_argument('source', nargs='+', help='supply a list of paper ids or find Pandoc token '
+                                                         'file to extract a minimal reference list')
     output_format = output_parser.add_mutually_exclusive_group(required=True)
     output_format.add_argument('-b', '--bibtex', dest="format", action='store_const', const='bib',
                                help='output bibtex file')
     output_format.add_argument('-s', '--string', dest="format", action='store_const', const='str',
                                help='output a simple string')
+    output_parser.add_argument('-o', '--output', help='write to this file instead of printing')
+    output_parser.add_argument('-w', '--watch', action='store_true', help='keep the output file up to date with the '
+                                                                          'citations of the markdown sources')
 
     key_parser = subparsers.add_parser('k', help='manipulate keywords')
-    key_parser.set_defaults(func=actions.modify_keyword)
-    key_parser.add_argument('paper_id')
+    key_parser.set_defaults(func=lazy('.actions.main', 'modify_keyword'))
+    key_parser.add_argument('paper_id', nargs='?', help='paper ids separated by commas, or a file listing paper ids')
     key_parser.add_argument('-a', '--add', nargs="+", help='keywords to add, separate by colon')
     key_parser.add_argument('-d', '--delete', nargs="+", help='keywords to delete, separate by '
                                                               'colon')
+    key_parser.add_argument('--author', help='instead of paper ids, change the papers by this author')
+    key_parser.add_argument('--tagged', nargs="+", help='or the papers with these keywords')
+    key_parser.add_argument('--year', help='or the papers from these years')
+    key_parser.add_argument('--title', nargs="+", help='or the papers with these words in the title')
+    key_parser.add_argument('-r', '--rename', nargs="+", help='old and new keyword, separate by comma')
+    key_parser.add_argument('-m', '--merge', nargs="+", help='merge keywords into the first one, separate by comma')
+    key_parser.add_argument('--prune', action='store_true', help='drop keywords no paper carries')
+    key_parser.add_argument('--stats', action='store_true', help='count papers per keyword, among the searched '
+                                                                 'papers if search options are given')
+    key_parser.add_argument('--limit', type=int, default=30, help='number of keywords shown by --stats')
+
+    dedupe_parser = subparsers.add_parser('dedupe', help='report duplicated content in the library')
+    dedupe_parser.set_defaults(func=lazy('.actions.dedupe', 'dedupe'))
+    dedupe_parser.add_argument('target', nargs='?', default='files', choices=['files', 'people', 'items'],
+                               help='files: pdfs with the same content, hashed again only when changed; '
+                                    'people: persons stored under variants of one name; '
+                                    'items: papers with similar titles, first author and year')
+    dedupe_parser.add_argument('-j', '--jobs', type=int, help='number of threads reading files')
+    dedupe_parser.add_argument('-m', '--merge', action='store_true', help='people: merge each group into its most '
+                                                                         'complete name')
+    dedupe_parser.add_argument('--min-score', type=float, default=0.8, help='people: merge only variants scoring at '
+                                                                            'least this, 1 for the same name')
+    dedupe_parser.add_argument('-t', '--threshold', type=float, default=0.7, help='items: least estimated similarity '
+                                                                                  'of a pair')
+
+    check_parser = subparsers.add_parser('check', help='check registered files against the pdf and comment folders')
+    check_parser.set_defaults(func=lazy('.actions.check', 'check'))
+    check_parser.add_argument('-f', '--fix', nargs='+', choices=['misnamed', 'missing'],
+                              help='misnamed: rename files, or relink missing ones to an orphan with the right name; '
+                                   'missing: drop rows of files still missing')
+    check_parser.add_argument('-j', '--jobs', type=int, default=32, help='number of threads checking files')
+
+    relocate_parser = subparsers.add_parser('relocate', help='move all files of a type to a new folder, or rename '
+                                                             'them to the names bibdb gives')
+    relocate_parser.set_defaults(func=lazy('.actions.relocate', 'relocate'))
+    relocate_parser.add_argument('folder', nargs='?', help='new folder, also written to the config file')
+    relocate_parser.add_argument('-t', '--type', default='pdf', choices=['pdf', 'comment'])
+    relocate_parser.add_argument('-r', '--rename', action='store_true', help='rename files to their expected names')
+    relocate_parser.add_argument('-n', '--dry-run', action='store_true', help='only list the planned moves')
+    relocate_parser.add_argument('--resume', action='store_true', help='finish an interrupted relocation')
+    relocate_parser.add_argument('--rollback', action='store_true', help='undo an interrupted relocation')
+    relocate_parser.add_argument('-j', '--jobs', type=int, default=8, help='number of threads moving files')
 
     add_parser = subparsers.add_parser('init', help='initialize')
-    add_parser.set_defaults(func=actions.initialize)
+    add_parser.set_defaults(func=lazy('.actions.main', 'initialize'))
+
+    snapshot_parser = subparsers.add_parser('snapshot', help='rebuild the snapshot used for fast searches')
+    snapshot_parser.set_defaults(func=lazy('.actions.main', 'snapshot'))
 
-    args = parser.parse_args()
-    args.func(args)
+    stats_parser = subparsers.add_parser('stats', help='count papers per year, type, journal, keyword and author')
+    stats_parser.set_defaults(func=lazy('.actions.main', 'library_stats'))
+    stats_parser.add_argument('-f', '--format', default='table', choices=['table', 'json', 'csv'])
+    stats_parser.add_argument('-o', '--output', help='write to this file instead of printing')
+    stats_parser.add_argument('-n', '--limit', type=int, default=20, help='rows of the journal, keyword and author '
+                                                                          'tables')
+
+    notes_parser = subparsers.add_parser('notes', help='index the text of comment files for bibdb s -c')
+    notes_parser.set_defaults(func=lazy('.actions.main', 'index_notes'))
+    notes_parser.add_argument('-j', '--jobs', type=int, help='number of threads reading files')
+    notes_parser.add_argument('-b', '--batch-size', type=int, default=500, help='files indexed per transaction')
+    notes_parser.add_argument('--nice', type=int, default=0, help='lower the priority, for runs in the background')
+
+    sync_parser = subparsers.add_parser('sync', help='exchange changes with other machines through the folder '
+                                                     'in path.changes, instead of syncing the database file')
+    sync_parser.set_defaults(func=lazy('.actions.main', 'sync_library'))
+
+    complete_parser = subparsers.add_parser('complete', help='list paper ids starting with a prefix')
+    complete_parser.set_defaults(func=lazy('.completion', 'complete'))
+    complete_parser.add_argument('prefix', nargs='?', default='')
+    complete_parser.add_argument('-n', '--limit', type=int)
+    complete_parser.add_argument('-l', '--long', action='store_true', help='also show author, year and title')
+
+    serve_parser = subparsers.add_parser('serve', help='keep a warm server running to answer s, u, d and k')
+    serve_parser.set_defaults(func=lazy('.daemon', 'serve'))
+    return parser
+
+
+def parse_args():
+    from .daemon import forward
+    from .profiling import env_target, requested
+    if not requested(sys.argv[1:]):  # a profile covers this process, not the server
+        status = forward(sys.argv[1:])
+        if status is not None:
+            sys.exit(status)
+    args = make_parser().parse_args()
+    target = args.profile_output or ('-' if args.profile else env_target())
+    if target:
+        from .profiling import profiled
+        with profiled(target, sys.argv[1:]):
+            args.func(args)
+    else:
+        args.func(args)
@@ -0,0 +1,110 @@
+"""Where the time of a command goes. bibdb --profile, or BIBDB_PROFILE in the environment, runs the command with
+every sql statement counted and timed through engine events, the phases marked with phase() timed, and the peak
+memory traced. The report is json on stderr, or in the file given by --profile-output or BIBDB_PROFILE; a file
+ending in .prof gets a cProfile dump instead, with the json still on stderr. BIBDB_PROFILE set to 1 or true reports
+on stderr, and 0, false or empty leaves profiling off. Tracing memory slows python code down, so phases take longer
+than they would otherwise, sql statements less so. When profiling is off, phase() hands back one shared empty
+context manager."""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterator, List, Optional
+
+ENV = 'BIBDB_PROFILE'
+STATEMENT_NUMBER = 20  # slowest statements in the report
+_NULL = nullcontext()
+_profiler: Optional['Profiler'] = None
+
+
+def env_target() -> Optional[str]:
+    """the target BIBDB_PROFILE asks for: None when unset, empty, 0 or false, '-' for stderr when 1 or true, else
+    the file to write"""
+    value = os.environ.get(ENV, '').strip()
+    if value.lower() in ('', '0', 'false', 'no', 'off'):
+        return None
+    return '-' if value.lower() in ('1', 'true', 'yes', 'on') else value
+
+
+def requested(argv: List[str]) -> bool:
+    """whether the command line or the environment asks for a profile, checked before argument parsing"""
+    return env_target() is not None or any(x.split('=')[0] in ('--profile', '--profile-output') for x in argv)
+
+
+def phase(name: str):
+    """a context manager timing a phase of the command, like parse, resolve, flush, format or write"""
+    return _NULL if _profiler is None else _profiler.phase(name)
+
+
+class Profiler(object):
+    def __init__(self):
+        self.phases: Dict[str, List[float]] = dict()  # name: [count, seconds]
+        self.statements: Dict[str, List[float]] = dict()  # sql: [count, seconds]
+        self.wall = 0.0
+        self.peak = 0
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = self.phases.setdefault(name, [0, 0.0])
+            record[0] += 1
+            record[1] += time.perf_counter() - start
+
+    def before_execute(self, conn, _cursor, _statement, _parameters, _context, _executemany) -> None:
+        conn.info.setdefault('profile_start', list()).append(time.perf_counter())
+
+    def after_execute(self, conn, _cursor, statement, _parameters, _context, _executemany) -> None:
+        elapsed = time.perf_counter() - conn.info['profile_start'].pop()
+        record = self.statements.setdefault(statement, [0, 0.0])
+        record[0] += 1
+        record[1] += elapsed
+
+    def report(self, argv: List[str]) -> dict:
+        slowest = sorted(self.statements.items(), key=lambda x: -x[1][1])[0: STATEMENT_NUMBER]
+        return {'argv': argv, 'wall': self.wall, 'memory_peak': self.peak,
+                'sql': {'count': sum(x[0] for x in self.statements.values()),
+                        'seconds': sum(x[1] for x in self.statements.values())},
+                'phases': {name: {'count': count, 'seconds': seconds}
+                           for name, (count, seconds) in self.phases.items()},
+                'statements': [{'sql': sql, 'count': count, 'seconds': seconds} for sql, (count, seconds) in slowest]}
+
+
+@contextmanager
+def profiled(target: Optional[str], argv: List[str]) -> Iterator[Profiler]:
+    """profile the block. target is a json file, a .prof file for cProfile, or '-' or '1' for stderr."""
+    import tracemalloc
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    global _profiler
+    profiler = _profiler = Profiler()
+    event.listen(Engine, 'before_cursor_execute', profiler.before_execute)
+    event.listen(Engine, 'after_cursor_execute', profiler.after_execute)
+    dump = target if target and target.endswith('.prof') else None
+    if dump:
+        import cProfile
+        cprofile = cProfile.Profile()
+        cprofile.enable()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        yield profiler
+    finally:
+        profiler.wall = time.perf_counter() - start
+        profiler.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        if dump:
+            cprofile.disable()
+            cprofile.dump_stats(dump)
+        event.remove(Engine, 'before_cursor_execute', profiler.before_execute)
+        event.remove(Engine, 'after_cursor_execute', profiler.after_execute)
+        _profiler = None
+        report = json.dumps(profiler.report(argv), indent=2)
+        if target in (None, '', '-', '1') or dump:
+            print(report, file=sys.stderr)
+        else:
+            with open(target, 'w', encoding='utf-8') as fp:
+                fp.write(report)
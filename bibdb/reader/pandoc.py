@@ -1,10 +1,15 @@
 from typing import List
 import json
+import re
 import subprocess as sp
 from os.path import isfile, splitext
 
 from .main import Reader
 
+code_regex = re.compile(r'^(```|~~~).*?^\1[^\n]*$|`[^`\n]+`', re.MULTILINE | re.DOTALL)
+# pandoc's citation keys: @{anything} or a word that may hold single punctuation marks between its characters
+citation_regex = re.compile(r'(?<![\w@])@(?:\{([^}]+)\}|(\w(?:\w|[:.#$%&\-+?<>~/](?=\w))*))')
+
 def recurse(x, buffer: List[str]):
     dtype = type(x)
     if dtype is dict:
@@ -30,6 +35,13 @@ def recurse_cite(x, buffer: List[str]):
         for item in x:
             recurse_cite(item, buffer)
 
+def scan_citations(text: str) -> List[str]:
+    """citation keys of a markdown text in order of first use, found without running pandoc. Code is skipped, but
+    every other @word counts, so the keys still have to be looked up."""
+    text = code_regex.sub('', text)
+    return list(dict.fromkeys(braced or bare for braced, bare in citation_regex.findall(text)))
+
+
 class PandocReader(Reader):
     # noinspection PyMissingConstructor
     def __init__(self, file_path: str):
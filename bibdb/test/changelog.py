@@ -0,0 +1,91 @@
+import time
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert, select, update
+
+from bibdb.entry.changelog import Record, Replayer, change_log_table, ensure_changelog, sync
+from bibdb.entry.keywords import add_keywords, rename_keyword, keyword_table
+from bibdb.entry.main import ItemBase, Person, authorship, item_table, keyword_assoc
+
+person_table = Person.__table__
+
+
+class TestChangelog(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.engines = [create_engine('sqlite://') for _ in range(2)]
+        for engine in self.engines:
+            ItemBase.metadata.create_all(engine)
+            with engine.begin() as conn:
+                ensure_changelog(conn)
+
+    def sync(self, idx: int):
+        time.sleep(0.01)
+        with self.engines[idx].begin() as conn:
+            return sync(conn, self.folder.name, 'm{0}'.format(idx))[0]
+
+    def rows(self, idx: int, query):
+        with self.engines[idx].connect() as conn:
+            return sorted(tuple(x) for x in conn.execute(query))
+
+    def test_replay(self):
+        with self.engines[0].begin() as conn:
+            conn.execute(insert(item_table).values(id='a2000', title='first', year=2000, object_type='article'))
+            person_id = conn.execute(insert(person_table).values(last_name='Ng', first_name='A')) \
+                .inserted_primary_key[0]
+            conn.execute(insert(authorship).values(item_id='a2000', person_id=person_id, order=0))
+            add_keywords(conn, ['a2000'], ['x', 'y'])
+        assert self.sync(0).sent == 4
+        assert self.sync(1).applied == 4
+        with self.engines[1].begin() as conn:
+            conn.execute(update(item_table).where(item_table.c.id == 'a2000').values(title='second'))
+            rename_keyword(conn, 'x', 'z')
+        time.sleep(0.01)
+        with self.engines[0].begin() as conn:  # later, so it wins over the year kept by machine 1
+            conn.execute(update(item_table).where(item_table.c.id == 'a2000').values(year=2001))
+        self.sync(1)
+        self.sync(0)
+        self.sync(1)
+        tags = select(keyword_assoc.c.item_id, keyword_table.c.text) \
+            .join(keyword_table, keyword_table.c.id == keyword_assoc.c.keyword_id)
+        for idx in range(2):
+            assert self.rows(idx, select(item_table.c.id, item_table.c.title, item_table.c.year)) == \
+                [('a2000', 'second', 2001)]
+            assert self.rows(idx, tags) == [('a2000', 'y'), ('a2000', 'z')]
+            assert self.rows(idx, select(authorship.c.item_id, authorship.c.order)) == [('a2000', 0)]
+
+    def test_delete(self):
+        with self.engines[0].begin() as conn:
+            conn.execute(insert(item_table).values(id='b2001', title='other', year=2001, object_type='article'))
+        self.sync(0)
+        self.sync(1)
+        with self.engines[0].begin() as conn:
+            conn.execute(item_table.delete())
+        assert self.sync(0).sent == 1
+        assert self.sync(1).applied == 1
+        assert self.rows(1, select(item_table.c.id)) == []
+
+    def test_prune(self):
+        with self.engines[0].begin() as conn:
+            conn.execute(insert(item_table).values(id='a2000', title='first', year=2000, object_type='article'))
+        for title in ('second', 'third'):
+            time.sleep(0.01)
+            with self.engines[0].begin() as conn:
+                conn.execute(update(item_table).where(item_table.c.id == 'a2000').values(title=title))
+        log = select(change_log_table.c.field, change_log_table.c.value).order_by(change_log_table.c.seq)
+        with self.engines[0].connect() as conn:
+            assert len(conn.execute(log).all()) == 3  # not exported yet
+        self.sync(0)
+        self.sync(1)
+        for engine in self.engines:
+            with engine.connect() as conn:
+                rows = conn.execute(log).all()
+            assert [x.field for x in rows] == [None, 'title'] and rows[1].value == '"third"'
+        with self.engines[1].begin() as conn:  # an older record still loses to the one kept
+            assert not Replayer(conn, 'm1').apply(Record(0.0, 'm0', 'item', ['a2000'], 'title', 'second'))
+
+    def tearDown(self):
+        for engine in self.engines:
+            engine.dispose()
+        self.folder.cleanup()
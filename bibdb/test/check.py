@@ -0,0 +1,90 @@
+import os
+from contextlib import redirect_stdout
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert, select
+
+from bibdb.actions.check import Problem, Rename, check_library, fix_library, rename_files, restore_names
+from bibdb.entry.file_object import file_table
+from bibdb.entry.main import ItemBase, Person, authorship, item_table
+from bibdb.entry.record import query_items
+from bibdb.formatter.entry import FileNameFormatter, format_once
+
+
+class TestCheck(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.folders = {x: path.join(self.folder.name, x) for x in ('pdf', 'comment')}
+        for folder in self.folders.values():
+            os.mkdir(folder)
+        self.patch = patch('bibdb.actions.check.type_folder', lambda x: (self.folders[x], '.' + x))
+        self.patch.start()
+        self.engine = create_engine('sqlite://')
+        ItemBase.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': x, 'title': y, 'year': z, 'object_type': 'article'}
+                                              for x, y, z in [('a2000', 'Alpha', 2000), ('b2001', 'Beta', 2001),
+                                                              ('c2002', 'Gamma', 2002)]])
+            conn.execute(insert(Person.__table__), [{'id': 1, 'last_name': 'smith', 'first_name': 'j'}])
+            conn.execute(insert(authorship), [{'item_id': x, 'person_id': 1, 'order': 0} for x in ('a2000', 'b2001')])
+            self.names = {x.id: format_once(FileNameFormatter, x) for x in query_items(conn)
+                          if x.id in ('a2000', 'b2001')}
+            conn.execute(insert(file_table), [
+                {'id': 1, 'item_id': 'a2000', 'name': self.names['a2000'], 'object_type': 'pdf'},
+                {'id': 2, 'item_id': 'b2001', 'name': 'wrong', 'object_type': 'pdf'},
+                {'id': 3, 'item_id': 'c2002', 'name': 'gamma', 'object_type': 'pdf'},
+                {'id': 4, 'item_id': 'a2000', 'name': 'a2000', 'object_type': 'comment'}])
+        for name, content in ((self.names['a2000'], 'x'), ('wrong', 'x'), ('gamma', ''), ('stray', 'x')):
+            with open(path.join(self.folders['pdf'], name + '.pdf'), 'w') as fp:
+                fp.write(content)
+
+    def test_check(self):
+        with self.engine.begin() as conn:
+            problems, total = check_library(conn, 4, window=2)
+            assert total == 4
+            assert sorted(problems) == sorted([
+                Problem('missing', 'comment', 'a2000', 4), Problem('empty', 'pdf', 'gamma', 3),
+                Problem('orphaned', 'pdf', 'stray'), Problem('misnamed', 'pdf', 'wrong', 2, self.names['b2001'])])
+            # streaming the file table leaves the connection as it was
+            assert 'yield_per' not in conn.get_execution_options()
+            renames = fix_library(conn, problems, {'misnamed', 'missing'})
+            assert renames == [Rename(2, 'wrong', path.join(self.folders['pdf'], 'wrong.pdf'),
+                                      path.join(self.folders['pdf'], self.names['b2001'] + '.pdf'))]
+            assert conn.execute(select(file_table.c.id, file_table.c.name).order_by(file_table.c.id)).all() == \
+                [(1, self.names['a2000']), (2, self.names['b2001']), (3, 'gamma')]
+
+    def test_shared_name(self):
+        """two comments of one item both expect its id as their name"""
+        with self.engine.begin() as conn:
+            conn.execute(insert(file_table), [{'id': idx, 'item_id': 'b2001', 'name': x, 'object_type': 'comment'}
+                                              for idx, x in ((5, 'note'), (6, 'draft'))])
+            for name in ('note', 'draft'):
+                with open(path.join(self.folders['comment'], name + '.comment'), 'w') as fp:
+                    fp.write(name)
+            problems, _ = check_library(conn, 4)
+            with redirect_stdout(StringIO()) as output:
+                renames = fix_library(conn, [x for x in problems if x.object_type == 'comment'], {'misnamed'})
+            assert [x.file_id for x in renames] == [5] and 'draft, b2001 is given to another file' in output.getvalue()
+        assert rename_files(renames) == []
+        assert sorted(os.listdir(self.folders['comment'])) == ['b2001.comment', 'draft.comment']
+
+    def test_failed_rename(self):
+        with self.engine.begin() as conn:
+            problems, _ = check_library(conn, 4)
+            renames = fix_library(conn, problems, {'misnamed'})
+        os.remove(renames[0].old_path)  # gone between the check and the rename
+        with redirect_stdout(StringIO()):
+            failed = rename_files(renames)
+        assert failed == renames
+        with self.engine.begin() as conn:
+            restore_names(conn, failed)
+            assert conn.execute(select(file_table.c.name).where(file_table.c.id == 2)).scalar() == 'wrong'
+
+    def tearDown(self):
+        self.patch.stop()
+        self.engine.dispose()
+        self.folder.cleanup()
@@ -0,0 +1,47 @@
+import os
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from bibdb.completion import get_delta_path, make_record, read_index, search, update_index, write_index
+
+IDS = ['li2015', 'li2015a', 'lin2003', 'smith1999', 'smith2001', 'zhang2010', 'ab2000']
+
+
+class TestCompletionIndex(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.index_path = path.join(self.folder.name, 'completion.idx')
+        write_index((make_record(x, x[:-4], x[-4:], 'title\tof ' + x) for x in IDS), self.index_path)
+
+    def test_search(self):
+        for prefix in ('', 'a', 'l', 'li', 'li2015', 'lin', 'm', 'smith2', 'zhang2010', 'zz', '0'):
+            found = [x[0] for x in search(prefix, index_path=self.index_path)]
+            assert found == sorted(x for x in IDS if x.startswith(prefix)), prefix
+        assert search('li', 1, self.index_path)[0] == ('li2015', 'li', '2015', 'title of li2015')
+
+    def test_update(self):
+        index = os.stat(self.index_path)
+        update_index({'lee2020': make_record('lee2020', 'lee', 2020, 'new')}, {'li2015', 'ab2000'}, self.index_path)
+        assert os.stat(self.index_path).st_ino == index.st_ino  # only the delta was written
+        assert [x[0] for x in search('l', index_path=self.index_path)] == ['lee2020', 'li2015a', 'lin2003']
+        assert [x[0] for x in search('l', 1, self.index_path)] == ['lee2020']
+        assert [x[0] for x in search('li', 1, self.index_path)] == ['li2015a']
+        assert sorted(read_index(self.index_path)) == sorted(set(IDS) - {'li2015', 'ab2000'} | {'lee2020'})
+        update_index(dict(), set(IDS) | {'lee2020'}, self.index_path)
+        assert search('', index_path=self.index_path) == []
+
+    def test_merge(self):
+        with patch('bibdb.completion.DELTA_SIZE', 64):
+            update_index({'lee2020': make_record('lee2020', 'lee', 2020, 'new')}, set(), self.index_path)
+            assert path.isfile(get_delta_path(self.index_path))
+            update_index({'lee2021': make_record('lee2021', 'lee', 2021, 'a long enough title to pass the limit')},
+                         {'zhang2010'}, self.index_path)
+        assert not path.isfile(get_delta_path(self.index_path))
+        assert os.listdir(self.folder.name) == ['completion.idx']
+        assert [x[0] for x in search('', index_path=self.index_path)] == sorted(set(IDS) - {'zhang2010'} |
+                                                                                {'lee2020', 'lee2021'})
+
+    def tearDown(self):
+        self.folder.cleanup()
@@ -0,0 +1,68 @@
+from contextlib import redirect_stderr, redirect_stdout
+from contextvars import copy_context
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Thread
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import insert
+
+from bibdb.daemon import forward, make_server, run_request
+from bibdb.database import Database, use_database
+from bibdb.entry.main import ItemBase, Person, authorship, item_table
+
+
+class TestDaemon(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.socket_path = path.join(self.folder.name, 'bibdb.sock')
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        ItemBase.metadata.create_all(self.database.engine)
+        with self.database.engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': 'smith2000', 'title': 'Some title', 'year': 2000,
+                                               'object_type': 'article'}])
+            conn.execute(insert(Person.__table__), [{'id': 1, 'last_name': 'smith', 'first_name': 'j'}])
+            conn.execute(insert(authorship), [{'item_id': 'smith2000', 'person_id': 1, 'order': 0}])
+
+    def forward(self, argv):
+        stdout, stderr = StringIO(), StringIO()
+        with patch('bibdb.daemon.get_socket_path', return_value=self.socket_path), \
+                redirect_stdout(stdout), redirect_stderr(stderr):
+            return forward(argv), stdout.getvalue(), stderr.getvalue()
+
+    def test_run_request(self):
+        with use_database(self.database):
+            response = run_request({'argv': ['s', '-a', 'smith'], 'cwd': self.folder.name})
+            assert response['status'] == 0 and 'Some title' in response['stdout']
+            assert run_request({'argv': ['s', '--no-such-option'], 'cwd': self.folder.name})['status'] == 2
+
+    def test_exit_status(self):
+        for code, status in ((None, 0), (0, 0), (3, 3), ('no such paper', 1)):
+            with patch('bibdb.actions.main.search_paper', side_effect=SystemExit(code)):
+                response = run_request({'argv': ['s', '-a', 'smith'], 'cwd': self.folder.name})
+            assert response['status'] == status
+        assert response['stderr'] == 'no such paper\n'
+
+    def test_forward(self):
+        assert self.forward(['s', '-a', 'smith'])[0] is None  # no server, run in-process
+        with use_database(self.database), redirect_stdout(StringIO()):
+            server = make_server(self.socket_path)
+            # the server thread answers from the test database
+            thread = Thread(target=copy_context().run, args=(server.serve_forever,))
+            thread.start()
+        try:
+            status, stdout, stderr = self.forward(['s', '-a', 'smith'])
+            assert status == 0 and 'Some title' in stdout and 'served in' in stderr
+            assert self.forward(['init'])[0] is None  # asks for input, never forwarded
+            assert self.forward(['o', 'smith2000'])[0] is None  # the viewer runs in the client
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+        assert self.forward(['s', '-a', 'smith'])[0] is None  # the socket is left, but nobody listens
+
+    def tearDown(self):
+        self.database.dispose()
+        self.folder.cleanup()
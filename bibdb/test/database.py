@@ -0,0 +1,36 @@
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sqlalchemy import select
+
+from bibdb.completion import get_index_path, read_index, rebuild_index
+from bibdb.database import Database, get_database, use_database
+from bibdb.entry.main import Article, ItemBase, Session, engine, item_table
+
+
+class TestDatabase(TestCase):
+    def test_context(self):
+        with TemporaryDirectory() as folder:
+            database = Database(folder=folder)
+            with use_database(database):
+                assert get_database() is database
+                ItemBase.metadata.create_all(engine)
+                session = Session()
+                session.add(Article({'ID': 'smith2000', 'title': 'Some title', 'year': 2000}))
+                session.commit()
+                session.close()
+                with engine.connect() as conn:
+                    assert conn.execute(select(item_table.c.id)).scalars().all() == ['smith2000']
+                assert get_index_path() == path.join(folder, 'completion.idx')
+                rebuild_index()
+                assert list(read_index()) == ['smith2000']
+                with use_database(Database()) as other:
+                    assert get_database() is other
+                assert get_database() is database
+            assert get_database() is not database
+            database.dispose()
+
+    def test_memory_has_no_folder(self):
+        with self.assertRaises(ValueError):
+            Database().sibling('snapshot.bin')
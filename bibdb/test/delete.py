@@ -0,0 +1,65 @@
+from argparse import Namespace
+from contextlib import redirect_stdout
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sqlalchemy import insert, select
+
+from bibdb.actions.main import delete_paper
+from bibdb.database import Database, use_database
+from bibdb.entry.main import ItemBase, Person, authorship, engine, item_table
+
+person_table = Person.__table__
+MANY = ['x{0:04d}'.format(idx) for idx in range(600)]  # more than are bound as parameters
+
+
+class TestDelete(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        self.context = use_database(self.database)
+        self.context.__enter__()
+        ItemBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000, 'object_type': 'article'}
+                                              for x in ['a2000', 'b2001', 'c2002'] + MANY])
+            conn.execute(insert(person_table), [{'id': idx, 'last_name': x, 'first_name': 'j'}
+                                                for idx, x in enumerate(['alone', 'shared', 'kept'])])
+            conn.execute(insert(authorship), [{'item_id': 'a2000', 'person_id': 0, 'order': 0},
+                                              {'item_id': 'a2000', 'person_id': 1, 'order': 1},
+                                              {'item_id': 'b2001', 'person_id': 1, 'order': 0},
+                                              {'item_id': 'c2002', 'person_id': 2, 'order': 0}])
+
+    def delete(self, paper_ids: str) -> None:
+        with redirect_stdout(StringIO()):
+            delete_paper(Namespace(paper_id=paper_ids))
+
+    def ids(self, table):
+        with engine.connect() as conn:
+            return sorted(conn.execute(select(table.c.id)).scalars())
+
+    def test_delete(self):
+        self.delete('a2000, b2001')
+        assert self.ids(item_table) == ['c2002'] + MANY
+        assert self.ids(person_table) == [2]  # alone and shared author nothing left
+
+    def test_missing(self):
+        with self.assertRaises(ValueError) as error:
+            self.delete('a2000,nobody1999,c2002')
+        assert 'nobody1999' in str(error.exception)
+        assert len(self.ids(item_table)) == 603 and self.ids(person_table) == [0, 1, 2]
+
+    def test_id_file(self):
+        id_path = path.join(self.folder.name, 'ids.txt')
+        with open(id_path, 'w') as fp:
+            fp.write('\n'.join(MANY + ['c2002']) + '\n')
+        self.delete(id_path)
+        assert self.ids(item_table) == ['a2000', 'b2001']
+        assert self.ids(person_table) == [0, 1]
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.database.dispose()
+        self.folder.cleanup()
@@ -0,0 +1,69 @@
+import hashlib
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert, inspect
+
+from bibdb.entry.digest import CHUNK_SIZE, Content, count_unindexed, hash_file, duplicate_groups, file_hash_table, \
+    find_digest, refresh
+from bibdb.entry.file_object import file_table
+
+
+class TestDigest(TestCase):
+    def test_hash_file(self):
+        with TemporaryDirectory() as folder:
+            file_path = path.join(folder, 'paper.pdf')
+            content = bytes(range(256)) * (CHUNK_SIZE // 100)
+            with open(file_path, 'wb') as fp:
+                fp.write(content)
+            result = hash_file(file_path)
+            assert result.digest == hashlib.sha256(content).hexdigest()
+            assert result.size == len(content)
+
+    def test_duplicate_groups(self):
+        engine = create_engine('sqlite://')
+        file_table.metadata.create_all(engine, tables=[file_table, file_hash_table])
+        with engine.begin() as conn:
+            conn.execute(insert(file_table), [{'id': idx, 'item_id': item_id, 'name': item_id, 'object_type': 'pdf'}
+                                              for idx, item_id in enumerate(['a2000', 'b2001', 'c2002', 'd2003'])])
+            conn.execute(insert(file_hash_table), [{'file_id': idx, 'size': 1, 'mtime': 0, 'digest': digest}
+                                                   for idx, digest in enumerate(['x', 'y', 'x', 'z'])])
+            assert list(duplicate_groups(conn)) == [('x', [('a2000', 'a2000'), ('c2002', 'c2002')])]
+        engine.dispose()
+
+    def test_find_digest(self):
+        engine = create_engine('sqlite://')
+        file_table.metadata.create_all(engine, tables=[file_table, file_hash_table])
+        with TemporaryDirectory() as folder:
+            for name, content in (('a2000', b'same'), ('b2001', b'same'), ('c2002', b'diff')):
+                with open(path.join(folder, name + '.pdf'), 'wb') as fp:
+                    fp.write(content)
+            with engine.begin() as conn, patch('bibdb.entry.digest.pdf_path',
+                                               lambda name: path.join(folder, name + '.pdf')):
+                conn.execute(insert(file_table), [{'id': idx, 'item_id': x, 'name': x, 'object_type': 'pdf'}
+                                                  for idx, x in enumerate(['a2000', 'b2001', 'c2002'])])
+                content = hash_file(path.join(folder, 'a2000.pdf'))
+                assert find_digest(conn, content) == [] and count_unindexed(conn) == 3  # the files are not read
+                assert refresh(conn).hashed == 3
+                assert find_digest(conn, content) == [('a2000', 'a2000'), ('b2001', 'b2001')]
+                assert count_unindexed(conn) == 0
+        engine.dispose()
+
+    def test_read_only(self):
+        """a lookup leaves the database free for other writers, also before the index table exists"""
+        with TemporaryDirectory() as folder:
+            url = 'sqlite:///' + path.join(folder, 'test.sqlite')
+            engine, other = create_engine(url), create_engine(url, connect_args={'timeout': 0})
+            file_table.metadata.create_all(engine, tables=[file_table])
+            with engine.begin() as conn:
+                conn.execute(insert(file_table), {'id': 0, 'item_id': 'a2000', 'name': 'a2000', 'object_type': 'pdf'})
+            with engine.begin() as conn:
+                assert find_digest(conn, Content(4, 0, 'x')) == [] and count_unindexed(conn) == 1
+                with other.begin() as other_conn:
+                    other_conn.execute(insert(file_table), {'id': 1, 'item_id': 'b2001', 'name': 'b2001',
+                                                            'object_type': 'pdf'})
+                assert not inspect(conn).has_table(file_hash_table.name)
+            engine.dispose()
+            other.dispose()
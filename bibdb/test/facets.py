@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert, text
+
+from bibdb.entry.facets import ensure_facets, keyword_counts, co_occurring, result_facets
+from bibdb.entry.keywords import add_keywords, remove_keywords, merge_keywords, keyword_table
+from bibdb.entry.main import item_table, keyword_assoc
+
+ITEMS = ['a2000', 'b2001', 'c2002']
+
+
+class TestFacets(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        item_table.metadata.create_all(self.engine, tables=[item_table, keyword_table, keyword_assoc])
+        self.conn = self.engine.connect()
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in ITEMS])
+        add_keywords(self.conn, ITEMS, ['x'])
+        add_keywords(self.conn, ITEMS[0: 2], ['y'])
+
+    def test_initial_count(self):
+        ensure_facets(self.conn)
+        assert keyword_counts(self.conn) == [('x', 3), ('y', 2)]
+        assert co_occurring(self.conn, 'x') == [('y', 2)]
+        assert result_facets(self.conn, ITEMS[1:]) == [('x', 2), ('y', 1)]
+
+    def test_incremental(self):
+        ensure_facets(self.conn)
+        add_keywords(self.conn, ITEMS[1:], ['z'])
+        remove_keywords(self.conn, ITEMS[0: 1], ['x'])
+        assert keyword_counts(self.conn) == [('x', 2), ('y', 2), ('z', 2)]
+        assert co_occurring(self.conn, 'x') == [('z', 2), ('y', 1)]
+        merge_keywords(self.conn, 'x', ['y', 'z'])
+        assert keyword_counts(self.conn) == [('x', 3)]
+        assert co_occurring(self.conn, 'x') == []
+        assert keyword_counts(self.conn, 1) == [('x', 3)]
+
+    def test_repeated_tag(self):
+        """a library from before the unique index, with a tag stored twice"""
+        self.conn.execute(text('DROP INDEX ux_association_pair'))
+        self.conn.execute(text("INSERT INTO association (item_id, keyword_id) SELECT item_id, keyword_id "
+                               "FROM association WHERE item_id = 'a2000'"))
+        ensure_facets(self.conn)
+        assert keyword_counts(self.conn) == [('x', 3), ('y', 2)]
+        assert co_occurring(self.conn, 'x') == [('y', 2)]
+        remove_keywords(self.conn, ITEMS[0: 1], ['x'])
+        assert keyword_counts(self.conn) == [('x', 2), ('y', 2)]
+
+    def test_many_items(self):
+        many = ['x{0}'.format(idx) for idx in range(40000)]
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in many])
+        add_keywords(self.conn, many, ['y'])
+        assert result_facets(self.conn, many + ITEMS[2:]) == [('y', 40000), ('x', 1)]
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
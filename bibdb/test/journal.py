@@ -1,29 +1,30 @@
-from os import path, remove
+from importlib.resources import files
+from os import path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 from zipfile import ZipFile
 
-from bibdb.data.journal import add_journals, search_journal, config
-from pkg_resources import resource_stream, Requirement
+from bibdb.data.journal import add_journals, search_journal
+from bibdb.database import Database, use_database
 
-JOURNAL_LIST_FILE = "bibdb/data/journals.zip"
+JOURNAL_LIST_FILE = "journals.zip"
 
 
 class TestJournalUtil(TestCase):
-    real_journal_db_path = ''
     fp = None
     zf = None
     file_stream = None
 
     def setUp(self):
-        self.real_journal_db_path = config['path']['journal_db']
-        config['path']['journal_db'] = path.expanduser('~/temp_journal.sqlite')
-        self.file_stream = resource_stream(Requirement.parse('bibdb'), JOURNAL_LIST_FILE)
+        self.file_stream = files('bibdb.data').joinpath(JOURNAL_LIST_FILE).open('rb')
         self.zf = ZipFile(self.file_stream)
         self.fp = self.zf.open(self.zf.namelist()[0])
+        self.folder = TemporaryDirectory()
+        self.database = use_database(Database(journal_path=path.join(self.folder.name, 'journal.sqlite')))
+        self.database.__enter__()
 
     def test_add_journals(self):
         add_journals(self.fp)
-        remove(config['path']['journal_db'])
 
     def test_search_journal(self):
         add_journals(self.fp)
@@ -33,10 +34,10 @@ class TestJournalUtil(TestCase):
             search_journal('shitshitshit')
         except ValueError:
             pass
-        remove(config['path']['journal_db'])
 
     def tearDown(self):
         self.fp.close()
         self.zf.close()
         self.file_stream.close()
-        config['path']['journal_db'] = self.real_journal_db_path
+        self.database.__exit__(None, None, None)
+        self.folder.cleanup()
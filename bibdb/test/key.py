@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import Session
+
+from bibdb.entry.key import KeyAllocator, suffix
+from bibdb.entry.main import item_table
+
+TAKEN = ['li2015', 'li2015a', 'li2015c', 'lin2015', 'li_2015']
+
+
+class TestKeyAllocator(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        item_table.metadata.create_all(self.engine, tables=[item_table])
+        with self.engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2015} for x in TAKEN])
+        self.session = Session(self.engine)
+
+    def test_suffix(self):
+        assert [suffix(x) for x in (0, 1, 2, 26, 27, 28, 52, 53, 702, 703)] == \
+            ['', 'a', 'b', 'z', 'aa', 'ab', 'az', 'ba', 'zz', 'aaa']
+
+    def test_allocate(self):
+        allocator = KeyAllocator(self.session)
+        assert [allocator.allocate('li2015') for _ in range(3)] == ['li2015b', 'li2015d', 'li2015e']
+        assert allocator.allocate('lin2015') == 'lin2015a'
+        assert allocator.allocate('li%2015') == 'li%2015'
+        assert allocator.allocate('smith1999') == 'smith1999'
+        assert allocator.allocate('smith1999') == 'smith1999a'
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
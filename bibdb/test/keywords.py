@@ -0,0 +1,65 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert, select, text
+from sqlalchemy.exc import IntegrityError
+
+from bibdb.entry.keywords import add_keywords, remove_keywords, merge_keywords, rename_keyword, drop_unused, \
+    ensure_unique_tags, keyword_table
+from bibdb.entry.main import item_table, keyword_assoc
+
+ITEMS = ['a2000', 'b2001', 'c2002']
+
+
+class TestKeywords(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        item_table.metadata.create_all(self.engine, tables=[item_table, keyword_table, keyword_assoc])
+        self.conn = self.engine.connect()
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in ITEMS])
+
+    def tags(self):
+        return sorted(self.conn.execute(select(keyword_assoc.c.item_id, keyword_table.c.text)
+                                        .join(keyword_table, keyword_assoc.c.keyword_id == keyword_table.c.id)))
+
+    def test_add_remove(self):
+        assert add_keywords(self.conn, ITEMS[0: 2], ['x', 'y']) == 4
+        assert add_keywords(self.conn, ITEMS, ['x']) == 1
+        assert remove_keywords(self.conn, ITEMS[1:], ['x', 'z']) == 2
+        assert self.tags() == [('a2000', 'x'), ('a2000', 'y'), ('b2001', 'y')]
+
+    def test_rename_merge(self):
+        add_keywords(self.conn, ITEMS[0: 1], ['x'])
+        add_keywords(self.conn, ITEMS[1:], ['y'])
+        add_keywords(self.conn, ITEMS[2:], ['z'])
+        assert rename_keyword(self.conn, 'x', 'w') == 1
+        assert merge_keywords(self.conn, 'z', ['w', 'y']) == 2
+        assert self.tags() == [('a2000', 'z'), ('b2001', 'z'), ('c2002', 'z')]
+        add_keywords(self.conn, [], ['unused'])
+        assert drop_unused(self.conn) == ['unused']
+        assert self.conn.execute(select(keyword_table.c.text)).scalars().all() == ['z']
+
+    def test_many_items(self):
+        """more ids than sqlite binds in one statement"""
+        many = ['x{0}'.format(idx) for idx in range(40000)]
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in many])
+        assert add_keywords(self.conn, many + ITEMS[0: 1], ['x']) == 40001
+        assert remove_keywords(self.conn, many, ['x']) == 40000
+        assert self.tags() == [('a2000', 'x')]
+
+    def test_unique(self):
+        """a library from before the unique index, with a repeated tag"""
+        self.conn.execute(text('DROP INDEX ux_association_pair'))
+        add_keywords(self.conn, ITEMS[0: 1], ['x'])
+        self.conn.execute(text('DROP INDEX ux_association_pair'))
+        self.conn.execute(text('INSERT INTO association (item_id, keyword_id) SELECT item_id, keyword_id '
+                               'FROM association'))
+        assert len(self.tags()) == 2
+        ensure_unique_tags(self.conn)
+        assert self.tags() == [('a2000', 'x')]
+        with self.assertRaises(IntegrityError):
+            self.conn.execute(text('INSERT INTO association (item_id, keyword_id) SELECT item_id, keyword_id '
+                                   'FROM association'))
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
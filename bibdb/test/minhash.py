@@ -0,0 +1,47 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert, select, update
+
+from bibdb.entry.main import ItemBase, Person, authorship, item_table
+from bibdb.entry.minhash import feature_source, item_signature_table, main_title, similar_groups
+
+person_table = Person.__table__
+ITEMS = [('smith2019', 'Deep learning of cortical dynamics from calcium imaging', 2019, 1),
+         ('smith2019a', 'Deep learning of cortical dynamics from calcium imaging: a preprint', 2019, 1),
+         ('smith2019b', 'Deep Learning of Cortical Dynamics from Calcium-Imaging', 2019, 1),
+         ('jones2019', 'Place cells in the hippocampus of freely moving rats', 2019, 2),
+         ('lee2015', 'Sparse coding of natural scenes in primary visual cortex', 2015, 3),
+         ('lee2016', 'Dense coding of odor identity in the olfactory bulb', 2016, 3)]
+
+
+class TestMinhash(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ItemBase.metadata.create_all(self.engine)
+        self.conn = self.engine.connect()
+        self.conn.execute(insert(person_table), [{'id': 1, 'last_name': 'Smith'}, {'id': 2, 'last_name': 'Jones'},
+                                                 {'id': 3, 'last_name': 'Lee'}])
+        self.conn.execute(insert(item_table), [{'id': x, 'title': y, 'year': z} for x, y, z, _ in ITEMS])
+        self.conn.execute(insert(authorship), [{'item_id': x, 'person_id': w, 'order': 0} for x, _, _, w in ITEMS])
+
+    def test_source(self):
+        assert main_title('Deep learning: a preprint') == 'Deep learning'
+        assert main_title('Review: cortex') == 'Review: cortex'
+        assert feature_source('Deep Learning — of Cortex', 'Müller', 2019) == 'deep learning|muller|2019'
+
+    def test_groups(self):
+        result, groups = similar_groups(self.conn)
+        assert (result.hashed, result.unchanged) == (6, 0)
+        assert [[x.item_id for x in group] for group in groups] == [['smith2019', 'smith2019a', 'smith2019b']]
+        assert groups[0][1].similarity == 1.0  # the subtitle is left out
+        self.conn.execute(update(item_table).where(item_table.c.id == 'lee2016')
+                          .values(title='Sparse coding of natural scenes in the primary visual cortex'))
+        result, groups = similar_groups(self.conn)
+        assert (result.hashed, result.unchanged) == (1, 5)
+        assert [[x.item_id for x in group] for group in groups] == [['lee2015', 'lee2016'],
+                                                                    ['smith2019', 'smith2019a', 'smith2019b']]
+        assert len(self.conn.execute(select(item_signature_table.c.item_id)).all()) == 6
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
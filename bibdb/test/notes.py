@@ -0,0 +1,80 @@
+import os
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import insert, select
+
+from bibdb.database import Database, use_database
+from bibdb.entry.file_object import file_table
+from bibdb.entry.main import ItemBase, engine
+from bibdb.entry.notes import RefreshResult, match_query, note_state_table, refresh, search_notes
+
+NAMES = ['a2000', 'b2001', 'c2002']
+
+
+class TestNotes(TestCase):
+    def test_match_query(self):
+        assert match_query(['hebbian', 'plast*']) == '"hebbian" "plast"*'
+        assert match_query(['say "no"', '*', 'AND']) == '"say ""no""" "AND"'
+        assert match_query([]) == ''
+
+
+class TestRefresh(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.comments = path.join(self.folder.name, 'comments')
+        os.mkdir(self.comments)
+        self.patch = patch('bibdb.entry.notes.config',
+                           {'files': {'comment': {'folder': self.comments, 'extension': '.md'}}})
+        self.patch.start()
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        self.context = use_database(self.database)
+        self.context.__enter__()
+        ItemBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(file_table), [{'id': idx, 'item_id': x, 'name': x, 'object_type': 'comment'}
+                                              for idx, x in enumerate(NAMES)])
+        for name in NAMES:
+            self.write(name, 'reading notes on synaptic plasticity, ' + name)
+
+    def write(self, name: str, body: str, mtime: float = 1e9) -> None:
+        file_path = path.join(self.comments, name + '.md')
+        with open(file_path, 'w') as fp:
+            fp.write(body)
+        os.utime(file_path, (mtime, mtime))
+
+    def search(self, *words: str, limit=100):
+        with engine.connect() as conn:
+            return sorted(x.item_id for x in search_notes(conn, words, limit=limit))
+
+    def test_refresh(self):
+        assert refresh(2, batch_size=2) == RefreshResult(3, 0, 0)
+        assert refresh(2) == RefreshResult(0, 3, 0)
+        self.write('b2001', 'rewritten about dendrites', 2e9)
+        os.remove(path.join(self.comments, 'c2002.md'))
+        assert refresh(2) == RefreshResult(1, 1, 1)
+        with engine.connect() as conn:
+            assert dict(conn.execute(select(note_state_table.c.file_id, note_state_table.c.mtime)).all()) == \
+                {0: 1e9, 1: 2e9}
+        assert self.search('plastic*') == ['a2000']
+        assert self.search('dendrites') == ['b2001']
+
+    def test_unchanged_stat(self):
+        """a file rewritten with the same size and mtime is taken as unchanged"""
+        refresh(2)
+        self.write('a2000', 'reading notes on synaptic plasticity, x2000')
+        assert refresh(2) == RefreshResult(0, 3, 0)
+        assert self.search('x2000') == []
+
+    def test_limit(self):
+        refresh(2)
+        assert len(self.search('synaptic', limit=1)) == 1
+        assert self.search('synaptic', limit=None) == NAMES
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.database.dispose()
+        self.patch.stop()
+        self.folder.cleanup()
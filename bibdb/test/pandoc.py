@@ -0,0 +1,10 @@
+from unittest import TestCase
+
+from bibdb.reader.pandoc import scan_citations
+
+
+class TestScanCitations(TestCase):
+    def test_scan(self):
+        text = 'As [@smith2000; @lee2015a, p. 3], @wang.2010. and -@smith2000 show. Mail a@b.com, @{odd key}.\n' \
+               '`@inline`\n```\n@fenced\n```\n'
+        assert scan_citations(text) == ['smith2000', 'lee2015a', 'wang.2010', 'odd key']
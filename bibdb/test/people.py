@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert, select
+
+from bibdb.entry.main import ItemBase, Person, authorship, item_table
+from bibdb.entry.people import find_groups, merge_persons, name_score
+
+person_table = Person.__table__
+PERSONS = [(1, 'Müller', 'John'), (2, 'Muller', 'J.'), (3, 'muller', 'john'), (4, 'Smith', 'John'),
+           (5, 'Smith', 'James'), (6, 'Smith', 'J'), (7, 'Lee', 'A'), (8, 'Lee', 'Anne'), (9, 'Ng', 'A')]
+AUTHORS = [('p1', 1, 0), ('p2', 2, 0), ('p2', 9, 1), ('p3', 3, 0), ('p4', 4, 0), ('p4', 5, 1), ('p5', 6, 0),
+           ('p6', 7, 0), ('p6', 8, 1)]
+
+
+class TestPeople(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ItemBase.metadata.create_all(self.engine)
+        self.conn = self.engine.connect()
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in
+                                               sorted({x[0] for x in AUTHORS})])
+        self.conn.execute(insert(person_table), [{'id': x, 'last_name': y, 'first_name': z} for x, y, z in PERSONS])
+        self.conn.execute(insert(authorship), [{'item_id': x, 'person_id': y, 'order': z} for x, y, z in AUTHORS])
+
+    def test_score(self):
+        assert name_score(['john', 'paul'], ['j', 'p']) == 0.9
+        assert name_score(['john', 'paul'], ['john']) == 0.8
+        assert name_score(['john'], ['james']) == 0.0
+
+    def test_groups_and_merge(self):
+        groups, ambiguous = find_groups(self.conn)
+        # J Smith could be John or James; the two Lees share a paper, so they are two people
+        assert [(x.target.id, [(v.id, v.score) for v in x.variants]) for x in groups] == [(1, [(3, 1.0), (2, 0.9)])]
+        assert [x.id for x in ambiguous] == [6]
+        self.conn.execute(insert(authorship).values(item_id='p1', person_id=3, order=1))  # now 1 and 3 share p1
+        assert merge_persons(self.conn, [(2, 1), (3, 1)]) == (2, 1)
+        assert self.conn.execute(select(authorship.c.item_id, authorship.c.person_id, authorship.c.order)
+                                 .where(authorship.c.item_id.in_(['p1', 'p2', 'p3']))
+                                 .order_by(authorship.c.item_id, authorship.c.order)).all() == \
+            [('p1', 1, 0), ('p1', 3, 1), ('p2', 1, 0), ('p2', 9, 1), ('p3', 1, 0)]
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
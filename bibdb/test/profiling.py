@@ -0,0 +1,53 @@
+import json
+import os
+from contextlib import redirect_stderr
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, text
+
+from bibdb.main import make_parser
+from bibdb.profiling import ENV, env_target, phase, profiled, requested
+
+
+class TestProfile(TestCase):
+    def test_off(self):
+        assert phase('parse') is phase('format')
+
+    def test_env(self):
+        for value, target in (('0', None), ('false', None), ('', None), ('1', '-'), ('True', '-'),
+                              ('out.json', 'out.json')):
+            with patch.dict(os.environ, {ENV: value}):
+                assert env_target() == target
+                assert requested(['s']) == (target is not None)
+        with patch.dict(os.environ, {ENV: '0'}):
+            assert requested(['--profile-output=out.json', 's'])
+
+    def test_abbreviation(self):
+        """an abbreviated option would be missed by requested"""
+        parser = make_parser()
+        assert parser.parse_args(['--profile', 's', '-a', 'smith']).profile
+        with redirect_stderr(StringIO()), self.assertRaises(SystemExit):
+            parser.parse_args(['--prof', 's', '-a', 'smith'])
+
+    def test_report(self):
+        engine = create_engine('sqlite://')
+        with TemporaryDirectory() as folder:
+            report_path = path.join(folder, 'profile.json')
+            with profiled(report_path, ['s', '-a', 'smith']):
+                with phase('resolve'), engine.connect() as conn:
+                    for _ in range(3):
+                        conn.execute(text('SELECT 1')).scalar()
+                with phase('format'):
+                    buffer = [str(x) for x in range(10000)]
+            with open(report_path, 'r', encoding='utf-8') as fp:
+                report = json.load(fp)
+        engine.dispose()
+        assert report['argv'] == ['s', '-a', 'smith']
+        assert report['sql']['count'] == 3 and report['statements'][0]['sql'] == 'SELECT 1'
+        assert {name: x['count'] for name, x in report['phases'].items()} == {'resolve': 1, 'format': 1}
+        assert report['memory_peak'] > 0 and len(buffer) == 10000
+        assert phase('parse') is phase('format')  # off again
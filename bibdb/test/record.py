@@ -0,0 +1,26 @@
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert
+
+from bibdb.entry.main import ItemBase, item_table
+from bibdb.entry.record import query_ids
+
+ITEMS = ['id{0:04d}'.format(x) for x in range(1000)]
+
+
+class TestQueryIds(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        ItemBase.metadata.create_all(self.engine)
+        self.conn = self.engine.connect()
+        self.conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000} for x in ITEMS])
+
+    def test_order_and_missing(self):
+        for requested in (['id0005', 'nope', 'id0001', 'id0005'], ITEMS[::-1] + ['gone', 'nope']):
+            items, missing = query_ids(self.conn, requested)
+            assert [x.id for x in items] == [x for x in dict.fromkeys(requested) if x in ITEMS]
+            assert missing == [x for x in requested if x not in ITEMS][0: 2]
+
+    def tearDown(self):
+        self.conn.close()
+        self.engine.dispose()
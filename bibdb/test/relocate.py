@@ -0,0 +1,124 @@
+import os
+from argparse import Namespace
+from contextlib import redirect_stdout
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+
+from sqlalchemy import insert, select, update
+
+from bibdb.actions.relocate import Move, get_journal_path, plan_moves, read_journal, relocate, split_conflicts, \
+    write_journal
+from bibdb.database import Database, use_database
+from bibdb.entry.file_object import file_table
+from bibdb.entry.main import ItemBase, engine, item_table
+
+NAMES = ['a2000', 'b2001', 'c2002']
+
+
+class TestRelocate(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.old, self.new = path.join(self.folder.name, 'old'), path.join(self.folder.name, 'new')
+        os.mkdir(self.old)
+        for name in NAMES:
+            with open(path.join(self.old, name + '.pdf'), 'w') as fp:
+                fp.write(name)
+        self.config = {'files': {'pdf': {'folder': self.old, 'extension': '.pdf'}}}
+        self.patches = [patch('bibdb.actions.relocate.config', self.config),
+                        patch('bibdb.actions.relocate.type_folder', lambda x: (self.config['files'][x]['folder'],
+                                                                               '.pdf')),
+                        patch('bibdb.actions.relocate._write_folder', self.write_folder)]
+        for x in self.patches:
+            x.start()
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        self.context = use_database(self.database)
+        self.context.__enter__()
+        ItemBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': 2000, 'object_type': 'article'}
+                                              for x in NAMES])
+            conn.execute(insert(file_table), [{'id': idx, 'item_id': x, 'name': x, 'object_type': 'pdf'}
+                                              for idx, x in enumerate(NAMES)])
+
+    def write_folder(self, object_type: str, folder: str) -> None:
+        self.config['files'][object_type]['folder'] = folder
+
+    def run_relocate(self, **kwargs) -> str:
+        args = Namespace(**{'folder': None, 'type': 'pdf', 'rename': False, 'dry_run': False, 'resume': False,
+                            'rollback': False, 'jobs': 2, **kwargs})
+        with redirect_stdout(StringIO()) as output:
+            relocate(args)
+        return output.getvalue()
+
+    def files(self, folder: str):
+        return sorted(os.listdir(folder)) if path.isdir(folder) else []
+
+    def plan(self, folder: str):
+        with engine.connect() as conn:
+            return plan_moves(conn, 'pdf', folder, False)
+
+    def test_move(self):
+        self.run_relocate(folder=self.new)
+        assert self.files(self.new) == [x + '.pdf' for x in NAMES] and self.files(self.old) == []
+        assert self.config['files']['pdf']['folder'] == self.new
+        assert not path.exists(get_journal_path())
+
+    def test_conflict(self):
+        os.mkdir(self.new)
+        with open(path.join(self.new, 'b2001.pdf'), 'w') as fp:
+            fp.write('another file')
+        assert [x[1] for x in split_conflicts(self.plan(self.new))[1]] == ['target exists']
+        output = self.run_relocate(folder=self.new)
+        assert 'can not move, target exists' in output and 'nothing done' in output
+        assert self.files(self.old) == [x + '.pdf' for x in NAMES] and self.files(self.new) == ['b2001.pdf']
+        assert self.config['files']['pdf']['folder'] == self.old
+
+    def interrupt(self, moved: int) -> None:
+        """a run stopped after moving the first files"""
+        moves = self.plan(self.new)
+        write_journal(get_journal_path(), {'object_type': 'pdf', 'folder': self.new, 'old_folder': self.old}, moves)
+        os.mkdir(self.new)
+        for move in moves[0: moved]:
+            os.rename(move.old_path, move.new_path)
+
+    def test_resume(self):
+        self.interrupt(1)
+        self.run_relocate(resume=True)
+        assert self.files(self.new) == [x + '.pdf' for x in NAMES] and self.files(self.old) == []
+        assert self.config['files']['pdf']['folder'] == self.new
+        assert not path.exists(get_journal_path())
+
+    def test_rollback(self):
+        self.interrupt(2)
+        self.run_relocate(rollback=True)
+        assert self.files(self.old) == [x + '.pdf' for x in NAMES] and self.files(self.new) == []
+        assert not path.exists(get_journal_path())
+
+    def test_rollback_committed(self):
+        """stopped after committing the new names, before marking the journal"""
+        moves = [Move(idx, path.join(self.old, x + '.pdf'), path.join(self.old, 'x' + x + '.pdf'), 'x' + x)
+                 for idx, x in enumerate(NAMES)]
+        write_journal(get_journal_path(), {'object_type': 'pdf', 'folder': None}, moves)
+        for move in moves:
+            os.rename(move.old_path, move.new_path)
+        with engine.begin() as conn:
+            for move in moves:
+                conn.execute(update(file_table).where(file_table.c.id == move.file_id).values(name=move.new_name))
+        assert not read_journal(get_journal_path())[2]
+        assert 'finish with --resume' in self.run_relocate(rollback=True)
+        assert self.files(self.old) == ['x' + x + '.pdf' for x in NAMES]
+        self.run_relocate(resume=True)
+        assert not path.exists(get_journal_path())
+        with engine.connect() as conn:
+            assert conn.execute(select(file_table.c.name).order_by(file_table.c.id)).scalars().all() == \
+                ['x' + x for x in NAMES]
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.database.dispose()
+        for x in self.patches:
+            x.stop()
+        self.folder.cleanup()
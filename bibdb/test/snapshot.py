@@ -0,0 +1,65 @@
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sqlalchemy import insert
+
+from bibdb.actions.main import find_items
+from bibdb.database import Database, use_database
+from bibdb.entry.keywords import add_keywords
+from bibdb.entry.main import ItemBase, Person, authorship, engine, item_table
+from bibdb.entry.snapshot import Snapshot, build_snapshot, get_snapshot_path, read_counter, refresh_snapshot
+
+ITEMS = [('smith2000', 'Sparse coding of natural images', 2000), ('lee2001', 'Dynamic neural coding', 2001),
+         ('smith2003', 'Neural networks in motion', 2003)]
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        self.context = use_database(self.database)
+        self.context.__enter__()
+        ItemBase.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(item_table), [{'id': x, 'title': y, 'year': z, 'object_type': 'article'}
+                                              for x, y, z in ITEMS])
+            conn.execute(insert(Person.__table__), [{'id': 1, 'last_name': 'smith', 'first_name': 'j'},
+                                                    {'id': 2, 'last_name': 'lee', 'first_name': 'k'}])
+            conn.execute(insert(authorship), [{'item_id': 'smith2000', 'person_id': 1, 'order': 0},
+                                              {'item_id': 'lee2001', 'person_id': 2, 'order': 0},
+                                              {'item_id': 'lee2001', 'person_id': 1, 'order': 1},
+                                              {'item_id': 'smith2003', 'person_id': 1, 'order': 0}])
+            add_keywords(conn, ['smith2000', 'smith2003'], ['vision'])
+        assert not refresh_snapshot()  # no snapshot yet, nothing to rebuild
+        build_snapshot()
+
+    def test_search(self):
+        with Snapshot.load() as snapshot:
+            assert snapshot.search('smith') == [('smith2000', 0), ('lee2001', 1), ('smith2003', 0)]
+            assert snapshot.search('smith', years=(2001, None)) == [('lee2001', 1), ('smith2003', 0)]
+            assert snapshot.search(keywords=['vision']) == [('smith2000', None), ('smith2003', None)]
+            assert snapshot.search(keywords=['vision', 'none']) == []
+            assert snapshot.search(title=['neural', 'Coding']) == [('lee2001', None)]
+            assert snapshot.search(title=['neural'], keywords=['vision']) == [('smith2003', None)]
+        with engine.connect() as conn:
+            assert [(x.id, y) for x, y in find_items(conn, 'smith', {'vision'})] == [('smith2000', 0),
+                                                                                        ('smith2003', 0)]
+
+    def test_stale(self):
+        built = read_counter(get_snapshot_path())
+        with engine.begin() as conn:
+            conn.execute(item_table.delete().where(item_table.c.id == 'smith2003'))
+        assert Snapshot.load() is None
+        with engine.connect() as conn:  # from sql while stale
+            assert [x.id for x, _ in find_items(conn, 'smith')] == ['smith2000', 'lee2001']
+        assert read_counter(get_snapshot_path()) == built  # not rebuilt by the commit
+        assert refresh_snapshot()  # as bibdb snapshot does
+        assert read_counter(get_snapshot_path()) != built
+        with Snapshot.load() as snapshot:
+            assert snapshot.search('smith') == [('smith2000', 0), ('lee2001', 1)]
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.database.dispose()
+        self.folder.cleanup()
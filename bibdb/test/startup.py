@@ -0,0 +1,17 @@
+import subprocess
+import sys
+from unittest import TestCase
+
+HELP = ("import sys\nsys.argv = ['bibdb', '--help']\nfrom bibdb.main import parse_args\n"
+        "try:\n    parse_args()\nexcept SystemExit:\n    pass\n"
+        "print(' '.join(sys.modules), file=sys.stderr)")
+
+
+class TestLazyImport(TestCase):
+    def test_help_is_light(self):
+        modules = subprocess.run([sys.executable, '-c', HELP], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                                 universal_newlines=True, check=True).stderr.split()
+        loaded = {x.split('.')[0] for x in modules}
+        for heavy in ('sqlalchemy', 'bibtexparser', 'colorama', 'pkg_resources'):
+            assert heavy not in loaded, heavy + ' is imported for --help'
+        assert 'bibdb.config' not in modules
@@ -0,0 +1,55 @@
+from os import path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from sqlalchemy import create_engine, insert
+
+from bibdb.entry.keywords import add_keywords
+from bibdb.entry.main import ItemBase, Journal, Person, authorship, item_table
+from bibdb.entry.stats import cached_stats, library_stats
+
+ITEMS = [('a2000', 2000, 'article', 1), ('b2000', 2000, 'article', 2), ('c2001', 2001, 'book', None)]
+
+
+class TestStats(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.database_path = path.join(self.folder.name, 'test.sqlite')
+        self.engine = create_engine('sqlite:///' + self.database_path)
+        ItemBase.metadata.create_all(self.engine)
+        with self.engine.begin() as conn:
+            conn.execute(insert(Journal.__table__), [{'id': 1, 'name': 'Nature'}, {'id': 2, 'name': 'Science'}])
+            conn.execute(insert(item_table), [{'id': x, 'title': x, 'year': y, 'object_type': z, 'journal_id': w}
+                                              for x, y, z, w in ITEMS])
+            conn.execute(insert(Person.__table__), [{'id': 1, 'last_name': 'Smith', 'first_name': 'J'},
+                                                    {'id': 2, 'last_name': 'Lee', 'first_name': None}])
+            conn.execute(insert(authorship), [{'item_id': x, 'person_id': y, 'order': 0} for x, y in
+                                              [('a2000', 1), ('b2000', 1), ('c2001', 2)]])
+            add_keywords(conn, ['a2000', 'c2001'], ['x'])
+
+    def test_stats(self):
+        with self.engine.connect() as conn:
+            stats = library_stats(conn, 1)
+        assert stats['total'] == [('papers', 3), ('people', 2), ('keywords', 1), ('journals', 2)]
+        assert stats['year'] == [('2000', 2), ('2001', 1)]
+        assert stats['type'] == [('article', 2), ('book', 1)]
+        assert stats['journal'] == [('Nature', 1)]
+        assert stats['keyword'] == [('x', 2)]
+        assert stats['author'] == [('Smith, J', 2)]
+
+    def test_cache(self):
+        stats_path = path.join(self.folder.name, 'stats.json')
+        with self.engine.connect() as conn:
+            first, cached = cached_stats(conn, 5, stats_path, self.database_path)
+            assert not cached
+            assert cached_stats(conn, 5, stats_path, self.database_path) == (first, True)
+            assert not cached_stats(conn, 1, stats_path, self.database_path)[1]
+        with self.engine.begin() as conn:
+            conn.execute(insert(item_table).values(id='d2002', title='d2002', year=2002))
+        with self.engine.connect() as conn:
+            stats, cached = cached_stats(conn, 1, stats_path, self.database_path)
+        assert not cached and stats['total'][0] == ('papers', 4)
+
+    def tearDown(self):
+        self.engine.dispose()
+        self.folder.cleanup()
@@ -0,0 +1,143 @@
+import os
+import sys
+from contextlib import redirect_stdout
+from io import StringIO
+from os import path
+from tempfile import TemporaryDirectory
+from threading import Timer
+from unittest import TestCase, skipUnless
+
+from sqlalchemy import select
+
+from bibdb.actions.store_paper import StorePolicy
+from bibdb.actions.watch import PAIR_WINDOW, InotifyWatcher, PendingQueue, PollingWatcher, store_batch
+from bibdb.database import Database, use_database
+from bibdb.entry.main import Article, Authorship, ItemBase, Person, Session, engine, item_table
+
+BIBS = {'stored': '@article{x, title={A new paper}, author={Smith, John}, year={2001}}',
+        'skipped': '@article{x, title={An old paper}, author={Doe, Jane}, year={2002}}',
+        'review': '@article{x, title={Another paper}, author={Lee, Kim and Doe, Joe}, year={2003}}',
+        'unreadable': 'not a citation'}
+
+
+class TestPendingQueue(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.queue = PendingQueue(path.join(self.folder.name, 'pending.json'))
+
+    def test_pair_bib(self):
+        loose_pdfs = {'early.pdf': 1000.0, 'close.pdf': 1990.0, 'late.pdf': 2000.0 + PAIR_WINDOW + 1}
+        entry = self.queue.add_bib('a.bib', 'A', 2000.0, loose_pdfs)
+        assert entry['pdf'] == 'close.pdf' and 'close.pdf' not in loose_pdfs
+        entry = self.queue.add_bib('b.bib', 'B', 2000.0, loose_pdfs)  # the rest is outside the window
+        assert entry['pdf'] is None and set(loose_pdfs) == {'early.pdf', 'late.pdf'}
+
+    def test_pair_pdf(self):
+        self.queue.add_bib('a.bib', 'A', 1000.0, dict())
+        self.queue.add_bib('b.bib', 'B', 1100.0, dict())
+        assert self.queue.add_pdf('b.pdf', 1200.0)['bib'] == 'b.bib'  # the latest unpaired one
+        assert self.queue.add_pdf('a.pdf', 1200.0)['bib'] == 'a.bib'
+        assert self.queue.add_pdf('c.pdf', 1300.0) is None  # every citation file has its pdf
+        self.queue.add_bib('d.bib', 'D', 2000.0, dict())
+        assert self.queue.add_pdf('d.pdf', 2000.0 + PAIR_WINDOW + 1) is None
+
+    def test_rewritten_bib(self):
+        self.queue.add_bib('a.bib', 'A', 1000.0, {'a.pdf': 1000.0})
+        entry = self.queue.add_bib('a.bib', 'A revised', 1000.0 + PAIR_WINDOW * 2, dict())
+        assert entry['pdf'] == 'a.pdf' and len(self.queue.entries) == 1
+        self.queue.save()
+        assert PendingQueue(self.queue.pending_path).entries == [entry]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+
+class TestStoreBatch(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+        self.database = Database(path.join(self.folder.name, 'test.sqlite'), folder=self.folder.name)
+        self.context = use_database(self.database)
+        self.context.__enter__()
+        ItemBase.metadata.create_all(engine)
+        session = Session()
+        old = Article({'ID': 'doe2002', 'title': 'An old paper', 'year': 2002})
+        old.authorship.append(Authorship(order=0, person=Person(last_name='doe', first_name='jane')))
+        session.add(old)
+        session.commit()
+        session.close()
+
+    def test_batch(self):
+        queue = PendingQueue()
+        for idx, (name, text) in enumerate(BIBS.items()):
+            bib_path = path.join(self.folder.name, name + '.bib')
+            with open(bib_path, 'w') as fp:
+                fp.write(text)
+            queue.add_bib(bib_path, name, float(idx), dict())
+        policy = StorePolicy(conflict='skip', author='review', journal='create')
+        with redirect_stdout(StringIO()) as output:
+            store_batch(queue, policy, {'batch'})
+        assert '1 stored, 1 skipped, 2 left for review' in output.getvalue()
+        assert [path.basename(x['bib']) for x in PendingQueue().entries] == ['review.bib', 'unreadable.bib']
+        with engine.connect() as conn:
+            assert conn.execute(select(item_table.c.id).order_by(item_table.c.id)).scalars().all() == \
+                ['doe2002', 'smith2001']
+            # the entry left for review added neither its item nor its new person lee
+            assert conn.execute(select(Person.__table__.c.last_name).order_by(Person.__table__.c.last_name)) \
+                .scalars().all() == ['doe', 'smith']
+
+    def tearDown(self):
+        self.context.__exit__(None, None, None)
+        self.database.dispose()
+        self.folder.cleanup()
+
+
+class TestWatcher(TestCase):
+    def setUp(self):
+        self.folder = TemporaryDirectory()
+
+    def write(self, name: str, content: str = 'x') -> str:
+        file_path = path.join(self.folder.name, name)
+        with open(file_path, 'w') as fp:
+            fp.write(content)
+        return file_path
+
+    def test_polling(self):
+        old_path = self.write('old.bib')
+        self.write('ignored.txt')
+        watcher = iter(PollingWatcher([self.folder.name], ['.bib', '.pdf'], 0.2))
+        timer = Timer(0.05, self.write, ('new.pdf',))
+        timer.start()
+        assert next(watcher) == path.join(self.folder.name, 'new.pdf')
+        timer.join()
+        Timer(0.05, self.write, ('old.bib', 'changed')).start()
+        assert next(watcher) == old_path
+
+    @skipUnless(sys.platform.startswith('linux'), 'inotify is linux only')
+    def test_inotify(self):
+        watcher = InotifyWatcher([self.folder.name])
+        try:
+            events = iter(watcher)
+            bib_path = self.write('a.bib')
+            assert next(events) == bib_path
+            os.rename(self.write('.partial'), path.join(self.folder.name, 'b.pdf'))
+            assert next(events) == path.join(self.folder.name, '.partial')  # closed after writing
+            assert next(events) == path.join(self.folder.name, 'b.pdf')  # then moved in
+        finally:
+            os.close(watcher.fd)
+
+    @skipUnless(sys.platform.startswith('linux'), 'inotify is linux only')
+    def test_inotify_file(self):
+        """a file written in place and never closed, as sqlite writes its database"""
+        file_path = self.write('test.sqlite')
+        watcher = InotifyWatcher([], [file_path])
+        try:
+            events = iter(watcher)
+            with open(file_path, 'r+') as fp:
+                fp.write('y')
+                fp.flush()
+                assert next(events) == file_path
+        finally:
+            os.close(watcher.fd)
+
+    def tearDown(self):
+        self.folder.cleanup()